@@ -0,0 +1,352 @@
+"""Many positions at once as NumPy arrays, for self-play and data work.
+
+    batch = Batch.from_fens(fens)           or from_boards, from_chessboards, Batch(array)
+    batch.attacks(WHITE_COLOUR)             N bitboards of the squares White attacks
+    batch.in_check()                        N bools, for the side to move
+    batch.legal_move_counts()               N ints
+    batch.to_chessboard(index)
+
+A batch holds N x 12 uint64 bitboards, column colour * 6 + rank, along with
+each position's side to move, castling rights and en passant square. It can
+also be made from N x 64 piece codes (0 empty, colour * 6 + rank + 1 otherwise),
+and squares() gives them back.
+
+Everything is done a column at a time over the whole batch with shifts and
+masks. Positions are first turned round so the side to move plays up the board,
+then moves are counted one direction at a time. Each piece has a different
+target when every piece is shifted the same way (a sliding fill stops at the
+first piece in its path), so counting the targets in each direction counts
+moves. Checks and pins become masks of the squares a move may go to.
+
+Measure throughput from the command line, e.g.
+
+    python batch.py --positions 10000
+    python batch.py --positions 2000 --check    compare every result with BitBoard
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from bitboard import *
+from board import ChessBoard
+from piece import PieceManager
+
+_BITS = np.uint64(1) << np.arange(64, dtype = np.uint64)
+_FILE_A = np.uint64(0x0101010101010101)
+_FILE_B = _FILE_A << np.uint64(1)
+_FILE_G = _FILE_A << np.uint64(6)
+_FILE_H = _FILE_A << np.uint64(7)
+_RANK_3 = np.uint64(0xFF << 16)
+_RANK_8 = np.uint64(RANK_8)
+_FULL = np.uint64(FULL_BOARD)
+_ZERO = np.uint64(0)
+# Squares a shift of dx files can land on without wrapping round the board
+_WRAP = {0 : _FULL, 1 : ~_FILE_A, 2 : ~(_FILE_A | _FILE_B), -1 : ~_FILE_H, -2 : ~(_FILE_G | _FILE_H)}
+_SHIFTS = {step : np.uint64(abs(step)) for step in range(-63, 64)}
+
+# Castling for the side to move once the board is turned round:
+# (right, squares that must be empty, squares that mustn't be attacked)
+_CASTLING = ((WHITE_KING_SIDE, np.uint64(0x60), np.uint64(0x60)),
+             (WHITE_QUEEN_SIDE, np.uint64(0x0E), np.uint64(0x0C)))
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(bitboards):
+        return np.bitwise_count(bitboards).astype(np.int32)
+else:
+    _BYTE_COUNTS = np.array([bin(byte).count("1") for byte in range(256)], dtype = np.int32)
+
+    def _popcount(bitboards):
+        return _BYTE_COUNTS[bitboards.view(np.uint8)].reshape(*bitboards.shape, 8).sum(axis = -1)
+
+
+def _raw_shift(bitboards, step : int):
+    return bitboards << _SHIFTS[step] if step > 0 else bitboards >> _SHIFTS[step]
+
+def _shift(bitboards, dx : int, dy : int):
+    "Every bit moved dx files and dy ranks, those that go off the board dropped"
+    return _raw_shift(bitboards, dy * 8 + dx) & _WRAP[dx]
+
+def _step(bitboards, vectors):
+    "Union of one shift along each vector, for the king and knight"
+    attacks = np.zeros_like(bitboards)
+    for dx, dy in vectors:
+        attacks |= _shift(bitboards, dx, dy)
+    return attacks
+
+def _slide(sliders, empty, dx : int, dy : int):
+    "Squares sliders attack along (dx, dy), up to and including the first piece (Kogge-Stone fill)"
+    step = dy * 8 + dx
+    wrap = _WRAP[dx]
+    empty = empty & wrap
+    sliders = sliders | (empty & _raw_shift(sliders, step))
+    empty = empty & _raw_shift(empty, step)
+    sliders = sliders | (empty & _raw_shift(sliders, 2 * step))
+    empty = empty & _raw_shift(empty, 2 * step)
+    sliders = sliders | (empty & _raw_shift(sliders, 4 * step))
+    return _raw_shift(sliders, step) & wrap
+
+def _pawn_attacks(pawns, colour : int):
+    dy = 1 if colour == WHITE_COLOUR else -1
+    return _shift(pawns, -1, dy) | _shift(pawns, 1, dy)
+
+def _attacks(pieces, colour : int, occupied):
+    "Squares attacked by pieces, a 6 x N array of one colour's bitboards"
+    empty = ~occupied
+    attacks = _pawn_attacks(pieces[PAWN], colour) | _step(pieces[KNIGHT], KNIGHT_VECTORS) | _step(pieces[KING], KING_VECTORS)
+    for vectors, sliders in ((ROOK_VECTORS, pieces[ROOK] | pieces[QUEEN]), (BISHOP_VECTORS, pieces[BISHOP] | pieces[QUEEN])):
+        for dx, dy in vectors:
+            attacks |= _slide(sliders, empty, dx, dy)
+    return attacks
+
+def _attackers(king, occupied, them, pawns):
+    "Pieces of them attacking king, which plays up the board; pawns stands in for them[PAWN]"
+    empty = ~occupied
+    attackers = (_step(king, KNIGHT_VECTORS) & them[KNIGHT]) | (_pawn_attacks(king, WHITE_COLOUR) & pawns)
+    for vectors, sliders in ((ROOK_VECTORS, them[ROOK] | them[QUEEN]), (BISHOP_VECTORS, them[BISHOP] | them[QUEEN])):
+        for dx, dy in vectors:
+            attackers |= _slide(king, empty, dx, dy) & sliders
+    return attackers
+
+def _pawn_move_count(pawns, empty, enemies, targets):
+    "Moves of pawns playing up the board that end on targets, each promotion counted four times"
+    push = _shift(pawns, 0, 1) & empty
+    double = _shift(push & _RANK_3, 0, 1) & empty & targets
+    push &= targets
+    left = _shift(pawns, -1, 1) & enemies & targets
+    right = _shift(pawns, 1, 1) & enemies & targets
+    count = _popcount(double)
+    for moves in (push, left, right):
+        count += _popcount(moves) + 3 * _popcount(moves & _RANK_8)
+    return count
+
+def squares_to_bitboards(squares):
+    "N x 64 piece codes to N x 12 bitboards"
+    squares = np.asarray(squares)
+    pieces = np.empty((len(squares), 12), dtype = np.uint64)
+    for plane in range(12):
+        pieces[:, plane] = np.bitwise_or.reduce(np.where(squares == plane + 1, _BITS, _ZERO), axis = 1)
+    return pieces
+
+def bitboards_to_squares(pieces):
+    "N x 12 bitboards to N x 64 piece codes"
+    squares = np.zeros((len(pieces), 64), dtype = np.int8)
+    for plane in range(12):
+        squares[square_planes(pieces[:, plane])] = plane + 1
+    return squares
+
+def square_planes(bitboards):
+    "N bitboards to an N x 64 array of bools, one per square"
+    return (np.asarray(bitboards, dtype = np.uint64)[:, None] & _BITS) != 0
+
+
+class Batch:
+    "N positions as arrays, see the module docstring"
+
+    def __init__(self, array, turn = None, castling = None, en_passant = None):
+        """array is N x 12 bitboards or N x 64 piece codes. turn, castling and en_passant
+        are N long, by default White to move without castling rights or an en passant square"""
+        array = np.asarray(array)
+        if array.ndim != 2 or array.shape[1] not in (12, 64):
+            raise ValueError(f"Expected N x 12 bitboards or N x 64 piece codes, not {array.shape}")
+        self.pieces = squares_to_bitboards(array) if array.shape[1] == 64 else array.astype(np.uint64)
+        count = len(self.pieces)
+        self.turn = np.zeros(count, dtype = np.uint8) if turn is None else np.asarray(turn, dtype = np.uint8)
+        self.castling = np.zeros(count, dtype = np.uint8) if castling is None else np.asarray(castling, dtype = np.uint8)
+        self.en_passant = np.full(count, -1, dtype = np.int8) if en_passant is None else np.asarray(en_passant, dtype = np.int8)
+
+    @classmethod
+    def from_boards(cls, boards):
+        "From bitboard core positions"
+        return cls(np.array([board.pieces[WHITE_COLOUR] + board.pieces[BLACK_COLOUR] for board in boards], dtype = np.uint64).reshape(-1, 12),
+                   [board.turn for board in boards], [board.castling for board in boards], [board.en_passant for board in boards])
+
+    @classmethod
+    def from_fens(cls, fens):
+        return cls.from_boards([BitBoard.from_fen(fen) for fen in fens])
+
+    @classmethod
+    def from_chessboards(cls, chessboards):
+        return cls.from_boards([chessboard.bitboard for chessboard in chessboards])
+
+    def __len__(self) -> int:
+        return len(self.pieces)
+
+    def squares(self):
+        return bitboards_to_squares(self.pieces)
+
+    def board(self, index : int) -> BitBoard:
+        "Position index as a bitboard core position, with its move clocks reset"
+        board = BitBoard()
+        for plane, bitboard in enumerate(self.pieces[index]):
+            for square in iter_squares(int(bitboard)):
+                board.place(plane // 6, plane % 6, square)
+        board.set_state(int(self.turn[index]), int(self.castling[index]), int(self.en_passant[index]))
+        return board
+
+    def fen(self, index : int) -> str:
+        return self.board(index).fen()
+
+    def to_chessboard(self, index : int, chessboard : ChessBoard = None) -> ChessBoard:
+        "Sets up position index on chessboard, or on a new board with its own PieceManager"
+        if chessboard is None:
+            chessboard = ChessBoard(8, PieceManager())
+        chessboard.load_fen(self.fen(index))
+        return chessboard
+
+    def attacks(self, colour : int):
+        "N bitboards of every square attacked by colour"
+        pieces = np.ascontiguousarray(self.pieces[:, colour * 6:colour * 6 + 6].T)
+        return _attacks(pieces, colour, np.bitwise_or.reduce(self.pieces, axis = 1))
+
+    def _relative(self):
+        """(us, them, castling, en passant) with every position turned round so the side to move
+        plays up the board; us and them are 6 x N, castling is the side to move's rights as White's"""
+        black = self.turn == BLACK_COLOUR
+        white_pieces, black_pieces = self.pieces[:, :6], self.pieces[:, 6:]
+        # Reversing the bytes of a bitboard reverses its ranks
+        us = np.where(black[:, None], black_pieces.byteswap(), white_pieces).T.copy()
+        them = np.where(black[:, None], white_pieces.byteswap(), black_pieces).T.copy()
+        castling = np.where(black, self.castling >> 2, self.castling) & 3
+        en_passant = np.where(black & (self.en_passant >= 0), self.en_passant ^ 56, self.en_passant)
+        return us, them, castling, en_passant
+
+    def in_check(self):
+        "N bools, whether the side to move is in check"
+        us, them, _, _ = self._relative()
+        occupied = np.bitwise_or.reduce(us, axis = 0) | np.bitwise_or.reduce(them, axis = 0)
+        return _attackers(us[KING], occupied, them, them[PAWN]) != 0
+
+    def legal_move_counts(self):
+        "N ints, the number of legal moves of the side to move, as BitBoard.generate_moves counts them"
+        us, them, castling, en_passant = self._relative()
+        occupied_us = np.bitwise_or.reduce(us, axis = 0)
+        occupied = occupied_us | np.bitwise_or.reduce(them, axis = 0)
+        empty = ~occupied
+        king = us[KING]
+        slider_kinds = ((ROOK_VECTORS, them[ROOK] | them[QUEEN], us[ROOK] | us[QUEEN]),
+                        (BISHOP_VECTORS, them[BISHOP] | them[QUEEN], us[BISHOP] | us[QUEEN]))
+
+        # Taken off the board, so the king can't step back along a slider's line
+        danger = _attacks(them, BLACK_COLOUR, occupied ^ king)
+        count = _popcount(_step(king, KING_VECTORS) & ~occupied_us & ~danger)
+
+        # Look out from the king along every line for checks and pins
+        checkers = (_step(king, KNIGHT_VECTORS) & them[KNIGHT]) | (_pawn_attacks(king, WHITE_COLOUR) & them[PAWN])
+        blocks = np.zeros_like(king)
+        pinned = np.zeros_like(king)
+        # (vector, our sliders that move along it, pieces pinned on it, the squares they may move to)
+        pins = []
+        for vectors, enemy_sliders, our_sliders in slider_kinds:
+            for dx, dy in vectors:
+                ray = _slide(king, empty, dx, dy)
+                checker = ray & enemy_sliders
+                checkers |= checker
+                blocks |= np.where(checker != 0, ray, _ZERO)
+                blocker = ray & occupied_us
+                beyond = _slide(king, empty | blocker, dx, dy)
+                pinned_here = np.where((beyond & ~ray & enemy_sliders) != 0, blocker, _ZERO)
+                if pinned_here.any():
+                    pinned |= pinned_here
+                    pins.append(((dx, dy), our_sliders, pinned_here, beyond))
+        checks = _popcount(checkers)
+        # Anything but the king has to take a lone checker or block it, and can't answer two
+        evasions = np.where(checks == 0, _FULL, np.where(checks == 1, checkers | blocks, _ZERO))
+        targets = ~occupied_us & evasions
+
+        free = ~pinned
+        knights = us[KNIGHT] & free
+        for dx, dy in KNIGHT_VECTORS:
+            count += _popcount(_shift(knights, dx, dy) & targets)
+        for vectors, _, our_sliders in slider_kinds:
+            sliders = our_sliders & free
+            for dx, dy in vectors:
+                count += _popcount(_slide(sliders, empty, dx, dy) & targets)
+        count += _pawn_move_count(us[PAWN] & free, empty, occupied & ~occupied_us, targets)
+
+        # Pinned pieces only move along the pin
+        for (dx, dy), our_sliders, pinned_here, line in pins:
+            sliders = our_sliders & pinned_here
+            for direction in ((dx, dy), (-dx, -dy)):
+                count += _popcount(_slide(sliders, empty, *direction) & targets & line)
+            count += _pawn_move_count(us[PAWN] & pinned_here, empty, occupied & ~occupied_us, targets & line)
+
+        # En passant is tried on the board, taking two pawns off a rank can uncover a check
+        has_en_passant = en_passant >= 0
+        if has_en_passant.any():
+            target = np.where(has_en_passant, np.uint64(1) << np.maximum(en_passant, 0).astype(np.uint64), _ZERO)
+            captured = _shift(target, 0, -1)
+            for dx in (-1, 1):
+                pawn = _shift(target, dx, -1) & us[PAWN]
+                after = (occupied ^ pawn ^ captured) | target
+                safe = _attackers(king, after, them, them[PAWN] & ~captured) == 0
+                count += (pawn != 0) & safe
+
+        # The squares the king passes through are tested with it off the board, which
+        # only differs from testing with it on when it is in check, and then it can't castle
+        home = (king == _BITS[4]) & (checks == 0)
+        for right, between, path in _CASTLING:
+            count += home & ((castling & right) != 0) & ((occupied & between) == 0) & ((danger & path) == 0)
+        return count
+
+
+def random_positions(count : int, max_plies : int, rng : random.Random) -> list:
+    "count positions reached by playing up to max_plies random moves from the start"
+    start = BitBoard.from_fen(STARTING_FEN)
+    positions = []
+    while len(positions) < count:
+        board = start.copy()
+        for _ in range(rng.randrange(max_plies + 1)):
+            moves = board.generate_moves()
+            if not moves:
+                break
+            board.make_move(rng.choice(moves))
+        board.history = []
+        positions.append(board)
+    return positions
+
+def _rate(function, positions : int, repeat : int) -> float:
+    "Positions per second, best of repeat runs"
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return positions / best if best > 0 else float("inf")
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(description = "Measure batch move generation in positions per second")
+    parser.add_argument("--positions", type = int, default = 10000)
+    parser.add_argument("--plies", type = int, default = 80, help = "longest random game played to reach a position")
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--check", action = "store_true", help = "compare every result with the bitboard core")
+    args = parser.parse_args(argv)
+
+    boards = random_positions(args.positions, args.plies, random.Random(args.seed))
+    batch = Batch.from_boards(boards)
+    count = len(batch)
+    print(f"{count} positions")
+    print(f"legal move counts   {_rate(batch.legal_move_counts, count, args.repeat):>12,.0f} positions/s")
+    print(f"check status        {_rate(batch.in_check, count, args.repeat):>12,.0f} positions/s")
+    print(f"attack maps         {_rate(lambda: (batch.attacks(WHITE_COLOUR), batch.attacks(BLACK_COLOUR)), count, args.repeat):>12,.0f} positions/s")
+    print(f"BitBoard one by one {_rate(lambda: [len(board.generate_moves()) for board in boards], count, 1):>12,.0f} positions/s")
+
+    if args.check:
+        counts, checks = batch.legal_move_counts(), batch.in_check()
+        attacks = [batch.attacks(WHITE_COLOUR), batch.attacks(BLACK_COLOUR)]
+        mismatches = 0
+        for index, board in enumerate(boards):
+            if (counts[index] != len(board.generate_moves()) or checks[index] != board.in_check()
+                    or any(int(attacks[colour][index]) != board.attacks(colour) for colour in (WHITE_COLOUR, BLACK_COLOUR))):
+                mismatches += 1
+                print(f"mismatch: {board.fen()}")
+        print(f"{mismatches} mismatches")
+        return 1 if mismatches else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,687 @@
+"""Bitboard core for the rules engine.
+
+Squares are indexed 0 to 63 as y * 8 + x, so Position(0, 0) (a1) is square 0
+and Position(7, 7) (h8) is square 63. Every piece type of every colour is held
+as a single 64 bit int with one bit set per piece.
+"""
+import random
+
+WHITE_COLOUR = 0
+BLACK_COLOUR = 1
+
+PAWN = 0
+KNIGHT = 1
+BISHOP = 2
+ROOK = 3
+QUEEN = 4
+KING = 5
+
+COLOUR_NAMES = ("White", "Black")
+RANK_NAMES = ("Pawn", "Knight", "Bishop", "Rook", "Queen", "King")
+
+COLOUR_INDEX = {name : index for index, name in enumerate(COLOUR_NAMES)}
+RANK_INDEX = {name : index for index, name in enumerate(RANK_NAMES)}
+
+FULL_BOARD = (1 << 64) - 1
+RANK_1 = 0xFF
+RANK_8 = 0xFF << 56
+
+# Castling rights, one bit each
+WHITE_KING_SIDE = 1
+WHITE_QUEEN_SIDE = 2
+BLACK_KING_SIDE = 4
+BLACK_QUEEN_SIDE = 8
+ALL_CASTLING = 15
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+FEN_PIECES = {
+    "P" : (0, 0), "N" : (0, 1), "B" : (0, 2), "R" : (0, 3), "Q" : (0, 4), "K" : (0, 5),
+    "p" : (1, 0), "n" : (1, 1), "b" : (1, 2), "r" : (1, 3), "q" : (1, 4), "k" : (1, 5)
+}
+FEN_CASTLING = {"K" : WHITE_KING_SIDE, "Q" : WHITE_QUEEN_SIDE, "k" : BLACK_KING_SIDE, "q" : BLACK_QUEEN_SIDE}
+PROMOTION_LETTERS = {"n" : 1, "b" : 2, "r" : 3, "q" : 4}
+# FEN letter of each piece, FEN_LETTERS[colour][rank]
+FEN_LETTERS = ("PNBRQK", "pnbrqk")
+
+KNIGHT_VECTORS = ((1, 2), (2, 1), (-1, 2), (-2, 1), (1, -2), (2, -1), (-1, -2), (-2, -1))
+KING_VECTORS = ((1, 0), (0, 1), (1, 1), (-1, 1), (-1, 0), (0, -1), (1, -1), (-1, -1))
+ROOK_VECTORS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+BISHOP_VECTORS = ((1, 1), (-1, 1), (-1, -1), (1, -1))
+
+
+def square_index(x : int, y : int) -> int:
+    return y * 8 + x
+
+def square_coordinates(square : int):
+    "Returns the (x, y) coordinates of square"
+    return square & 7, square >> 3
+
+def on_board(x : int, y : int) -> bool:
+    return 0 <= x <= 7 and 0 <= y <= 7
+
+def iter_squares(bitboard : int):
+    "Yields the index of every set bit, lowest first"
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+def popcount(bitboard : int) -> int:
+    return bin(bitboard).count("1")
+
+def lowest_square(bitboard : int) -> int:
+    return (bitboard & -bitboard).bit_length() - 1
+
+
+def square_name(square : int) -> str:
+    return "abcdefgh"[square & 7] + str((square >> 3) + 1)
+
+def parse_square(name : str) -> int:
+    return square_index(ord(name[0]) - ord("a"), int(name[1]) - 1)
+
+
+# Moves are packed into an int: from square, to square and promotion rank
+def encode_move(from_square : int, to_square : int, promotion : int = 0) -> int:
+    return from_square | (to_square << 6) | (promotion << 12)
+
+def move_from(move : int) -> int:
+    return move & 63
+
+def move_to(move : int) -> int:
+    return (move >> 6) & 63
+
+def move_promotion(move : int) -> int:
+    return move >> 12
+
+def move_to_uci(move : int) -> str:
+    text = square_name(move & 63) + square_name((move >> 6) & 63)
+    if move >> 12:
+        text += "nbrq"[(move >> 12) - 1]
+    return text
+
+def move_from_uci(text : str) -> int:
+    "Parses a move in UCI notation, e.g. e2e4 or a7a8q, it is not checked for legality"
+    if len(text) not in (4, 5) or text[0] not in "abcdefgh" or text[2] not in "abcdefgh" \
+            or text[1] not in "12345678" or text[3] not in "12345678":
+        raise ValueError(f"Not a UCI move: {text}")
+    promotion = PROMOTION_LETTERS[text[4]] if len(text) == 5 else 0
+    return encode_move(parse_square(text[:2]), parse_square(text[2:4]), promotion)
+
+
+def _leaper_table(vectors):
+    table = []
+    for square in range(64):
+        x, y = square_coordinates(square)
+        attacks = 0
+        for dx, dy in vectors:
+            if on_board(x + dx, y + dy):
+                attacks |= 1 << square_index(x + dx, y + dy)
+        table.append(attacks)
+    return table
+
+def _ray(square : int, dx : int, dy : int) -> list:
+    "Squares from square (exclusive) to the edge of the board along (dx, dy)"
+    x, y = square_coordinates(square)
+    ray = []
+    x, y = x + dx, y + dy
+    while on_board(x, y):
+        ray.append(square_index(x, y))
+        x, y = x + dx, y + dy
+    return ray
+
+def _line_tables(vector):
+    """Precompute sliding attacks along one line (rank, file or diagonal) through every square.
+
+    A line is the two opposite rays (dx, dy) and (-dx, -dy). The squares at the far
+    end of each ray can never block anything beyond themselves, so only the inner
+    squares are relevant occupancy. For each square every subset of the relevant
+    occupancy is mapped to the attack set, which turns a slider lookup into a mask
+    and a dict lookup, the same idea as magic bitboards without the multiply."""
+    dx, dy = vector
+    masks = []
+    tables = []
+    for square in range(64):
+        rays = [_ray(square, dx, dy), _ray(square, -dx, -dy)]
+        mask = 0
+        for ray in rays:
+            for target in ray[:-1]:
+                mask |= 1 << target
+
+        table = {}
+        subset = 0
+        while True:
+            attacks = 0
+            for ray in rays:
+                for target in ray:
+                    attacks |= 1 << target
+                    if subset >> target & 1:
+                        break
+            table[subset] = attacks
+            # Carry-rippler trick to enumerate every subset of mask
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+KNIGHT_ATTACKS = _leaper_table(KNIGHT_VECTORS)
+KING_ATTACKS = _leaper_table(KING_VECTORS)
+PAWN_ATTACKS = (
+    _leaper_table(((-1, 1), (1, 1))), # White
+    _leaper_table(((-1, -1), (1, -1))) # Black
+)
+
+RANK_MASKS, RANK_ATTACKS = _line_tables((1, 0))
+FILE_MASKS, FILE_ATTACKS = _line_tables((0, 1))
+DIAGONAL_MASKS, DIAGONAL_ATTACKS = _line_tables((1, 1))
+ANTI_DIAGONAL_MASKS, ANTI_DIAGONAL_ATTACKS = _line_tables((-1, 1))
+
+# The eight ray directions. Opposite directions are four apart, so direction ^ 4 reverses one,
+# even directions are orthogonal and odd ones diagonal
+DIRECTION_VECTORS = ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1))
+
+# Squares along each ray out of every square, nearest first, RAYS[square][direction]
+RAYS = tuple(tuple(tuple(_ray(square, dx, dy)) for dx, dy in DIRECTION_VECTORS) for square in range(64))
+
+def _ray_directions():
+    "RAY_DIRECTIONS[from][to] is the direction of the ray from one square through the other, -1 if none"
+    table = [[-1] * 64 for _ in range(64)]
+    for square in range(64):
+        for direction, ray in enumerate(RAYS[square]):
+            for target in ray:
+                table[square][target] = direction
+    return table
+
+RAY_DIRECTIONS = _ray_directions()
+
+# Ranks that slide along each direction
+DIRECTION_SLIDERS = tuple((ROOK, QUEEN) if direction % 2 == 0 else (BISHOP, QUEEN) for direction in range(8))
+
+def _between_and_line_tables():
+    """BETWEEN[a][b] is the squares strictly between two squares on a shared line,
+    LINE[a][b] the whole line through both, edge to edge. Both are 0 when the squares aren't aligned"""
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for square in range(64):
+        for direction, ray in enumerate(RAYS[square]):
+            full = 1 << square
+            for target in RAYS[square][direction] + RAYS[square][direction ^ 4]:
+                full |= 1 << target
+            passed = 0
+            for target in ray:
+                between[square][target] = passed
+                line[square][target] = full
+                passed |= 1 << target
+    return between, line
+
+BETWEEN, LINE = _between_and_line_tables()
+
+
+def rook_attacks(square : int, occupied : int) -> int:
+    return (RANK_ATTACKS[square][occupied & RANK_MASKS[square]]
+            | FILE_ATTACKS[square][occupied & FILE_MASKS[square]])
+
+def bishop_attacks(square : int, occupied : int) -> int:
+    return (DIAGONAL_ATTACKS[square][occupied & DIAGONAL_MASKS[square]]
+            | ANTI_DIAGONAL_ATTACKS[square][occupied & ANTI_DIAGONAL_MASKS[square]])
+
+def queen_attacks(square : int, occupied : int) -> int:
+    return rook_attacks(square, occupied) | bishop_attacks(square, occupied)
+
+def piece_attacks(colour : int, rank : int, square : int, occupied : int) -> int:
+    "Returns the squares attacked by a piece of colour and rank standing on square"
+    if rank == PAWN:
+        return PAWN_ATTACKS[colour][square]
+    if rank == KNIGHT:
+        return KNIGHT_ATTACKS[square]
+    if rank == BISHOP:
+        return bishop_attacks(square, occupied)
+    if rank == ROOK:
+        return rook_attacks(square, occupied)
+    if rank == QUEEN:
+        return queen_attacks(square, occupied)
+    return KING_ATTACKS[square]
+
+def _castling_masks():
+    "Castling rights that survive a move from or to each square"
+    masks = [ALL_CASTLING] * 64
+    masks[square_index(4, 0)] &= ~(WHITE_KING_SIDE | WHITE_QUEEN_SIDE)
+    masks[square_index(7, 0)] &= ~WHITE_KING_SIDE
+    masks[square_index(0, 0)] &= ~WHITE_QUEEN_SIDE
+    masks[square_index(4, 7)] &= ~(BLACK_KING_SIDE | BLACK_QUEEN_SIDE)
+    masks[square_index(7, 7)] &= ~BLACK_KING_SIDE
+    masks[square_index(0, 7)] &= ~BLACK_QUEEN_SIDE
+    return masks
+
+CASTLING_MASKS = _castling_masks()
+
+# Zobrist keys, drawn from a fixed seed so hashes are the same in every process
+_zobrist_random = random.Random(0x5A0B2157)
+ZOBRIST_PIECES = [[[_zobrist_random.getrandbits(64) for _ in range(64)] for _ in range(6)] for _ in range(2)]
+ZOBRIST_TURN = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]
+del _zobrist_random
+
+def zobrist_state_key(turn : int, castling : int, en_passant : int) -> int:
+    "Hash contribution of the side to move, castling rights and en passant file"
+    key = ZOBRIST_CASTLING[castling]
+    if turn == BLACK_COLOUR:
+        key ^= ZOBRIST_TURN
+    if en_passant >= 0:
+        key ^= ZOBRIST_EN_PASSANT[en_passant & 7]
+    return key
+
+# (right, king from, king to, squares that must be empty, squares the king passes through)
+CASTLING_MOVES = (
+    (WHITE_KING_SIDE, 4, 6, 0x60, (5, 6)),
+    (WHITE_QUEEN_SIDE, 4, 2, 0x0E, (3, 2)),
+    (BLACK_KING_SIDE, 60, 62, 0x60 << 56, (61, 62)),
+    (BLACK_QUEEN_SIDE, 60, 58, 0x0E << 56, (59, 58))
+)
+# Rook from and to squares keyed by the king's destination
+CASTLING_ROOKS = {6 : (7, 5), 2 : (0, 3), 62 : (63, 61), 58 : (56, 59)}
+
+
+class BitBoard:
+    """Piece placement held as one bitboard per colour and rank plus occupancy masks,
+    along with the side to move, castling rights, en passant square and move clocks"""
+
+    def __init__(self):
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupancy = [0, 0]
+        self.occupied = 0
+        # Mailbox of (colour, rank) so piece_at does not have to scan twelve bitboards
+        self.mailbox = [None] * 64
+        self.turn = WHITE_COLOUR
+        self.castling = 0
+        self.en_passant = -1
+        self.halfmove = 0
+        self.fullmove = 1
+        self.history = []
+        # Zobrist hash of the position, kept up to date by place, remove, set_state and make_move
+        self.hash = zobrist_state_key(self.turn, self.castling, self.en_passant)
+
+    @classmethod
+    def from_fen(cls, fen : str):
+        "Builds a board from the first six fields of a FEN string, raises ValueError if it can't be read"
+        board = cls()
+        fields = fen.split()
+        rows = fields[0].split("/") if fields else []
+        if len(rows) != 8:
+            raise ValueError(f"FEN needs 8 ranks: {fen}")
+        for row, rank_text in enumerate(rows):
+            y = 7 - row
+            x = 0
+            for char in rank_text:
+                if char.isdigit():
+                    x += int(char)
+                elif char in FEN_PIECES and x < 8:
+                    colour, rank = FEN_PIECES[char]
+                    board.place(colour, rank, square_index(x, y))
+                    x += 1
+                else:
+                    raise ValueError(f"Bad FEN rank {rank_text}: {fen}")
+            if x != 8:
+                raise ValueError(f"Bad FEN rank {rank_text}: {fen}")
+        # Move generation and check detection work from each side's one king
+        for colour in (WHITE_COLOUR, BLACK_COLOUR):
+            if popcount(board.pieces[colour][KING]) != 1:
+                raise ValueError(f"FEN needs one {COLOUR_NAMES[colour]} king: {fen}")
+            # A pawn there would push off the board
+            if board.pieces[colour][PAWN] & (RANK_1 | RANK_8):
+                raise ValueError(f"FEN has a {COLOUR_NAMES[colour]} pawn on the first or last rank: {fen}")
+        if len(fields) > 1 and fields[1] not in ("w", "b"):
+            raise ValueError(f"Bad FEN side to move {fields[1]}: {fen}")
+        turn = WHITE_COLOUR if len(fields) < 2 or fields[1] == "w" else BLACK_COLOUR
+        castling = 0
+        if len(fields) > 2 and fields[2] != "-":
+            for char in fields[2]:
+                if char not in FEN_CASTLING:
+                    raise ValueError(f"Bad FEN castling rights {fields[2]}: {fen}")
+                castling |= FEN_CASTLING[char]
+        # Castling moves the king and rook from their home squares, so rights without them there are dropped
+        for right, king_from, king_to, _, _ in CASTLING_MOVES:
+            colour = WHITE_COLOUR if king_from < 8 else BLACK_COLOUR
+            rook_from = CASTLING_ROOKS[king_to][0]
+            if board.mailbox[king_from] != (colour, KING) or board.mailbox[rook_from] != (colour, ROOK):
+                castling &= ~right
+        en_passant = -1
+        if len(fields) > 3 and fields[3] != "-":
+            if len(fields[3]) != 2 or fields[3][0] not in "abcdefgh" or fields[3][1] not in "36":
+                raise ValueError(f"Bad FEN en passant square {fields[3]}: {fen}")
+            en_passant = parse_square(fields[3])
+        board.set_state(turn, castling, en_passant)
+        if len(fields) > 5:
+            board.halfmove = int(fields[4])
+            board.fullmove = int(fields[5])
+        return board
+
+    def fen(self) -> str:
+        "The position as a FEN string"
+        rows = []
+        for y in range(7, -1, -1):
+            row = ""
+            empty = 0
+            for x in range(8):
+                occupant = self.mailbox[square_index(x, y)]
+                if occupant is None:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                row += FEN_LETTERS[occupant[0]][occupant[1]]
+            if empty:
+                row += str(empty)
+            rows.append(row)
+        castling = "".join(letter for letter, right in FEN_CASTLING.items() if self.castling & right) or "-"
+        en_passant = square_name(self.en_passant) if self.en_passant >= 0 else "-"
+        return f"{'/'.join(rows)} {'wb'[self.turn]} {castling} {en_passant} {self.halfmove} {self.fullmove}"
+
+    def copy(self):
+        board = BitBoard.__new__(BitBoard)
+        board.pieces = [self.pieces[0][:], self.pieces[1][:]]
+        board.occupancy = self.occupancy[:]
+        board.occupied = self.occupied
+        board.mailbox = self.mailbox[:]
+        board.turn = self.turn
+        board.castling = self.castling
+        board.en_passant = self.en_passant
+        board.halfmove = self.halfmove
+        board.fullmove = self.fullmove
+        board.history = self.history[:]
+        board.hash = self.hash
+        return board
+
+    def set_state(self, turn : int, castling : int, en_passant : int = -1) -> None:
+        "Sets the side to move, castling rights and en passant square, keeping the hash in step"
+        self.hash ^= zobrist_state_key(self.turn, self.castling, self.en_passant)
+        self.turn = turn
+        self.castling = castling
+        self.en_passant = en_passant
+        self.hash ^= zobrist_state_key(turn, castling, en_passant)
+
+    def compute_hash(self) -> int:
+        "Zobrist hash computed from scratch, the incrementally updated self.hash should always equal it"
+        key = zobrist_state_key(self.turn, self.castling, self.en_passant)
+        for square, occupant in enumerate(self.mailbox):
+            if occupant is not None:
+                key ^= ZOBRIST_PIECES[occupant[0]][occupant[1]][square]
+        return key
+
+    def place(self, colour : int, rank : int, square : int) -> None:
+        bit = 1 << square
+        self.pieces[colour][rank] |= bit
+        self.occupancy[colour] |= bit
+        self.occupied |= bit
+        self.mailbox[square] = (colour, rank)
+        self.hash ^= ZOBRIST_PIECES[colour][rank][square]
+
+    def remove(self, square : int):
+        "Removes whatever is on square, returns the (colour, rank) removed or None"
+        occupant = self.mailbox[square]
+        if occupant is None:
+            return None
+        colour, rank = occupant
+        mask = ~(1 << square)
+        self.pieces[colour][rank] &= mask
+        self.occupancy[colour] &= mask
+        self.occupied &= mask
+        self.mailbox[square] = None
+        self.hash ^= ZOBRIST_PIECES[colour][rank][square]
+        return occupant
+
+    def move(self, from_square : int, to_square : int):
+        "Moves the piece on from_square to to_square, returns the (colour, rank) captured or None"
+        captured = self.remove(to_square)
+        colour, rank = self.remove(from_square)
+        self.place(colour, rank, to_square)
+        return captured
+
+    def piece_at(self, square : int):
+        return self.mailbox[square]
+
+    def king_square(self, colour : int) -> int:
+        king = self.pieces[colour][KING]
+        if not king:
+            return -1
+        return lowest_square(king)
+
+    def attacks_from(self, square : int, occupied : int = None) -> int:
+        "Squares attacked by the piece on square, 0 if it is empty"
+        occupant = self.mailbox[square]
+        if occupant is None:
+            return 0
+        if occupied is None:
+            occupied = self.occupied
+        return piece_attacks(occupant[0], occupant[1], square, occupied)
+
+    def attacks(self, colour : int, occupied : int = None) -> int:
+        "Every square attacked by colour"
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.pieces[colour]
+        attacked = 0
+        for square in iter_squares(pieces[PAWN]):
+            attacked |= PAWN_ATTACKS[colour][square]
+        for square in iter_squares(pieces[KNIGHT]):
+            attacked |= KNIGHT_ATTACKS[square]
+        for square in iter_squares(pieces[BISHOP] | pieces[QUEEN]):
+            attacked |= bishop_attacks(square, occupied)
+        for square in iter_squares(pieces[ROOK] | pieces[QUEEN]):
+            attacked |= rook_attacks(square, occupied)
+        for square in iter_squares(pieces[KING]):
+            attacked |= KING_ATTACKS[square]
+        return attacked
+
+    def attackers_to(self, square : int, colour : int, occupied : int = None) -> int:
+        "Bitboard of the pieces of colour attacking square"
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.pieces[colour]
+        # A pawn of colour attacks square if a pawn of the other colour on square would attack it
+        return ((PAWN_ATTACKS[colour ^ 1][square] & pieces[PAWN])
+                | (KNIGHT_ATTACKS[square] & pieces[KNIGHT])
+                | (KING_ATTACKS[square] & pieces[KING])
+                | (bishop_attacks(square, occupied) & (pieces[BISHOP] | pieces[QUEEN]))
+                | (rook_attacks(square, occupied) & (pieces[ROOK] | pieces[QUEEN])))
+
+    def pins_and_checks(self, colour : int):
+        """Looks out from the king of colour once and returns (checkers, evasions, pins):
+        the enemy pieces giving check, the squares anything but the king may move to
+        (all of them when not in check, none in double check) and, for each pinned piece's
+        square, the line it is pinned along"""
+        king = self.king_square(colour)
+        if king < 0:
+            return 0, FULL_BOARD, {}
+        enemy_pieces = self.pieces[colour ^ 1]
+
+        checkers = self.attackers_to(king, colour ^ 1)
+        if not checkers:
+            evasions = FULL_BOARD
+        elif checkers & (checkers - 1):
+            # Double check, only the king can move
+            evasions = 0
+        else:
+            # Capture the checker or block the line between it and the king
+            evasions = checkers | BETWEEN[king][lowest_square(checkers)]
+
+        # Enemy sliders that would see the king if none of our pieces were in the way
+        enemy = self.occupancy[colour ^ 1]
+        pinners = ((rook_attacks(king, enemy) & (enemy_pieces[ROOK] | enemy_pieces[QUEEN]))
+                   | (bishop_attacks(king, enemy) & (enemy_pieces[BISHOP] | enemy_pieces[QUEEN])))
+        pins = {}
+        for pinner in iter_squares(pinners):
+            blockers = BETWEEN[king][pinner] & self.occupied
+            # Exactly one piece in the way, and it is ours since the enemy's would have stopped the ray
+            if blockers and not blockers & (blockers - 1):
+                pins[lowest_square(blockers)] = LINE[king][pinner]
+        return checkers, evasions, pins
+
+    def is_attacked(self, square : int, colour : int, occupied : int = None) -> bool:
+        "Returns true if square is attacked by colour"
+        return self.attackers_to(square, colour, occupied) != 0
+
+    def in_check(self, colour : int = None) -> bool:
+        if colour is None:
+            colour = self.turn
+        return self.is_attacked(self.king_square(colour), colour ^ 1)
+
+    def _is_legal(self, from_square : int, to_square : int, king_square : int, captured_square : int) -> bool:
+        "Returns true if the move does not leave the mover's own king attacked"
+        from_bit = 1 << from_square
+        to_bit = 1 << to_square
+        removed = to_bit
+        occupied = (self.occupied ^ from_bit) | to_bit
+        if captured_square != to_square:
+            # En passant, the captured pawn is not on the destination square
+            removed |= 1 << captured_square
+            occupied &= ~(1 << captured_square)
+        if from_square == king_square:
+            king_square = to_square
+        return not self.attackers_to(king_square, self.turn ^ 1, occupied) & ~removed
+
+    def generate_moves(self, captures_only : bool = False) -> list:
+        """Returns every legal move for the side to move, or only the captures and
+        promotions if captures_only is set (what a quiescence search looks at)"""
+        us = self.turn
+        them = us ^ 1
+        pieces = self.pieces[us]
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = self.occupied
+        empty = ~occupied & FULL_BOARD
+        king_square = self.king_square(us)
+        candidates = [] # (from, to, captured square, promotion)
+
+        # Pawns
+        step = 8 if us == WHITE_COLOUR else -8
+        start_rank = 0xFF << 8 if us == WHITE_COLOUR else 0xFF << 48
+        promotion_rank = RANK_8 if us == WHITE_COLOUR else RANK_1
+        for square in iter_squares(pieces[PAWN]):
+            targets = PAWN_ATTACKS[us][square] & enemy
+            push = square + step
+            if captures_only:
+                if empty >> push & 1 and (1 << push) & promotion_rank:
+                    targets |= 1 << push
+            elif empty >> push & 1:
+                targets |= 1 << push
+                if (1 << square) & start_rank and empty >> (push + step) & 1:
+                    targets |= 1 << (push + step)
+            for target in iter_squares(targets):
+                if (1 << target) & promotion_rank:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        candidates.append((square, target, target, promotion))
+                else:
+                    candidates.append((square, target, target, 0))
+        if self.en_passant >= 0:
+            for square in iter_squares(PAWN_ATTACKS[them][self.en_passant] & pieces[PAWN]):
+                candidates.append((square, self.en_passant, self.en_passant - step, 0))
+
+        # Pieces
+        not_own = enemy if captures_only else ~own
+        for square in iter_squares(pieces[KNIGHT]):
+            for target in iter_squares(KNIGHT_ATTACKS[square] & not_own):
+                candidates.append((square, target, target, 0))
+        for square in iter_squares(pieces[BISHOP] | pieces[QUEEN]):
+            for target in iter_squares(bishop_attacks(square, occupied) & not_own):
+                candidates.append((square, target, target, 0))
+        for square in iter_squares(pieces[ROOK] | pieces[QUEEN]):
+            for target in iter_squares(rook_attacks(square, occupied) & not_own):
+                candidates.append((square, target, target, 0))
+        for target in iter_squares(KING_ATTACKS[king_square] & not_own):
+            candidates.append((king_square, target, target, 0))
+
+        _, evasions, pins = self.pins_and_checks(us)
+        moves = []
+        for from_square, to_square, captured_square, promotion in candidates:
+            if from_square == king_square or captured_square != to_square:
+                # King steps and en passant can uncover attacks the pin and check masks don't cover
+                if not self._is_legal(from_square, to_square, king_square, captured_square):
+                    continue
+            elif not (evasions & pins.get(from_square, FULL_BOARD)) >> to_square & 1:
+                continue
+            moves.append(from_square | (to_square << 6) | (promotion << 12))
+
+        # Castling, the destination is checked by the king move below
+        if self.castling and not captures_only and not self.is_attacked(king_square, them):
+            for right, king_from, king_to, between, path in CASTLING_MOVES:
+                if (self.castling & right and king_square == king_from and not occupied & between
+                        and not self.is_attacked(path[0], them) and not self.is_attacked(path[1], them)):
+                    moves.append(king_from | (king_to << 6))
+
+        return moves
+
+    def make_move(self, move : int) -> None:
+        """Plays a legal move and updates the side to move, castling rights, en passant square, clocks and hash.
+        An undo record of (move, captured (colour, rank), castling, en passant, halfmove, hash) is pushed
+        onto history so unmake_move can restore the position exactly"""
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        promotion = move >> 12
+        colour, rank = self.mailbox[from_square]
+
+        captured_square = to_square
+        if rank == PAWN and to_square == self.en_passant:
+            captured_square = to_square - 8 if colour == WHITE_COLOUR else to_square + 8
+        self.history.append((move, self.mailbox[captured_square], self.castling, self.en_passant, self.halfmove, self.hash))
+        self.hash ^= zobrist_state_key(self.turn, self.castling, self.en_passant)
+        captured = self.remove(captured_square)
+
+        self.remove(from_square)
+        self.place(colour, promotion or rank, to_square)
+
+        en_passant = -1
+        if rank == PAWN:
+            if abs(to_square - from_square) == 16:
+                en_passant = (from_square + to_square) >> 1
+        elif rank == KING and abs(to_square - from_square) == 2:
+            rook_from, rook_to = CASTLING_ROOKS[to_square]
+            self.remove(rook_from)
+            self.place(colour, ROOK, rook_to)
+
+        self.castling &= CASTLING_MASKS[from_square] & CASTLING_MASKS[to_square]
+        self.en_passant = en_passant
+        if rank == PAWN or captured:
+            self.halfmove = 0
+        else:
+            self.halfmove += 1
+        if colour == BLACK_COLOUR:
+            self.fullmove += 1
+        self.turn = colour ^ 1
+        self.hash ^= zobrist_state_key(self.turn, self.castling, en_passant)
+
+    def unmake_move(self) -> int:
+        "Takes back the last move made with make_move and returns it"
+        move, captured, castling, en_passant, halfmove, hash = self.history.pop()
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        colour = self.turn ^ 1
+        rank = PAWN if move >> 12 else self.mailbox[to_square][1]
+
+        self.remove(to_square)
+        self.place(colour, rank, from_square)
+
+        if captured is not None:
+            captured_square = to_square
+            if rank == PAWN and to_square == en_passant:
+                captured_square = to_square - 8 if colour == WHITE_COLOUR else to_square + 8
+            self.place(captured[0], captured[1], captured_square)
+        elif rank == KING and abs(to_square - from_square) == 2:
+            rook_from, rook_to = CASTLING_ROOKS[to_square]
+            self.remove(rook_to)
+            self.place(colour, ROOK, rook_from)
+
+        self.castling = castling
+        self.en_passant = en_passant
+        self.halfmove = halfmove
+        if colour == BLACK_COLOUR:
+            self.fullmove -= 1
+        self.turn = colour
+        self.hash = hash
+        return move
@@ -1,13 +1,16 @@
-import logging
 from utils import *
 from piece import *
+from bitboard import *
+from instrument import counted, timed
 
 class ChessSquare:
-    
+    __slots__ = ("control", "piece")
+
     def __init__(self, piece = None):
+        # Number of pieces of each colour attacking the square
         self.control = {
-            "White" : False,
-            "Black" : False
+            "White" : 0,
+            "Black" : 0
         }
         self.piece = piece
 
@@ -26,73 +29,245 @@ class ChessBoard:
         for row in range(n):
             for col in range(n):
                 self.squares[row][col] = ChessSquare()
+        # Squares are a view over the bitboard core, which move generation reads from
+        self.bitboard = BitBoard()
+        self._square_list = [self.squares[square & 7][square >> 3] for square in range(64)]
+        # Attack set each square's occupant contributes to square control, and its colour
+        self._piece_control = [0] * 64
+        self._piece_control_colour = [None] * 64
+        # Pieces and moved flags needed to undo each move, alongside the bitboard history
+        self._undo_stack = []
+        # Pins and checks of the current position by colour, and the hash they were worked out for
+        self._pins_and_checks = [None, None]
+        self._pins_and_checks_hash = None
+
+    def place(self, piece : Piece, position : Position):
+        "Puts piece on position, replacing whatever was there"
+        square_index = position_to_square(position)
+        self.bitboard.remove(square_index)
+        self.bitboard.place(piece._colour_index, piece._rank_index, square_index)
+        self.square_from_position(position).place(piece)
+        self._update_square_control(1 << square_index)
+
+    def remove(self, position : Position):
+        "Takes the piece on position out of play"
+        square = self.square_from_position(position)
+        if square.piece:
+            square.piece.destroy()
+        square.remove()
+        square_index = position_to_square(position)
+        self.bitboard.remove(square_index)
+        self._update_square_control(1 << square_index)
+
+    def make_move(self, move : int):
+        """Plays move on the squares, pieces and bitboard core,
+        remembering what unmake_move needs to take it back"""
+        bitboard = self.bitboard
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        promotion = move >> 12
+        piece = self._square_list[from_square].piece
+        changed = (1 << from_square) | (1 << to_square)
+
+        captured_square = to_square
+        if piece._rank_index == PAWN and to_square == bitboard.en_passant:
+            captured_square = to_square - 8 if piece._colour_index == WHITE_COLOUR else to_square + 8
+            changed |= 1 << captured_square
+        captured = self._square_list[captured_square].piece
+
+        rook = None
+        rook_had_moved = False
+        if piece._rank_index == KING and abs(to_square - from_square) == 2:
+            rook_from, rook_to = CASTLING_ROOKS[to_square]
+            rook = self._square_list[rook_from].piece
+            rook_had_moved = rook.has_moved
+            changed |= (1 << rook_from) | (1 << rook_to)
 
-    def move(self, piece : Piece, new_position : Position):
-        old_square = self.square_from_position(piece.position)
-        new_square = self.square_from_position(new_position)
-        logging.debug(new_position)
-        logging.debug(piece.position)
+        self._undo_stack.append((
+            piece, piece.has_moved, captured, captured_square, rook, rook_had_moved
+        ))
+        bitboard.make_move(move)
 
-        if new_square.piece:
-            logging.debug(f"Destroying {new_square.piece}")
-            new_square.piece.destroy()
+        if captured:
+            self._capture(captured, captured_square)
+        self._square_list[from_square].remove()
+        if promotion:
+            piece.destroy()
+            piece = self.piece_manager.create_piece(PIECE_CLASSES[promotion], piece._colour_index, square_to_position(to_square))
+        self._square_list[to_square].place(piece)
+        piece.position = square_to_position(to_square)
+        piece.has_moved = True
 
-        old_square.remove()
-        new_square.place(piece)
+        if rook:
+            self._square_list[rook_from].remove()
+            self._square_list[rook_to].place(rook)
+            rook.position = square_to_position(rook_to)
+            rook.has_moved = True
 
+        self._update_square_control(changed)
+
+    def _capture(self, captured, square_index : int):
+        "Takes a captured piece off the board, separate so captures can be counted"
+        captured.destroy()
+        self._square_list[square_index].remove()
+
+    def unmake_move(self) -> int:
+        "Takes back the last move made with make_move and returns it"
+        piece, had_moved, captured, captured_square, rook, rook_had_moved = self._undo_stack.pop()
+        move = self.bitboard.unmake_move()
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        changed = (1 << from_square) | (1 << to_square) | (1 << captured_square)
+
+        moved = self._square_list[to_square].piece
+        self._square_list[to_square].remove()
+        if moved is not piece:
+            # Promotion, swap the promoted piece back for the pawn
+            moved.destroy()
+            self.piece_manager.pieces[piece.colour].append(piece)
+        self._square_list[from_square].place(piece)
+        piece.position = square_to_position(from_square)
+        piece.has_moved = had_moved
+
+        if rook:
+            rook_from, rook_to = CASTLING_ROOKS[to_square]
+            self._square_list[rook_to].remove()
+            self._square_list[rook_from].place(rook)
+            rook.position = square_to_position(rook_from)
+            rook.has_moved = rook_had_moved
+            changed |= (1 << rook_from) | (1 << rook_to)
+
+        if captured:
+            captured.selected = False
+            self.piece_manager.pieces[captured.colour].append(captured)
+            self._square_list[captured_square].place(captured)
+
+        self._update_square_control(changed)
+        return move
 
     def setup(self):
 
         self.piece_manager.set_board(self)
+        self.bitboard.set_state(WHITE_COLOUR, ALL_CASTLING)
 
         for i, colour in enumerate(["White", "Black"]):
             for j in range(8):
                 pawn = self.piece_manager.create_piece(Pawn, colour, Position(j, 1 + (i * 5)))
-                self.squares[j][1 + (i * 5)].place(pawn)
+                self.place(pawn, Position(j, 1 + (i * 5)))
 
             for j, item in enumerate([Rook, Knight, Bishop]):
                 piece = self.piece_manager.create_piece(item, colour, Position(j, i * 7))
-                self.squares[j][i * 7].place(piece)
+                self.place(piece, Position(j, i * 7))
 
                 piece = self.piece_manager.create_piece(item, colour, Position(7 - j, i * 7))
-                self.squares[7 - j][i * 7].place(piece)
+                self.place(piece, Position(7 - j, i * 7))
 
             queen = self.piece_manager.create_piece(Queen, colour, Position(3, i * 7))
-            self.squares[3][i * 7].place(queen)
+            self.place(queen, Position(3, i * 7))
 
             king = self.piece_manager.create_piece(King, colour, Position(4, i * 7))
-            self.squares[4][i * 7].place(king)
+            self.place(king, Position(4, i * 7))
+
+    def load_fen(self, fen : str):
+        "Replaces whatever is on the board with the position in fen, raises ValueError if it can't be read"
+        core = BitBoard.from_fen(fen)
+
+        self.piece_manager.set_board(self)
+        self.piece_manager.reset()
+        for square in self._square_list:
+            square.remove()
+            square.control = {"White" : 0, "Black" : 0}
+        self.bitboard = BitBoard()
+        self._piece_control = [0] * 64
+        self._piece_control_colour = [None] * 64
+        self._undo_stack = []
+
+        for square_index, occupant in enumerate(core.mailbox):
+            if occupant is None:
+                continue
+            colour, rank = occupant
+            position = square_to_position(square_index)
+            piece = self.piece_manager.create_piece(PIECE_CLASSES[rank], colour, position)
+            # Pawns off their starting rank have moved, kings and rooks have if their castling rights are gone
+            if rank == PAWN:
+                piece.has_moved = position.y != (1 if colour == WHITE_COLOUR else 6)
+            elif rank in (KING, ROOK):
+                piece.has_moved = not any(
+                    core.castling & right and square_index in (king_from, CASTLING_ROOKS[king_to][0])
+                    for right, king_from, king_to, _, _ in CASTLING_MOVES)
+            self.place(piece, position)
+
+        self.bitboard.set_state(core.turn, core.castling, core.en_passant)
+        self.bitboard.halfmove = core.halfmove
+        self.bitboard.fullmove = core.fullmove
+
+    def fen(self) -> str:
+        return self.bitboard.fen()
+
+    def pins_and_checks(self, colour : int):
+        "BitBoard.pins_and_checks for colour, worked out once per position"
+        if self._pins_and_checks_hash != self.bitboard.hash:
+            self._pins_and_checks = [None, None]
+            self._pins_and_checks_hash = self.bitboard.hash
+        if self._pins_and_checks[colour] is None:
+            self._pins_and_checks[colour] = self.bitboard.pins_and_checks(colour)
+        return self._pins_and_checks[colour]
 
     def square_from_position(self, position : Position):
         return self.squares[int(position.x)][int(position.y)]
 
-    def _evaluate_square_control(self, colour):
-        "Mark the squares controlled by colour"
-
-        # Reset square control for colour
-        for row in range(self.limit + 1):
-            for col in range(self.limit + 1):
-                self.squares[row][col].control[colour] = False
-
-        for piece in self.piece_manager.pieces[colour]:
-            for col in range(self.limit + 1):
-                if piece.rank == "King":
-                    # Make sure to avoid infinite loop
-                    moves = []
-                    for move in piece._moves:
-                        pos = Position(piece.position.x + move[0], piece.position.y + move[1])
-                        if max(pos) <= 7 and min(pos) >= 0:
-                            moves.append(pos)
-                else:
-                    moves, captures, defending = piece.possible_moves()
-                    if piece.rank == "Pawn":
-                        moves = []
-
-                assert isinstance(moves, list)
-                assert isinstance(captures, list)
-                assert isinstance(defending, list)
-
-                for position in moves + captures + defending:
-                    if position.x == 5 and position.y == 1:
-                        logging.warning(f"Setting {position} to {colour} control")
-                    self.squares[position.x][position.y].control[colour] = True
\ No newline at end of file
+    def _set_piece_control(self, square : int):
+        "Recompute the attack set of the piece on square and adjust the attacker counts it changes"
+        bitboard = self.bitboard
+        old_colour = self._piece_control_colour[square]
+        old = self._piece_control[square]
+
+        occupant = bitboard.mailbox[square]
+        if occupant is None:
+            colour = None
+            new = 0
+        else:
+            colour, rank = occupant
+            # Attacks go through the enemy king so it can't step back along the line it is attacked on
+            occupied = bitboard.occupied & ~bitboard.pieces[colour ^ 1][KING]
+            new = piece_attacks(colour, rank, square, occupied)
+
+        if colour != old_colour:
+            # Different owner, every old attack is lost and every new one gained
+            lost, gained = old, new
+        else:
+            lost, gained = old & ~new, new & ~old
+
+        if lost:
+            name = COLOUR_NAMES[old_colour]
+            for target in iter_squares(lost):
+                self._square_list[target].control[name] -= 1
+        if gained:
+            name = COLOUR_NAMES[colour]
+            for target in iter_squares(gained):
+                self._square_list[target].control[name] += 1
+
+        self._piece_control[square] = new
+        self._piece_control_colour[square] = colour
+
+    def _update_square_control(self, changed : int):
+        """Bring square control up to date after the squares in changed gained or lost a piece.
+        Only the pieces on changed squares and the sliders whose attacks reach one of them
+        can attack anything different, leapers elsewhere attack the same squares whatever
+        the occupancy, so nothing else is recomputed"""
+        affected = changed
+        for colour_pieces in self.bitboard.pieces:
+            sliders = (colour_pieces[BISHOP] | colour_pieces[ROOK] | colour_pieces[QUEEN]) & ~changed
+            for square in iter_squares(sliders):
+                if self._piece_control[square] & changed:
+                    affected |= 1 << square
+
+        for square in iter_squares(affected):
+            self._set_piece_control(square)
+
+
+# Hot paths, timed only while instrumentation is on
+timed(ChessBoard, "make_move", "board.make_move")
+timed(ChessBoard, "unmake_move", "board.unmake_move")
+timed(ChessBoard, "_update_square_control", "control.update")
+counted(ChessBoard, "_capture", "board.captures")
@@ -1,22 +1,19 @@
 BLACK = (0, 0, 0)
 MOVE_COLOUR = (0 , 255, 0) # Green
 CAPTURE_COLOUR = (255, 0, 0) # Red
+BOOK_COLOUR = (0, 0, 255) # Blue
+PROMOTION_COLOUR = (55, 55, 55) # Grey
+STATS_TEXT_COLOUR = (255, 255, 255)
+STATS_BACKGROUND = (0, 0, 0)
 BLACK_SQUARE = (235, 149, 52)
 WHITE_SQUARE = (240, 221, 199)
 WINDOW_WIDTH = 1024
 WINDOW_HEIGHT = 1024
 FRAMES_PER_SECOND = 30
+ANIMATION_FRAMES_PER_SECOND = 60
+MOVE_ANIMATION_SECONDS = 0.2
 IMAGE_PIECE_WIDTH = 60
 PIECE_SIZE = 128
 SQUARE_SIZE = 128
-
-PINNABLE_VECTORS = set([
-    (0, 1),
-    (1, 1),
-    (1, 0),
-    (1, -1),
-    (0, -1),
-    (-1, -1),
-    (-1, 0),
-    (-1, 1)
-])
\ No newline at end of file
+STATS_FONT_SIZE = 24
+SERVER_PORT = 8765
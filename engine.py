@@ -0,0 +1,421 @@
+"""Computer opponent: iterative deepening alpha-beta search over the bitboard core.
+
+    engine = Engine(hash_mb = 16)
+    result = engine.search(board.bitboard, movetime = 1.0)
+    result.best_move, result.pv, result.nodes, result.nps
+
+The search works on its own copy of the board, so the caller's board is never
+touched and the search can be stopped from another thread with Engine.stop().
+"""
+import time
+from collections import namedtuple
+from bitboard import *
+from tablebase import default_tablebases
+from transposition import TranspositionTable
+
+INFINITY = 1000000
+MATE = 100000
+MAX_PLY = 64
+# Scores beyond this are mate scores, stored in the table relative to the node they were found at.
+# Tablebase mates can be up to MAX_PLY plies past the deepest node, hence the room for two
+MATE_BOUND = MATE - 2 * MAX_PLY
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# How often, in nodes, the clock and the stop flag are looked at, a node limit is kept exactly
+CHECK_INTERVAL = 1024
+
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)
+
+SearchResult = namedtuple("SearchResult", ["best_move", "score", "depth", "pv", "nodes", "seconds", "nps"])
+
+
+class SearchAborted(Exception):
+    "Raised inside the search when the time, node limit or stop flag is hit"
+    pass
+
+
+# Piece-square tables from White's point of view, written with rank 8 at the top
+_PAWN_TABLE = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+     5,  5, 10, 25, 25, 10,  5,  5,
+     0,  0,  0, 20, 20,  0,  0,  0,
+     5, -5,-10,  0,  0,-10, -5,  5,
+     5, 10, 10,-20,-20, 10, 10,  5,
+     0,  0,  0,  0,  0,  0,  0,  0
+]
+_KNIGHT_TABLE = [
+   -50,-40,-30,-30,-30,-30,-40,-50,
+   -40,-20,  0,  0,  0,  0,-20,-40,
+   -30,  0, 10, 15, 15, 10,  0,-30,
+   -30,  5, 15, 20, 20, 15,  5,-30,
+   -30,  0, 15, 20, 20, 15,  0,-30,
+   -30,  5, 10, 15, 15, 10,  5,-30,
+   -40,-20,  0,  5,  5,  0,-20,-40,
+   -50,-40,-30,-30,-30,-30,-40,-50
+]
+_BISHOP_TABLE = [
+   -20,-10,-10,-10,-10,-10,-10,-20,
+   -10,  0,  0,  0,  0,  0,  0,-10,
+   -10,  0,  5, 10, 10,  5,  0,-10,
+   -10,  5,  5, 10, 10,  5,  5,-10,
+   -10,  0, 10, 10, 10, 10,  0,-10,
+   -10, 10, 10, 10, 10, 10, 10,-10,
+   -10,  5,  0,  0,  0,  0,  5,-10,
+   -20,-10,-10,-10,-10,-10,-10,-20
+]
+_ROOK_TABLE = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+     5, 10, 10, 10, 10, 10, 10,  5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+     0,  0,  0,  5,  5,  0,  0,  0
+]
+_QUEEN_TABLE = [
+   -20,-10,-10, -5, -5,-10,-10,-20,
+   -10,  0,  0,  0,  0,  0,  0,-10,
+   -10,  0,  5,  5,  5,  5,  0,-10,
+    -5,  0,  5,  5,  5,  5,  0, -5,
+     0,  0,  5,  5,  5,  5,  0, -5,
+   -10,  5,  5,  5,  5,  5,  0,-10,
+   -10,  0,  5,  0,  0,  0,  0,-10,
+   -20,-10,-10, -5, -5,-10,-10,-20
+]
+_KING_MIDDLE_TABLE = [
+   -30,-40,-40,-50,-50,-40,-40,-30,
+   -30,-40,-40,-50,-50,-40,-40,-30,
+   -30,-40,-40,-50,-50,-40,-40,-30,
+   -30,-40,-40,-50,-50,-40,-40,-30,
+   -20,-30,-30,-40,-40,-30,-30,-20,
+   -10,-20,-20,-20,-20,-20,-20,-10,
+    20, 20,  0,  0,  0,  0, 20, 20,
+    20, 30, 10,  0,  0, 10, 30, 20
+]
+_KING_END_TABLE = [
+   -50,-40,-30,-20,-20,-30,-40,-50,
+   -30,-20,-10,  0,  0,-10,-20,-30,
+   -30,-10, 20, 30, 30, 20,-10,-30,
+   -30,-10, 30, 40, 40, 30,-10,-30,
+   -30,-10, 30, 40, 40, 30,-10,-30,
+   -30,-10, 20, 30, 30, 20,-10,-30,
+   -30,-30,  0,  0,  0,  0,-30,-30,
+   -50,-30,-30,-30,-30,-30,-30,-50
+]
+
+def _square_tables(table, value):
+    "Per colour lists indexed by bitboard square, with the piece value folded in"
+    white = [value + table[(7 - (square >> 3)) * 8 + (square & 7)] for square in range(64)]
+    black = [value + table[square] for square in range(64)]
+    return white, black
+
+_tables = [_PAWN_TABLE, _KNIGHT_TABLE, _BISHOP_TABLE, _ROOK_TABLE, _QUEEN_TABLE, _KING_MIDDLE_TABLE]
+# PIECE_SQUARE[colour][rank][square]
+PIECE_SQUARE = [[None] * 6, [None] * 6]
+for _rank, _table in enumerate(_tables):
+    PIECE_SQUARE[WHITE_COLOUR][_rank], PIECE_SQUARE[BLACK_COLOUR][_rank] = _square_tables(_table, PIECE_VALUES[_rank])
+KING_END_SQUARE = _square_tables(_KING_END_TABLE, 0)
+del _rank, _table, _tables
+
+# Game phase weights, 24 with all minor and major pieces on the board
+PHASE_WEIGHTS = (0, 1, 1, 2, 4, 0)
+MAX_PHASE = 24
+
+
+def evaluate(board : BitBoard) -> int:
+    "Static evaluation in centipawns from the side to move's point of view"
+    scores = [0, 0]
+    king_middle = [0, 0]
+    king_end = [0, 0]
+    phase = 0
+    for colour in (WHITE_COLOUR, BLACK_COLOUR):
+        pieces = board.pieces[colour]
+        tables = PIECE_SQUARE[colour]
+        score = 0
+        for rank in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN):
+            table = tables[rank]
+            for square in iter_squares(pieces[rank]):
+                score += table[square]
+                phase += PHASE_WEIGHTS[rank]
+        scores[colour] = score
+        king = board.king_square(colour)
+        if king >= 0:
+            king_middle[colour] = tables[KING][king]
+            king_end[colour] = KING_END_SQUARE[colour][king]
+
+    # Blend the king tables by how much material is left
+    phase = min(phase, MAX_PHASE)
+    for colour in (WHITE_COLOUR, BLACK_COLOUR):
+        scores[colour] += (king_middle[colour] * phase + king_end[colour] * (MAX_PHASE - phase)) // MAX_PHASE
+
+    score = scores[WHITE_COLOUR] - scores[BLACK_COLOUR]
+    return score if board.turn == WHITE_COLOUR else -score
+
+
+class Engine:
+
+    def __init__(self, hash_mb : float = 16, tablebases = None):
+        self.table = TranspositionTable(hash_mb)
+        # Endgame tables probed at the root and in the tree, Tablebases() for none
+        self.tablebases = default_tablebases() if tablebases is None else tablebases
+        self.stopped = False
+        self.nodes = 0
+        self._deadline = None
+        self._node_limit = None
+        self._next_check = CHECK_INTERVAL
+        self._should_stop = None
+        self._pv = [[0] * MAX_PLY for _ in range(MAX_PLY)]
+        self._pv_length = [0] * MAX_PLY
+        self._killers = [[0, 0] for _ in range(MAX_PLY)]
+        self._history = [0] * 4096
+
+    def stop(self) -> None:
+        "Ask a running search to return as soon as possible, safe to call from another thread"
+        self.stopped = True
+
+    def new_game(self) -> None:
+        self.table.clear()
+        self._history = [0] * 4096
+
+    def search(self, board : BitBoard, depth : int = None, nodes : int = None, movetime : float = None,
+               on_iteration = None, should_stop = None, full_depth : bool = False) -> SearchResult:
+        """Searches board with iterative deepening until depth, nodes or movetime (seconds) runs out.
+        With no limit at all it searches until stop() is called or MAX_PLY is reached.
+        on_iteration is called with the SearchResult of every completed depth, should_stop is
+        polled with the clock and ends the search when it returns true. With full_depth a position
+        with one legal move is still searched to depth, so its score can be compared with others"""
+        board = board.copy()
+        start = time.perf_counter()
+        self.stopped = False
+        self._should_stop = should_stop
+        self.nodes = 0
+        self._deadline = start + movetime if movetime else None
+        self._node_limit = nodes
+        self._next_check = CHECK_INTERVAL if nodes is None else min(CHECK_INTERVAL, nodes)
+        self._killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.table.new_search()
+
+        root_moves = board.generate_moves()
+        if not root_moves:
+            score = -MATE if board.in_check() else 0
+            return SearchResult(None, score, 0, [], 0, 0.0, 0.0)
+
+        found = self.tablebases.best_move(board) if self.tablebases else None
+        if found is not None:
+            move, probe = found
+            result = SearchResult(move, _tablebase_score(probe, 0), 1, [move], 0, 0.0, 0.0)
+            if on_iteration is not None:
+                on_iteration(result)
+            seconds = time.perf_counter() - start
+            return result._replace(seconds = seconds)
+
+        # Always have a move to play, even if the first iteration is cut short
+        result = SearchResult(root_moves[0], 0, 0, [root_moves[0]], 0, 0.0, 0.0)
+        max_depth = min(depth or MAX_PLY - 1, MAX_PLY - 1)
+        for current_depth in range(1, max_depth + 1):
+            try:
+                score = self._negamax(board, current_depth, -INFINITY, INFINITY, 0)
+            except SearchAborted:
+                break
+
+            seconds = time.perf_counter() - start
+            pv = self._pv[0][:self._pv_length[0]]
+            result = SearchResult(pv[0] if pv else result.best_move, score, current_depth, pv, self.nodes,
+                                  seconds, self.nodes / seconds if seconds > 0 else 0.0)
+            if on_iteration is not None:
+                on_iteration(result)
+
+            if abs(score) >= MATE_BOUND or (len(root_moves) == 1 and not full_depth):
+                break
+            # The next depth takes several times longer than this one, don't start what can't finish
+            if self._deadline is not None and time.perf_counter() + 2 * seconds > self._deadline:
+                break
+
+        seconds = time.perf_counter() - start
+        return result._replace(nodes = self.nodes, seconds = seconds, nps = self.nodes / seconds if seconds > 0 else 0.0)
+
+    def _check_limits(self) -> None:
+        if self.stopped:
+            raise SearchAborted()
+        if self._should_stop is not None and self._should_stop():
+            raise SearchAborted()
+        if self._node_limit is not None and self.nodes >= self._node_limit:
+            raise SearchAborted()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchAborted()
+        self._next_check = self.nodes + CHECK_INTERVAL
+        if self._node_limit is not None:
+            self._next_check = min(self._next_check, self._node_limit)
+
+    def _is_draw(self, board : BitBoard) -> bool:
+        "Fifty move rule or the position has occurred before since the last irreversible move"
+        if board.halfmove >= 100:
+            return True
+        history = board.history
+        oldest = max(len(history) - board.halfmove, 0)
+        for index in range(len(history) - 4, oldest - 1, -2):
+            if history[index][5] == board.hash:
+                return True
+        return False
+
+    def _order_moves(self, board : BitBoard, moves : list, tt_move : int, ply : int) -> None:
+        mailbox = board.mailbox
+        killers = self._killers[ply]
+        history = self._history
+        en_passant = board.en_passant
+
+        def score(move):
+            if move == tt_move:
+                return 10000000
+            to_square = (move >> 6) & 63
+            victim = mailbox[to_square]
+            attacker = mailbox[move & 63][1]
+            if victim is not None:
+                # Most valuable victim, least valuable attacker
+                return 1000000 + PIECE_VALUES[victim[1]] * 10 - attacker
+            if attacker == PAWN and to_square == en_passant:
+                return 1000000 + PIECE_VALUES[PAWN] * 10
+            if move >> 12:
+                return 900000 + (move >> 12)
+            if move == killers[0]:
+                return 800000
+            if move == killers[1]:
+                return 700000
+            return history[move & 4095]
+
+        moves.sort(key = score, reverse = True)
+
+    def _negamax(self, board : BitBoard, depth : int, alpha : int, beta : int, ply : int) -> int:
+        self._pv_length[ply] = ply
+        if ply and self._is_draw(board):
+            return 0
+        if ply >= MAX_PLY - 1:
+            return evaluate(board)
+        if ply and self.tablebases:
+            probe = self.tablebases.probe(board)
+            if probe is not None:
+                self.nodes += 1
+                if self.nodes >= self._next_check:
+                    self._check_limits()
+                return _tablebase_score(probe, ply)
+
+        in_check = board.in_check()
+        if in_check:
+            # Check extension, don't drop into quiescence while in check
+            depth += 1
+        if depth <= 0:
+            return self._quiescence(board, alpha, beta, ply)
+
+        self.nodes += 1
+        if self.nodes >= self._next_check:
+            self._check_limits()
+
+        tt_move = 0
+        entry = self.table.probe(board.hash)
+        if entry is not None:
+            entry_depth, packed = entry
+            tt_score, flag, tt_move = packed >> 18, (packed >> 16) & 3, packed & 0xFFFF
+            if ply and entry_depth >= depth:
+                tt_score = _score_from_table(tt_score, ply)
+                if flag == EXACT:
+                    return tt_score
+                if flag == LOWER_BOUND and tt_score >= beta:
+                    return tt_score
+                if flag == UPPER_BOUND and tt_score <= alpha:
+                    return tt_score
+
+        moves = board.generate_moves()
+        if not moves:
+            return -MATE + ply if in_check else 0
+        self._order_moves(board, moves, tt_move, ply)
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = 0
+        for move in moves:
+            board.make_move(move)
+            score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    # Principal variation is this move followed by the child's
+                    pv = self._pv[ply]
+                    pv[ply] = move
+                    child_length = self._pv_length[ply + 1]
+                    pv[ply + 1:child_length] = self._pv[ply + 1][ply + 1:child_length]
+                    self._pv_length[ply] = max(child_length, ply + 1)
+                    if alpha >= beta:
+                        if board.mailbox[(move >> 6) & 63] is None and not move >> 12:
+                            killers = self._killers[ply]
+                            if killers[0] != move:
+                                killers[1] = killers[0]
+                                killers[0] = move
+                            self._history[move & 4095] += depth * depth
+                        break
+
+        if best_score >= beta:
+            flag = LOWER_BOUND
+        elif best_score > original_alpha:
+            flag = EXACT
+        else:
+            flag = UPPER_BOUND
+        # Score, bound and move packed into the one int a table slot holds
+        self.table.store(board.hash, depth, (_score_to_table(best_score, ply) << 18) | (flag << 16) | best_move)
+        return best_score
+
+    def _quiescence(self, board : BitBoard, alpha : int, beta : int, ply : int) -> int:
+        "Only look at captures and promotions until the position is quiet"
+        self.nodes += 1
+        if self.nodes >= self._next_check:
+            self._check_limits()
+
+        stand_pat = evaluate(board)
+        if stand_pat >= beta or ply >= MAX_PLY - 1:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        moves = board.generate_moves(captures_only = True)
+        self._order_moves(board, moves, 0, ply)
+        for move in moves:
+            board.make_move(move)
+            score = -self._quiescence(board, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+
+def _tablebase_score(probe, ply : int) -> int:
+    if probe.wdl > 0:
+        return MATE - ply - probe.dtm
+    if probe.wdl < 0:
+        return -MATE + ply + probe.dtm
+    return 0
+
+def _score_to_table(score : int, ply : int) -> int:
+    "Mate scores are stored as distance from this node rather than from the root"
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+def _score_from_table(score : int, ply : int) -> int:
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
@@ -0,0 +1,201 @@
+"""Streams EPD test suites and checks each position's best move or perft counts.
+
+Run from the command line, e.g.
+
+    python epd.py suite.epd --depth 6
+    python epd.py perftsuite.epd --perft-depth 4 --workers 4
+    python epd.py suite.epd --movetime 0.5 --failures-only
+
+The file is read a line at a time, so suites of any size run in constant
+memory. Every line is reported as it finishes, in file order, with an overall
+positions per second figure at the end.
+
+Opcodes understood:
+    bm / am     best move / avoid move in SAN, checked with an engine search
+    D1 .. Dn    perft node count at that depth (the perftsuite.epd layout)
+    perft       "perft <depth> <nodes>"
+Lines with none of these are only checked to load.
+"""
+import argparse
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import BitBoard
+from notation import move_to_san, parse_san
+from perft import perft
+
+# Lines handed to each worker per task, and tasks kept queued per worker, so memory stays bounded
+LINES_PER_TASK = 16
+TASKS_PER_WORKER = 4
+
+
+def parse_epd(line : str):
+    """Splits an EPD line into a FEN and its operations, {opcode : [operands]}.
+    Both the standard "pieces side castling ep op operands;" layout and the
+    perftsuite "full FEN ;D1 20 ;D2 400" layout are accepted"""
+    head, _, tail = line.partition(";")
+    tokens = head.split()
+    if len(tokens) < 4:
+        raise ValueError(f"EPD needs at least 4 fields: {line.strip()}")
+    fen_fields = tokens[:4]
+    rest = tokens[4:]
+    # Optional clocks, as in a full FEN
+    if len(rest) >= 2 and rest[0].isdigit() and rest[1].isdigit():
+        fen_fields += rest[:2]
+        rest = rest[2:]
+
+    operations = {}
+    for text in [" ".join(rest)] + tail.split(";"):
+        parts = text.split()
+        if parts:
+            operations[parts[0]] = [part.strip('"') for part in parts[1:]]
+    return " ".join(fen_fields), operations
+
+
+class Checker:
+    "Checks EPD lines, holding an engine between lines so its tables are only allocated once"
+
+    def __init__(self, depth : int = None, movetime : float = None, perft_depth : int = 3, hash_mb : float = 16):
+        self.depth = depth
+        self.movetime = movetime
+        self.perft_depth = perft_depth
+        self.hash_mb = hash_mb
+        self._engine = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from engine import Engine
+            self._engine = Engine(self.hash_mb)
+        return self._engine
+
+    def check(self, line : str) -> list:
+        "Returns the failures for one EPD line, empty if it passed"
+        line = line.strip()
+        if not line or line.startswith("#"):
+            return []
+        try:
+            fen, operations = parse_epd(line)
+            board = BitBoard.from_fen(fen)
+            perft_counts = {int(opcode[1:]) : int(operands[0]) for opcode, operands in operations.items()
+                            if opcode[:1] == "D" and opcode[1:].isdigit() and operands}
+            if "perft" in operations and len(operations["perft"]) >= 2:
+                perft_counts[int(operations["perft"][0])] = int(operations["perft"][1])
+        except ValueError as error:
+            return [str(error)]
+
+        failures = []
+        for depth, expected in sorted(perft_counts.items()):
+            if depth > self.perft_depth:
+                break
+            nodes = perft(board, depth)
+            if nodes != expected:
+                failures.append(f"perft {depth}: {nodes} nodes, expected {expected}")
+
+        if "bm" in operations or "am" in operations:
+            failures += self._check_best_move(board, operations)
+        return failures
+
+    def _check_best_move(self, board : BitBoard, operations : dict) -> list:
+        legal_moves = board.generate_moves()
+        try:
+            best = [parse_san(board, text, legal_moves) for text in operations.get("bm", [])]
+            avoid = [parse_san(board, text, legal_moves) for text in operations.get("am", [])]
+        except ValueError as error:
+            return [str(error)]
+
+        self.engine.new_game()
+        result = self.engine.search(board, depth = self.depth, movetime = self.movetime)
+        if result.best_move is None:
+            return ["no legal moves to search"]
+        played = move_to_san(board, result.best_move, legal_moves)
+        if best and result.best_move not in best:
+            return [f"played {played}, expected {' '.join(operations['bm'])}"]
+        if result.best_move in avoid:
+            return [f"played {played}, which is to be avoided"]
+        return []
+
+
+_checker = None
+
+def _init_worker(options : dict) -> None:
+    global _checker
+    _checker = Checker(**options)
+
+def _check_lines(lines : list) -> list:
+    return [_checker.check(line) for line in lines]
+
+def _batches(lines, size : int):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def run(lines, workers : int = 1, **options):
+    """Checks every EPD line from the iterable lines, yielding (line number, line, failures) in order.
+    With more than one worker, batches of lines are checked in a process pool, only a few batches
+    ahead of the one being reported so the input is never read far ahead"""
+    numbered = enumerate(lines, 1)
+    if workers <= 1:
+        checker = Checker(**options)
+        for number, line in numbered:
+            yield number, line, checker.check(line)
+        return
+
+    with ProcessPoolExecutor(max_workers = workers, initializer = _init_worker, initargs = (options,)) as pool:
+        pending = deque()
+        for batch in _batches(numbered, LINES_PER_TASK):
+            pending.append((batch, pool.submit(_check_lines, [line for _, line in batch])))
+            # Report the oldest batch once enough work is queued behind it
+            while len(pending) >= workers * TASKS_PER_WORKER:
+                yield from _finish(*pending.popleft())
+        while pending:
+            yield from _finish(*pending.popleft())
+
+def _finish(batch, future):
+    for (number, line), failures in zip(batch, future.result()):
+        yield number, line, failures
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(description = "EPD test suite runner")
+    parser.add_argument("file", help = "EPD file, - for standard input")
+    parser.add_argument("--depth", type = int, help = "search depth for bm/am positions")
+    parser.add_argument("--movetime", type = float, help = "seconds to search bm/am positions")
+    parser.add_argument("--perft-depth", type = int, default = 3, help = "deepest perft count to check")
+    parser.add_argument("--hash", type = float, default = 16, metavar = "MB", help = "engine transposition table size")
+    parser.add_argument("--workers", type = int, default = 1, help = "processes to check lines in")
+    parser.add_argument("--failures-only", action = "store_true", help = "only print lines that failed")
+    args = parser.parse_args(argv)
+    if args.depth is None and args.movetime is None:
+        args.depth = 4
+
+    options = {"depth" : args.depth, "movetime" : args.movetime, "perft_depth" : args.perft_depth, "hash_mb" : args.hash}
+    file = sys.stdin if args.file == "-" else open(args.file)
+    start = time.perf_counter()
+    total = failed = 0
+    try:
+        for number, line, failures in run(file, args.workers, **options):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            total += 1
+            if failures:
+                failed += 1
+                print(f"line {number}: FAILED {'; '.join(failures)}")
+            elif not args.failures_only:
+                print(f"line {number}: ok")
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+    seconds = time.perf_counter() - start
+    print(f"{total} positions, {failed} failed, {seconds:.2f}s ({total / seconds if seconds > 0 else 0:,.1f} positions/s)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Measures how much memory each hosted game costs, with tracemalloc.
+
+Run from the command line, e.g.
+
+    python game_memory.py --games 200
+    python game_memory.py --games 200 --plies 40 --top 10
+
+Games are set up the way server.py sets them up (a PieceManager and ChessBoard
+each, nothing drawn) and random legal moves are played on every one, so the
+move caches and undo stacks hold something. Everything allocated while doing
+so is counted and divided by the number of games; --top lists the source lines
+that allocated most.
+"""
+import argparse
+import random
+import tracemalloc
+
+from board import *
+
+
+def measure(games : int, plies : int, seed : int = 0):
+    "Sets up games games of plies random moves, returns (bytes per game, tracemalloc snapshot)"
+    rng = random.Random(seed)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = []
+    for _ in range(games):
+        manager = PieceManager()
+        board = ChessBoard(8, manager)
+        board.setup()
+        for _ in range(plies):
+            moves = board.bitboard.generate_moves()
+            if not moves:
+                break
+            move = rng.choice(moves)
+            board.make_move(move)
+            # As the GUI and server do after every move: look for mate, which fills the move cache
+            board.square_from_position(square_to_position(move_to(move))).piece._post_move()
+        kept.append(board)
+    used = tracemalloc.get_traced_memory()[0] - before
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return used / games, snapshot
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Memory used per game, measured with tracemalloc")
+    parser.add_argument("--games", type = int, default = 100)
+    parser.add_argument("--plies", type = int, default = 10, help = "random moves played in each game")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--top", type = int, default = 0, metavar = "N", help = "also list the N lines that allocated most")
+    args = parser.parse_args(argv)
+
+    per_game, snapshot = measure(args.games, args.plies, args.seed)
+    print(f"{args.games} games of {args.plies} plies: {per_game / 1024:.1f} KiB per game")
+    for stat in snapshot.statistics("lineno")[:args.top]:
+        print(stat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Counters and timers for the hot paths, off unless asked for.
+
+Methods are instrumented by name with timed(Class, "method", "stat name"),
+or counted(...) to just count their calls. While instrumentation is off they
+are left exactly as written, so nothing at all is paid for them; enable()
+swaps in the wrappers and disable() puts the originals back. Timings are inclusive, a timed method that calls another
+timed method is charged for both.
+
+Turn it on with
+
+    python main.py --stats                  on-screen overlay
+    python main.py --stats-file stats.json  written when the game closes
+    CHESS_STATS=1 python server.py          any tool, from the start
+    CHESS_STATS_FILE=stats.json python ...  the same, written at exit
+"""
+import atexit
+import json
+import os
+import time
+from functools import wraps
+
+enabled = False
+
+# Stat name : [calls, total seconds, slowest call in seconds]
+timers = {}
+# Stat name : count
+counters = {}
+# Everything timed() and counted() have been asked to wrap:
+# (class, method name, stat name, original function, wrapper factory)
+_targets = []
+
+
+def _register(owner, attribute : str, name : str, make_wrapper) -> None:
+    original = owner.__dict__[attribute]
+    _targets.append((owner, attribute, name, original, make_wrapper))
+    if enabled:
+        setattr(owner, attribute, make_wrapper(original, name))
+
+def timed(owner, attribute : str, name : str) -> None:
+    "Times every call of owner.attribute as name while instrumentation is on"
+    _register(owner, attribute, name, _timing_wrapper)
+
+def counted(owner, attribute : str, name : str) -> None:
+    "Counts every call of owner.attribute as name while instrumentation is on"
+    _register(owner, attribute, name, _counting_wrapper)
+
+def _timing_wrapper(function, name : str):
+    stats = timers.setdefault(name, [0, 0.0, 0.0])
+    clock = time.perf_counter
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = clock() - start
+            stats[0] += 1
+            stats[1] += elapsed
+            if elapsed > stats[2]:
+                stats[2] = elapsed
+    return wrapper
+
+def _counting_wrapper(function, name : str):
+    counters.setdefault(name, 0)
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        counters[name] += 1
+        return function(*args, **kwargs)
+    return wrapper
+
+def record(name : str, seconds : float) -> None:
+    "Adds a timing measured by the caller, e.g. a whole frame"
+    if enabled:
+        stats = timers.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+
+def enable() -> None:
+    global enabled
+    if enabled:
+        return
+    enabled = True
+    for owner, attribute, name, original, make_wrapper in _targets:
+        setattr(owner, attribute, make_wrapper(original, name))
+
+def disable() -> None:
+    global enabled
+    enabled = False
+    for owner, attribute, name, original, _ in _targets:
+        setattr(owner, attribute, original)
+
+def reset() -> None:
+    # Wrappers hold on to their lists and names, so they are zeroed rather than replaced
+    for stats in timers.values():
+        stats[:] = [0, 0.0, 0.0]
+    for name in counters:
+        counters[name] = 0
+
+def snapshot() -> dict:
+    return {
+        "timers" : {name : {"calls" : calls, "seconds" : total, "max_seconds" : slowest}
+                    for name, (calls, total, slowest) in timers.items()},
+        "counters" : dict(counters)
+    }
+
+def report() -> list:
+    "One line per stat, the most expensive timers first"
+    lines = []
+    for name, (calls, total, slowest) in sorted(timers.items(), key = lambda item: -item[1][1]):
+        if calls:
+            lines.append(f"{name}: {calls} calls, {total * 1000:.1f}ms, "
+                         f"mean {total / calls * 1e6:.0f}us, max {slowest * 1000:.2f}ms")
+    lines += [f"{name}: {value}" for name, value in sorted(counters.items()) if value]
+    return lines
+
+def dump(path : str) -> None:
+    "Writes every stat to path as JSON"
+    with open(path, "w") as file:
+        json.dump(snapshot(), file, indent = 4)
+
+def dump_at_exit(path : str) -> None:
+    atexit.register(dump, path)
+
+if os.environ.get("CHESS_STATS") or os.environ.get("CHESS_STATS_FILE"):
+    enabled = True
+    if os.environ.get("CHESS_STATS_FILE"):
+        dump_at_exit(os.environ["CHESS_STATS_FILE"])
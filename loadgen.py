@@ -0,0 +1,88 @@
+"""Load generator for server.py.
+
+Run from the command line against a running server, e.g.
+
+    python loadgen.py --games 100 --seconds 30
+    python loadgen.py --unix /tmp/chess.sock --games 1000
+
+Each simulated player opens its own connection and game and plays random legal
+moves as fast as the server answers, starting a new game whenever one ends.
+Move latency is timed from sending the move to reading its reply, and the
+p50/p99 latency and moves per second over all games are reported at the end.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from constants import SERVER_PORT
+
+# Plies after which a game is abandoned and a new one started
+MAX_PLIES = 200
+
+
+async def _request(reader, writer, request : dict) -> dict:
+    writer.write((json.dumps(request) + "\n").encode())
+    await writer.drain()
+    reply = json.loads(await reader.readline())
+    if not reply.get("ok"):
+        raise RuntimeError(reply.get("error"))
+    return reply
+
+async def player(connect, deadline : float, latencies : list, rng : random.Random):
+    "Plays random games on one connection until deadline, appending every move's latency"
+    reader, writer = await connect()
+    games = 0
+    try:
+        while time.perf_counter() < deadline:
+            game = await _request(reader, writer, {"op" : "new"})
+            games += 1
+            legal = game["legal"]
+            for _ in range(MAX_PLIES):
+                if not legal or time.perf_counter() >= deadline:
+                    break
+                start = time.perf_counter()
+                reply = await _request(reader, writer, {"op" : "move", "game" : game["game"], "move" : rng.choice(legal)})
+                latencies.append(time.perf_counter() - start)
+                legal = reply["legal"]
+            await _request(reader, writer, {"op" : "close", "game" : game["game"]})
+    finally:
+        writer.close()
+    return games
+
+def percentile(values : list, fraction : float) -> float:
+    "Nearest rank percentile of values, which must be sorted"
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+async def run(games : int, seconds : float, host : str, port : int, unix : str = None, seed : int = 0):
+    "Runs games concurrent players for seconds, returns (games played, sorted move latencies, seconds taken)"
+    if unix:
+        connect = lambda: asyncio.open_unix_connection(unix, limit = 1 << 20)
+    else:
+        connect = lambda: asyncio.open_connection(host, port, limit = 1 << 20)
+    latencies = []
+    start = time.perf_counter()
+    deadline = start + seconds
+    played = await asyncio.gather(*(player(connect, deadline, latencies, random.Random(seed + index)) for index in range(games)))
+    return sum(played), sorted(latencies), time.perf_counter() - start
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Load generator for the chess game server")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = SERVER_PORT)
+    parser.add_argument("--unix", metavar = "PATH", help = "connect to a Unix socket instead of TCP")
+    parser.add_argument("--games", type = int, default = 10, help = "concurrent games")
+    parser.add_argument("--seconds", type = float, default = 10)
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args(argv)
+
+    games, latencies, seconds = asyncio.run(run(args.games, args.seconds, args.host, args.port, args.unix, args.seed))
+    print(f"{args.games} concurrent games, {games} started, {len(latencies)} moves in {seconds:.1f}s "
+          f"({len(latencies) / seconds:,.1f} moves/s)")
+    print(f"move latency p50 {percentile(latencies, 0.5) * 1000:.1f}ms, p99 {percentile(latencies, 0.99) * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
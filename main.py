@@ -3,41 +3,155 @@ from constants import *
 from piece import *
 from utils import *
 from window import *
+from worker import SearchWorker
+from book import OpeningBook
+import argparse
+import instrument
+import logging
 import sys
+import time
 
-piece_manager = PieceManager()
-board = ChessBoard(8, piece_manager)
-board.setup()
+# Seconds between frame time reports
+FRAME_REPORT_SECONDS = 10
+# How often the --stats overlay is brought up to date, even when nothing else is drawn
+STATS_REFRESH_SECONDS = 0.5
 
-for i, column in enumerate(board.squares):
-    print(i)
-    for square in column:
-        if square.piece:
-            print(square.piece)
+def main():
+    parser = argparse.ArgumentParser(description = "Pygame chess")
+    parser.add_argument("--computer", choices = ["White", "Black"], help = "colour played by the computer")
+    parser.add_argument("--movetime", type = float, default = 1.0, help = "seconds the computer thinks per move")
+    parser.add_argument("--hash", type = float, default = 32, metavar = "MB", help = "computer transposition table size")
+    parser.add_argument("--thread", action = "store_true", help = "think in a thread instead of a separate process")
+    parser.add_argument("--workers", type = int, default = 1, help = "processes the computer searches root moves on")
+    parser.add_argument("--fen", help = "start from this position instead of the usual one")
+    parser.add_argument("--book", metavar = "PATH", help = "Polyglot opening book the computer plays from and the board highlights")
+    parser.add_argument("--fixed-rate", action = "store_true",
+                        help = f"redraw the whole board {FRAMES_PER_SECOND} times a second instead of waiting for something to change")
+    parser.add_argument("--stats", action = "store_true", help = "time the hot paths and show the numbers on screen")
+    parser.add_argument("--stats-file", metavar = "PATH", help = "time the hot paths and write the numbers to PATH on exit")
+    args = parser.parse_args()
 
-# Loop forever
-while True:
+    logging.basicConfig(level = logging.INFO)
+    if args.stats or args.stats_file:
+        instrument.enable()
+    if args.stats_file:
+        instrument.dump_at_exit(args.stats_file)
 
-    # Check for and handle events
-    for event in pygame.event.get():
+    # The computer thinks in the background so the window keeps drawing while it does
+    worker = SearchWorker(args.hash, use_process = not args.thread, workers = args.workers) if args.computer else None
+    engine_colour = COLOUR_INDEX[args.computer] if args.computer else None
+    # Position the computer found it had no move in
+    game_over_hash = None
 
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit()
+    window = get_window()
+    clock = get_clock()
+    piece_manager = PieceManager()
+    # Memory-mapped, opening it costs nothing however big it is
+    book = OpeningBook(args.book) if args.book else None
+    piece_manager.book = book
+    if engine_colour is not None:
+        piece_manager.human_colours = {engine_colour ^ 1}
+    board = ChessBoard(8, piece_manager)
+    if args.fen:
+        board.load_fen(args.fen)
+    else:
+        board.setup()
 
-        piece_manager.handle_event(event)
+    for i, column in enumerate(board.squares):
+        print(i)
+        for square in column:
+            if square.piece:
+                print(square.piece)
 
-    # Do any "per frame" actions
+    # Frame times since the last report
+    frame_times = []
+    last_report = time.perf_counter()
+    # Where the stats overlay was last drawn and when
+    overlay = None
+    last_overlay = last_report
 
-    # Clear the window
-    window.fill(BLACK)
+    # Loop forever
+    events = pygame.event.get()
+    while True:
+        frame_start = time.perf_counter()
 
-    # Draw all window elements
-    draw_board()
-    piece_manager.draw()
+        # Handle events
+        for event in events:
 
-    # Update the window
-    pygame.display.update()
+            if event.type == pygame.QUIT:
+                if worker:
+                    worker.close()
+                pygame.quit()
+                sys.exit()
 
-    # Slow things down a bit
-    clock.tick(FRAMES_PER_SECOND)
\ No newline at end of file
+            if event.type == pygame.VIDEOEXPOSE:
+                # The window contents were lost, draw everything again
+                piece_manager.invalidate()
+
+            piece_manager.handle_event(event)
+
+        # Do any "per frame" actions
+        if worker:
+            # Position changed under the search (e.g. a takeback), it's no longer needed
+            if worker.busy and worker.position_hash != board.bitboard.hash:
+                worker.cancel()
+
+            if board.bitboard.turn == engine_colour and not piece_manager.promote and board.bitboard.hash != game_over_hash:
+                if not worker.busy:
+                    book_move = book.choose(board.bitboard) if book else None
+                    if book_move is not None:
+                        logging.info(f"Computer plays {move_to_uci(book_move)} from the book")
+                        piece_manager.play_move(book_move)
+                    else:
+                        worker.start_search(board.bitboard, movetime = args.movetime)
+                result = worker.poll()
+                if result is not None:
+                    if result.best_move is None:
+                        # Game over, don't ask again unless a takeback changes the position
+                        game_over_hash = board.bitboard.hash
+                    else:
+                        logging.info(f"Computer plays {move_to_uci(result.best_move)} score {result.score} "
+                                     f"depth {result.depth} nodes {result.nodes} ({result.nps:,.0f} nps)")
+                        piece_manager.play_move(result.best_move)
+
+        # The overlay is redrawn whenever squares are, and on its own interval so the numbers keep moving
+        if overlay and frame_start - last_overlay >= STATS_REFRESH_SECONDS:
+            # Repaint what is under it first, the new one may be smaller
+            piece_manager.overdrawn(overlay)
+
+        # Redraw only the squares that changed and update just those on the display,
+        # or all of them every tick with --fixed-rate
+        rects = piece_manager.draw() if args.fixed_rate else piece_manager.draw_changed()
+        if rects and args.stats:
+            overlay = draw_stats_overlay(instrument.report())
+            last_overlay = frame_start
+            rects.append(overlay)
+        if rects:
+            pygame.display.update(rects)
+            frame_times.append(time.perf_counter() - frame_start)
+            instrument.record("frame.total", frame_times[-1])
+
+        if frame_times and frame_start - last_report >= FRAME_REPORT_SECONDS:
+            logging.info(f"Drew {len(frame_times)} frames in {frame_start - last_report:.1f}s, "
+                         f"mean {1000 * sum(frame_times) / len(frame_times):.2f}ms, "
+                         f"worst {1000 * max(frame_times):.2f}ms")
+            frame_times.clear()
+            last_report = frame_start
+
+        # Wait for the next frame, sleeping until there is input unless something needs watching
+        if args.fixed_rate:
+            clock.tick(FRAMES_PER_SECOND)
+            events = pygame.event.get()
+        elif piece_manager.animating:
+            clock.tick(ANIMATION_FRAMES_PER_SECOND)
+            events = pygame.event.get()
+        elif worker and worker.busy:
+            # Wake up now and then to collect the computer's move
+            events = wait_for_events(1 / FRAMES_PER_SECOND)
+        elif args.stats:
+            events = wait_for_events(max(0.001, last_overlay + STATS_REFRESH_SECONDS - time.perf_counter()))
+        else:
+            events = wait_for_events()
+
+if __name__ == "__main__":
+    main()
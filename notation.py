@@ -0,0 +1,105 @@
+"""Standard algebraic notation (SAN), as used by PGN games and EPD test suites.
+
+Moves are written and read against the legal moves of a BitBoard, so a SAN
+string that doesn't name exactly one legal move raises ValueError.
+"""
+from bitboard import *
+
+SAN_LETTERS = ("", "N", "B", "R", "Q", "K")
+SAN_RANKS = {"N" : KNIGHT, "B" : BISHOP, "R" : ROOK, "Q" : QUEEN, "K" : KING}
+CASTLING_SAN = {"O-O" : 2, "O-O-O" : -2, "0-0" : 2, "0-0-0" : -2}
+
+
+def move_to_san(board : BitBoard, move : int, legal_moves : list = None) -> str:
+    "Writes a legal move of board in SAN, with + or # if it gives check or mate"
+    from_square = move_from(move)
+    to_square = move_to(move)
+    promotion = move_promotion(move)
+    rank = board.mailbox[from_square][1]
+
+    if rank == KING and abs(to_square - from_square) == 2:
+        text = "O-O" if to_square > from_square else "O-O-O"
+    else:
+        capture = board.mailbox[to_square] is not None or (rank == PAWN and to_square == board.en_passant)
+        if rank == PAWN:
+            text = square_name(from_square)[0] + "x" if capture else ""
+        else:
+            text = SAN_LETTERS[rank]
+            # Name the file, the rank or both when another piece of the same kind could go there too
+            if legal_moves is None:
+                legal_moves = board.generate_moves()
+            rivals = [move_from(other) for other in legal_moves if move_to(other) == to_square
+                      and move_from(other) != from_square and board.mailbox[move_from(other)][1] == rank]
+            if rivals:
+                same_file = any(rival & 7 == from_square & 7 for rival in rivals)
+                same_rank = any(rival >> 3 == from_square >> 3 for rival in rivals)
+                if not same_file:
+                    text += square_name(from_square)[0]
+                elif not same_rank:
+                    text += square_name(from_square)[1]
+                else:
+                    text += square_name(from_square)
+            if capture:
+                text += "x"
+        text += square_name(to_square)
+        if promotion:
+            text += "=" + SAN_LETTERS[promotion]
+
+    board.make_move(move)
+    if board.in_check():
+        text += "#" if not board.generate_moves() else "+"
+    board.unmake_move()
+    return text
+
+def parse_san(board : BitBoard, text : str, legal_moves : list = None) -> int:
+    "Returns the legal move of board that text names, raises ValueError if it names none or several"
+    san = text.rstrip("+#!?")
+    if legal_moves is None:
+        legal_moves = board.generate_moves()
+
+    if san in CASTLING_SAN:
+        king = board.king_square(board.turn)
+        for move in legal_moves:
+            if move_from(move) == king and move_to(move) - king == CASTLING_SAN[san]:
+                return move
+        raise ValueError(f"Illegal move {text}")
+
+    promotion = 0
+    if "=" in san:
+        san, letter = san.split("=", 1)
+        if letter[:1].upper() not in SAN_RANKS:
+            raise ValueError(f"Bad promotion in {text}")
+        promotion = SAN_RANKS[letter[:1].upper()]
+    elif san[-1:] in "NBRQ" and len(san) > 2 and san[-2] in "18":
+        # Promotion written without the =, e.g. e8Q
+        promotion = SAN_RANKS[san[-1]]
+        san = san[:-1]
+
+    rank = PAWN
+    if san[:1] in SAN_RANKS:
+        rank = SAN_RANKS[san[0]]
+        san = san[1:]
+    san = san.replace("x", "").replace("-", "")
+    if len(san) < 2 or san[-2] not in "abcdefgh" or san[-1] not in "12345678":
+        raise ValueError(f"Not a SAN move: {text}")
+    to_square = parse_square(san[-2:])
+    from_file = from_rank = None
+    for char in san[:-2]:
+        if char in "abcdefgh":
+            from_file = ord(char) - ord("a")
+        elif char in "12345678":
+            from_rank = int(char) - 1
+        else:
+            raise ValueError(f"Not a SAN move: {text}")
+
+    found = []
+    for move in legal_moves:
+        from_square = move_from(move)
+        if (move_to(move) == to_square and move_promotion(move) == promotion
+                and board.mailbox[from_square][1] == rank
+                and (from_file is None or from_square & 7 == from_file)
+                and (from_rank is None or from_square >> 3 == from_rank)):
+            found.append(move)
+    if len(found) != 1:
+        raise ValueError(f"{'Ambiguous' if found else 'Illegal'} move {text}")
+    return found[0]
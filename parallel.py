@@ -0,0 +1,202 @@
+"""Spread perft and search over several processes by splitting the root moves.
+
+For perft each worker process is handed the position once, when the pool
+starts, and keeps its own BitBoard; tasks only carry the moves to play from
+it. When there are too few root moves to keep every worker busy, perft splits
+the first two plies instead. Results are merged in root move order, so the
+output does not depend on which worker finished first.
+
+ParallelSearch keeps one pool of engines for as long as it is open and can
+stand in for an Engine, e.g. behind the UCI Threads option or main.py --workers.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from bitboard import BitBoard, move_to_uci
+from engine import Engine, SearchResult, MATE, MATE_BOUND, MAX_PLY
+from perft import perft
+from transposition import TranspositionTable
+
+# Tasks per worker wanted before perft bothers splitting the second ply
+TASKS_PER_WORKER = 4
+# Seconds between looks at the clock and should_stop while a search round runs
+WAIT_INTERVAL = 0.01
+
+_board = None
+_table = None
+_engine = None
+_stop = None
+# ParallelSearch.new_game count this worker's engine has been cleared for
+_game = 0
+
+
+def _init_perft_worker(board : BitBoard, hash_mb : float) -> None:
+    global _board, _table
+    _board = board
+    _table = TranspositionTable(hash_mb) if hash_mb > 0 else None
+
+def _init_search_worker(hash_mb : float, stop) -> None:
+    global _engine, _stop
+    _engine = Engine(hash_mb)
+    _stop = stop
+
+def _perft_task(moves : tuple, depth : int) -> int:
+    for move in moves:
+        _board.make_move(move)
+    nodes = perft(_board, depth, _table)
+    for _ in moves:
+        _board.unmake_move()
+    return nodes
+
+def _search_task(board : BitBoard, move : int, depth : int, game : int):
+    """Score of the root move from the root's point of view searched depth more plies,
+    the line that goes with it, nodes searched and whether it finished"""
+    global _game
+    if game != _game:
+        # First task since ParallelSearch.new_game
+        _engine.new_game()
+        _game = game
+    board.make_move(move)
+    stopped = []
+
+    def should_stop():
+        if _stop.is_set():
+            stopped.append(True)
+            return True
+        return False
+
+    # The score is set against the other root moves', so one legal reply mustn't cut the search short
+    result = _engine.search(board, depth = depth, should_stop = should_stop, full_depth = True)
+
+    score = -result.score
+    # Mate scores count plies from the child, one more from the root
+    if score >= MATE_BOUND:
+        score -= 1
+    elif score <= -MATE_BOUND:
+        score += 1
+    return score, [move] + list(result.pv), result.nodes, not stopped
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+def parallel_divide(board : BitBoard, depth : int, workers : int = None, hash_mb : float = 0) -> dict:
+    """Perft count below each root move, keyed by the move in UCI notation,
+    with the work spread over workers processes"""
+    workers = workers or default_workers()
+    root_moves = board.generate_moves()
+    if depth <= 1:
+        return {move_to_uci(move) : 1 for move in root_moves}
+
+    # Split the second ply too if the root alone can't keep every worker busy
+    tasks = []
+    if depth >= 3 and len(root_moves) < workers * TASKS_PER_WORKER:
+        for move in root_moves:
+            board.make_move(move)
+            replies = board.generate_moves()
+            board.unmake_move()
+            if replies:
+                tasks.extend((move, (move, reply), depth - 2) for reply in replies)
+            else:
+                tasks.append((move, (move,), depth - 1))
+    else:
+        tasks = [(move, (move,), depth - 1) for move in root_moves]
+
+    counts = {move : 0 for move in root_moves}
+    with ProcessPoolExecutor(max_workers = workers, initializer = _init_perft_worker,
+                             initargs = (board.copy(), hash_mb)) as pool:
+        futures = [(root, pool.submit(_perft_task, moves, remaining)) for root, moves, remaining in tasks]
+        for root, future in futures:
+            counts[root] += future.result()
+
+    return {move_to_uci(move) : counts[move] for move in root_moves}
+
+def parallel_perft(board : BitBoard, depth : int, workers : int = None, hash_mb : float = 0) -> int:
+    return sum(parallel_divide(board, depth, workers, hash_mb).values())
+
+class ParallelSearch:
+    """Searches the root moves side by side on a process pool started once and reused.
+
+    Used like an Engine: search() takes the same limits and deepens a round at a time.
+    Every root move of a round is searched to the same depth in its own task, with a
+    full window, so there is less pruning than a single search but every core is
+    working. A round cut short by the clock or should_stop is thrown away. Ties go
+    to the move generated first. Each worker keeps its Engine, and its table, between
+    searches"""
+
+    def __init__(self, workers : int = None, hash_mb : float = 16):
+        self.workers = workers or default_workers()
+        # Set to make every task in the pool give up
+        self._stop = multiprocessing.Event()
+        self._game = 0
+        self.pool = ProcessPoolExecutor(max_workers = self.workers, initializer = _init_search_worker,
+                                        initargs = (hash_mb, self._stop))
+
+    def stop(self) -> None:
+        "Ask a running search to return as soon as possible, safe to call from another thread"
+        self._stop.set()
+
+    def new_game(self) -> None:
+        "Workers clear their tables when they next get a task"
+        self._game += 1
+
+    def close(self) -> None:
+        self._stop.set()
+        self.pool.shutdown(cancel_futures = True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def search(self, board : BitBoard, depth : int = None, nodes : int = None, movetime : float = None,
+               on_iteration = None, should_stop = None, full_depth : bool = False) -> SearchResult:
+        """Searches board a depth at a time until depth, nodes or movetime (seconds) runs out, see
+        Engine.search. The clock and should_stop end a round part way, nodes is only looked at
+        between rounds"""
+        start = time.perf_counter()
+        deadline = start + movetime if movetime else None
+        self._stop.clear()
+        root_moves = board.generate_moves()
+        if not root_moves:
+            score = -MATE if board.in_check() else 0
+            return SearchResult(None, score, 0, [], 0, 0.0, 0.0)
+
+        board = board.copy()
+        result = SearchResult(root_moves[0], 0, 0, [root_moves[0]], 0, 0.0, 0.0)
+        searched = 0
+        max_depth = min(depth or MAX_PLY - 1, MAX_PLY - 1)
+        # The root move is one ply, so the least a round can search is two
+        for current_depth in range(2, max(max_depth, 2) + 1):
+            futures = [self.pool.submit(_search_task, board, move, current_depth - 1, self._game) for move in root_moves]
+            pending = set(futures)
+            while pending and not self._stop.is_set():
+                timeout = WAIT_INTERVAL if deadline is None else max(0.0, min(WAIT_INTERVAL, deadline - time.perf_counter()))
+                _, pending = wait(pending, timeout = timeout)
+                if (deadline is not None and time.perf_counter() >= deadline) or (should_stop is not None and should_stop()):
+                    self._stop.set()
+            # Stopped tasks give up straight away, but their nodes still count
+            results = [future.result() for future in futures]
+            searched += sum(nodes_searched for _, _, nodes_searched, _ in results)
+            if not all(complete for _, _, _, complete in results):
+                break
+
+            best_index = 0
+            for index, (score, _, _, _) in enumerate(results):
+                if score > results[best_index][0]:
+                    best_index = index
+            score, pv, _, _ = results[best_index]
+            seconds = time.perf_counter() - start
+            result = SearchResult(pv[0], score, current_depth, pv, searched, seconds, searched / seconds if seconds > 0 else 0.0)
+            if on_iteration is not None:
+                on_iteration(result)
+
+            if abs(score) >= MATE_BOUND or (len(root_moves) == 1 and not full_depth) or (nodes is not None and searched >= nodes):
+                break
+            # As in Engine.search, don't start a round that can't finish
+            if deadline is not None and time.perf_counter() + 2 * seconds > deadline:
+                break
+
+        seconds = time.perf_counter() - start
+        return result._replace(nodes = searched, seconds = seconds, nps = searched / seconds if seconds > 0 else 0.0)
@@ -0,0 +1,183 @@
+"""Perft: counts the leaf nodes of the legal move tree to a fixed depth.
+
+Run from the command line, e.g.
+
+    python perft.py --depth 4
+    python perft.py --position kiwipete --divide 3
+    python perft.py --depth 4 --save perft_baseline.json
+    python perft.py --depth 4 --baseline perft_baseline.json
+    python perft.py --depth 5 --hash 64
+    python perft.py --depth 5 --workers 4
+"""
+import argparse
+import json
+import sys
+import time
+
+from bitboard import BitBoard, move_to_uci
+from transposition import TranspositionTable, perft_key
+
+# Standard perft test positions with their known node counts from depth 1
+PERFT_POSITIONS = {
+    "startpos" : (None, [20, 400, 8902, 197281, 4865609]),
+    "kiwipete" : ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                  [48, 2039, 97862, 4085603]),
+    "position3" : ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                   [14, 191, 2812, 43238, 674624]),
+    "position4" : ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                   [6, 264, 9467, 422333]),
+    "position5" : ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                   [44, 1486, 62379, 2103487]),
+    "position6" : ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                   [46, 2079, 89890, 3894594])
+}
+
+
+def start_position() -> BitBoard:
+    "Sets up a ChessBoard the same way the game does and returns its bitboard core"
+    from board import ChessBoard
+    from piece import PieceManager
+
+    piece_manager = PieceManager()
+    board = ChessBoard(8, piece_manager)
+    board.setup()
+    return board.bitboard
+
+def load_position(name : str) -> BitBoard:
+    fen, _ = PERFT_POSITIONS[name]
+    if fen is None:
+        return start_position()
+    return BitBoard.from_fen(fen)
+
+def perft(board : BitBoard, depth : int, table : TranspositionTable = None) -> int:
+    """Returns the number of leaf nodes depth plies below board,
+    subtree counts are cached in table if one is given"""
+    if table is not None and depth > 1:
+        key = perft_key(board.hash, depth)
+        entry = table.probe(key)
+        if entry is not None:
+            return entry[1]
+
+    moves = board.generate_moves()
+    if depth <= 1:
+        # Bulk count, the leaves don't need to be played
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1, table)
+        board.unmake_move()
+
+    if table is not None:
+        table.store(key, depth, nodes)
+    return nodes
+
+def divide(board : BitBoard, depth : int, table : TranspositionTable = None) -> dict:
+    "Returns the perft count below each root move, keyed by the move in UCI notation"
+    counts = {}
+    for move in board.generate_moves():
+        board.make_move(move)
+        counts[move_to_uci(move)] = perft(board, depth - 1, table)
+        board.unmake_move()
+    return counts
+
+def run(name : str, depth : int, table : TranspositionTable = None, workers : int = 1, hash_mb : float = 0) -> list:
+    """Runs perft on a named position for every depth up to depth, returns a result per depth.
+    With more than one worker the root moves are counted in a process pool, each worker with its own hash_mb table"""
+    board = load_position(name)
+    expected = PERFT_POSITIONS[name][1]
+    results = []
+    for current_depth in range(1, depth + 1):
+        if table is not None:
+            # Each depth is timed on its own, don't let it reuse the previous depth's counts
+            table.clear()
+        start = time.perf_counter()
+        if workers > 1:
+            from parallel import parallel_perft
+            nodes = parallel_perft(board, current_depth, workers, hash_mb)
+        else:
+            nodes = perft(board, current_depth, table)
+        seconds = time.perf_counter() - start
+        results.append({
+            "depth" : current_depth,
+            "nodes" : nodes,
+            "expected" : expected[current_depth - 1] if current_depth <= len(expected) else None,
+            "seconds" : seconds,
+            "nps" : nodes / seconds if seconds > 0 else 0.0
+        })
+    return results
+
+def compare(results : dict, baseline : dict) -> bool:
+    "Prints nodes per second against a saved baseline, returns false if any node count changed"
+    ok = True
+    for name, depths in results.items():
+        old_depths = {entry["depth"] : entry for entry in baseline.get(name, [])}
+        for entry in depths:
+            old = old_depths.get(entry["depth"])
+            if old is None:
+                continue
+            if old["nodes"] != entry["nodes"]:
+                ok = False
+                print(f"{name} depth {entry['depth']}: nodes {entry['nodes']} != baseline {old['nodes']}")
+            if old["nps"] > 0:
+                change = 100 * (entry["nps"] - old["nps"]) / old["nps"]
+                print(f"{name} depth {entry['depth']}: {entry['nps']:,.0f} nps vs {old['nps']:,.0f} ({change:+.1f}%)")
+    return ok
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(description = "Move generation perft benchmark")
+    parser.add_argument("--position", choices = ["all"] + list(PERFT_POSITIONS), default = "all")
+    parser.add_argument("--depth", type = int, default = 3)
+    parser.add_argument("--divide", type = int, metavar = "DEPTH", help = "print the node count below each root move")
+    parser.add_argument("--save", metavar = "FILE", help = "write the results to a baseline file")
+    parser.add_argument("--baseline", metavar = "FILE", help = "compare the results against a baseline file")
+    parser.add_argument("--hash", type = float, default = 0, metavar = "MB", help = "cache subtree counts in a transposition table")
+    parser.add_argument("--workers", type = int, default = 1, help = "processes to split the root moves across")
+    args = parser.parse_args(argv)
+
+    # Pool workers each build their own table
+    table = TranspositionTable(args.hash) if args.hash > 0 and args.workers <= 1 else None
+
+    names = list(PERFT_POSITIONS) if args.position == "all" else [args.position]
+
+    if args.divide:
+        for name in names:
+            if args.workers > 1:
+                from parallel import parallel_divide
+                counts = parallel_divide(load_position(name), args.divide, args.workers, args.hash)
+            else:
+                counts = divide(load_position(name), args.divide, table)
+            print(f"{name} divide {args.divide}")
+            for move, nodes in sorted(counts.items()):
+                print(f"  {move}: {nodes}")
+            print(f"  total: {sum(counts.values())}")
+        return 0
+
+    ok = True
+    all_results = {}
+    for name in names:
+        results = run(name, args.depth, table, args.workers, args.hash)
+        all_results[name] = results
+        for entry in results:
+            status = ""
+            if entry["expected"] is not None and entry["nodes"] != entry["expected"]:
+                status = f"  FAILED, expected {entry['expected']}"
+                ok = False
+            print(f"{name} depth {entry['depth']}: {entry['nodes']} nodes in {entry['seconds']:.3f}s "
+                  f"({entry['nps']:,.0f} nps){status}")
+
+    if table is not None:
+        print(f"hash: {table.stats()}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            ok = compare(all_results, json.load(file)) and ok
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(all_results, file, indent = 2)
+
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
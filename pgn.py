@@ -0,0 +1,212 @@
+"""Streams PGN files and replays every game, flagging illegal moves.
+
+Run from the command line, e.g.
+
+    python pgn.py games.pgn
+    python pgn.py games.pgn --workers 4
+
+Games are read a line at a time and replayed on one board that is unwound
+after each game, so memory doesn't grow with the file. With several workers
+the file is split at game boundaries by byte offset and each process reads
+only its own share. Moves are SAN, checked against the legal moves of the
+position; the first move that isn't legal ends that game's replay.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import BitBoard, STARTING_FEN
+from notation import parse_san
+
+Game = namedtuple("Game", ["offset", "headers", "moves", "result"])
+# A move that couldn't be played: the game, its ply (from 0), the SAN and why
+IllegalMove = namedtuple("IllegalMove", ["offset", "headers", "ply", "san", "reason"])
+
+RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+_HEADER = re.compile(r'\[\s*(\w+)\s+"(.*)"\s*\]')
+# Digits followed by dots, or alone; not the 0 of 0-0 castling
+_MOVE_NUMBER = re.compile(r"^\d+(\.+|$)")
+
+
+def movetext_tokens(text : str) -> list:
+    "Splits PGN movetext into SAN moves and the result, dropping comments, variations, NAGs and move numbers"
+    tokens = []
+    index = 0
+    length = len(text)
+    depth = 0 # Variation nesting
+    while index < length:
+        char = text[index]
+        if char == "{":
+            end = text.find("}", index)
+            index = length if end < 0 else end + 1
+        elif char == ";":
+            end = text.find("\n", index)
+            index = length if end < 0 else end + 1
+        elif char == "(":
+            depth += 1
+            index += 1
+        elif char == ")":
+            depth = max(0, depth - 1)
+            index += 1
+        elif char.isspace():
+            index += 1
+        else:
+            start = index
+            while index < length and not text[index].isspace() and text[index] not in "{}();":
+                index += 1
+            token = text[start:index]
+            if depth or token[0] == "$":
+                continue
+            if token not in RESULTS:
+                token = _MOVE_NUMBER.sub("", token)
+            if token:
+                tokens.append(token)
+    return tokens
+
+def _make_game(offset : int, headers : dict, movetext : list) -> Game:
+    tokens = movetext_tokens("\n".join(movetext))
+    result = headers.get("Result", "*")
+    if tokens and tokens[-1] in RESULTS:
+        result = tokens.pop()
+    return Game(offset, headers, tokens, result)
+
+def read_games(file, start : int = 0, end : int = None):
+    """Yields every Game in a PGN file opened in binary mode, beginning at byte offset start
+    (the start of a game) and stopping before the first game that begins at or after end"""
+    file.seek(start)
+    offset = start
+    game_offset = None
+    headers = {}
+    movetext = []
+    for raw in iter(file.readline, b""):
+        line_offset = offset
+        offset += len(raw)
+        line = raw.decode("utf-8", "replace").strip()
+        if not line or line[0] == "%":
+            continue
+
+        header = _HEADER.match(line) if line[0] == "[" else None
+        if header and movetext:
+            # Headers after movetext start the next game
+            yield _make_game(game_offset, headers, movetext)
+            game_offset = None
+            headers = {}
+            movetext = []
+        if game_offset is None:
+            if end is not None and line_offset >= end:
+                return
+            game_offset = line_offset
+
+        if header:
+            headers[header.group(1)] = header.group(2)
+        else:
+            movetext.append(line)
+
+    if game_offset is not None:
+        yield _make_game(game_offset, headers, movetext)
+
+def split_offsets(path : str, parts : int) -> list:
+    "Byte offsets that split a PGN file into about equal parts, each starting at a game"
+    size = os.path.getsize(path)
+    offsets = [0]
+    with open(path, "rb") as file:
+        for part in range(1, parts):
+            file.seek(size * part // parts)
+            file.readline() # Probably mid line
+            offset = file.tell()
+            # Move on to the next header that follows movetext or a blank line
+            previous_blank = False
+            for raw in iter(file.readline, b""):
+                if raw.startswith(b"[Event ") or (raw.startswith(b"[") and previous_blank):
+                    break
+                previous_blank = not raw.strip()
+                offset += len(raw)
+            else:
+                offset = size
+            if offset > offsets[-1]:
+                offsets.append(offset)
+    return offsets + [size]
+
+
+class Replayer:
+    "Replays games on one reused board, unwinding it back to the start after each game"
+
+    def __init__(self):
+        self.board = BitBoard.from_fen(STARTING_FEN)
+        self.games = 0
+        self.plies = 0
+
+    def replay(self, game : Game):
+        "Plays every move of game, returns an IllegalMove for the first that can't be played, otherwise None"
+        self.games += 1
+        board = self.board
+        if game.headers.get("FEN"):
+            try:
+                board = BitBoard.from_fen(game.headers["FEN"])
+            except ValueError as error:
+                return IllegalMove(game.offset, game.headers, 0, "", str(error))
+        try:
+            for ply, san in enumerate(game.moves):
+                try:
+                    move = parse_san(board, san)
+                except ValueError as error:
+                    return IllegalMove(game.offset, game.headers, ply, san, str(error))
+                board.make_move(move)
+                self.plies += 1
+        finally:
+            while board.history:
+                board.unmake_move()
+        return None
+
+def check_file(path : str, start : int = 0, end : int = None):
+    "Replays the games of path between two byte offsets, returns (games, plies, illegal moves)"
+    replayer = Replayer()
+    illegal = []
+    with open(path, "rb") as file:
+        for game in read_games(file, start, end):
+            problem = replayer.replay(game)
+            if problem is not None:
+                illegal.append(problem)
+    return replayer.games, replayer.plies, illegal
+
+def run(path : str, workers : int = 1):
+    "Replays every game in path, split across workers processes, returns (games, plies, illegal moves in file order)"
+    if workers <= 1:
+        return check_file(path)
+    offsets = split_offsets(path, workers)
+    games = plies = 0
+    illegal = []
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        futures = [pool.submit(check_file, path, start, end) for start, end in zip(offsets, offsets[1:])]
+        # Parts are merged in file order so the report is the same however many workers there are
+        for future in futures:
+            part_games, part_plies, part_illegal = future.result()
+            games += part_games
+            plies += part_plies
+            illegal += part_illegal
+    return games, plies, illegal
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(description = "Replay and check the games in a PGN file")
+    parser.add_argument("file")
+    parser.add_argument("--workers", type = int, default = 1, help = "processes to split the file across")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    games, plies, illegal = run(args.file, args.workers)
+    seconds = time.perf_counter() - start
+
+    for problem in illegal:
+        players = f"{problem.headers.get('White', '?')} - {problem.headers.get('Black', '?')}"
+        print(f"game at byte {problem.offset} ({players}): ply {problem.ply + 1} {problem.san}: {problem.reason}")
+    rate = lambda count: count / seconds if seconds > 0 else 0.0
+    print(f"{games} games, {plies} plies, {len(illegal)} with illegal moves in {seconds:.2f}s "
+          f"({rate(games):,.1f} games/s, {rate(plies):,.0f} plies/s)")
+    return 1 if illegal else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
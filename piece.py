@@ -1,37 +1,55 @@
+import logging
+import time
 from abc import ABC, abstractmethod
 from typing import Tuple, Set, List
-from window import *
 from constants import *
 from utils import *
+from bitboard import *
+from transposition import ObjectTable, move_list_key
+from instrument import counted, timed
+
+# Slots in each game's cache of possible moves, a game only revisits a handful of positions
+# and many games can share a process, so it is kept small
+MOVE_CACHE_SLOTS = 1024
+
+# Sprite names, e.g. "White Queen", by colour and rank
+SPRITE_NAMES = [[f"{colour} {rank}" for rank in RANK_NAMES] for colour in COLOUR_NAMES]
 
 class Piece(ABC):
+    # Colour and rank are the bitboard core's small ints, the names are only worked out when asked for
+    __slots__ = ("_colour_index", "_position", "selected", "has_moved",
+                 "current_moves", "current_captures", "current_defending", "_piece_manager")
     _moves : Set[Tuple[int, int]] = None
     _range : int = 8
+    _rank_index : int = None
     can_promote : bool = False
-    image = None
-    window = window
     
-    def __init__(self, colour : str, position : Position, has_moved : bool = False):
-        self._colour = colour
-        self._rank = self.__class__.__name__
+    def __init__(self, colour, position : Position, has_moved : bool = False):
+        "colour is WHITE_COLOUR or BLACK_COLOUR, or its name"
+        self._colour_index = COLOUR_INDEX[colour] if isinstance(colour, str) else colour
         self.position = position
-        self.image = piece_images[f"{self.colour} {self._rank}"]
         self.selected = False
         self.has_moved = has_moved
-        self.current_moves : List[Position] = [] 
-        self.current_captures : List[Position] = []
-        self. current_defending : List[Position] = []
+        # Only filled in while the piece is selected
+        self.current_moves : List[Position] = () 
+        self.current_captures : List[Position] = ()
+        self.current_defending : List[Position] = ()
 
     def _set_manager(self, manager):
         self._piece_manager = manager
 
     @property
     def colour(self):
-        return self._colour
+        return COLOUR_NAMES[self._colour_index]
 
     @property
     def rank(self):
-        return self._rank
+        return RANK_NAMES[self._rank_index]
+
+    @property
+    def _king(self):
+        "This piece's own king"
+        return self._piece_manager.kings[self._colour_index]
 
     @property
     def position(self):
@@ -43,6 +61,22 @@ class Piece(ABC):
             raise OutOfBounds(new_position)
         self._position = new_position
 
+    @property
+    def window(self):
+        "The display surface, only created once the GUI draws something"
+        from window import get_window
+        return get_window()
+
+    @property
+    def image(self):
+        "Sprite for the piece, loaded the first time the GUI needs it"
+        from window import get_piece_images
+        return get_piece_images()[self.image_name]
+
+    @property
+    def image_name(self):
+        return SPRITE_NAMES[self._colour_index][self._rank_index]
+
     @property
     def rect(self):
         rect = self.image.get_rect()
@@ -50,11 +84,8 @@ class Piece(ABC):
         rect[1] = self.loc[1]
         return rect
 
-    def __del__(self) -> None:
-        print(f"{self} has been removed")
-
     def __repr__(self) -> str:
-        return f"{self.__class__.__name__}({self.colour}, {self.position}, {self._moves})"
+        return f"{self.__class__.__name__}({self.colour}, {self.position})"
 
     def __str__(self) -> str:
         return f"{self.colour} {self.rank} at {self.position}"
@@ -62,185 +93,72 @@ class Piece(ABC):
     def possible_moves(self) -> Tuple[List[Position], List[Position]]:
         """Returns moves, captures and defended 
         (Defended squares are squares that are attacked by a piece 
-        but not neccessarily able to move to e.g. it's pinned)"""
+        but not neccessarily able to move to e.g. it's pinned)
+        Results are cached per position, so the lists returned must not be changed"""
+        cache = self._piece_manager.move_cache
+        key = move_list_key(self._piece_manager.board.bitboard.hash, position_to_square(self.position))
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        result = self._possible_moves()
+        cache.store(key, 0, result)
+        return result
+
+    def _possible_moves(self) -> Tuple[List[Position], List[Position]]:
         moves, captures, defending = self._move_loop()
-        if not self.rank == "King" and self.is_pinned():
-            logging.debug(f"{self} is pinned")
-            # If it is pinned all moves are classed as defending
-            # Calculate which moves are still valid
-            invalid_moves, moves = self.pinned_validation(moves)
-            invalid_captures, captures = self.pinned_validation(captures)
-            defending = invalid_moves + invalid_captures + defending
-        if self._piece_manager.king_dict[f"{self.colour} King"].in_check:
-            moves, invalid_moves = self._check_validation(moves)
-            captures, invalid_captures = self._check_validation(captures)
-            defending = defending + invalid_moves + invalid_captures
-
-        return moves, captures, defending
-
-    def pinned_validation(self, move_list):
+        if self._rank_index == KING:
+            # The king checks its own moves against square control
+            return moves, captures, defending
 
-        king_pos = self._piece_manager.king_dict[f"{self.colour} King"].position
-        direction_from_king = chess_unit_direction_vector(king_pos, self.position)
-        direction_to_king = direction_from_king * -1
-        logging.debug(f"Direction to king: {direction_to_king}")
-        logging.debug(f"Direction from king: {direction_from_king}")
+        board = self._piece_manager.board
+        bitboard = board.bitboard
+        square = position_to_square(self.position)
+        _, evasions, pins = board.pins_and_checks(self._colour_index)
+        # Squares the piece may still go to given pins and checks on its king
+        allowed = evasions & pins.get(square, FULL_BOARD)
+        if allowed == FULL_BOARD and bitboard.en_passant < 0:
+            return moves, captures, defending
 
         valid_moves = []
+        valid_captures = []
+        # Moves it can't make are classed as defending
+        defending = list(defending)
+        for targets, valid in ((moves, valid_moves), (captures, valid_captures)):
+            for target in targets:
+                target_square = position_to_square(target)
+                if self._rank_index == PAWN and target_square == bitboard.en_passant:
+                    # En passant takes a pawn off a different square, let the core decide
+                    captured_square = target_square - 8 if self._colour_index == WHITE_COLOUR else target_square + 8
+                    legal = bitboard._is_legal(square, target_square, bitboard.king_square(self._colour_index), captured_square)
+                else:
+                    legal = allowed >> target_square & 1
+                (valid if legal else defending).append(target)
 
-        for move in move_list[:]:
-            move_direction = chess_unit_direction_vector(self.position, move)
-            # Check is move is along checking axis
-            if move_direction == direction_from_king or move_direction == direction_to_king:
-                move_list.remove(move)
-                valid_moves.append(move)
-
-        return move_list, valid_moves
-
-    def move(self, pos : Position) -> None:
-        logging.debug(f"Moving {self} to {pos}")
-
-        # Move in manager before moving in piece otherwise old position is lost
-        self._piece_manager.move(self, pos)
-        self.position = pos
-        self.has_moved = True
+        return valid_moves, valid_captures, defending
 
     def _move_loop(self):
-        """Loops through moveset and calculates possible moves or captures for the piece
+        """Calculates possible moves or captures for the piece from the bitboard core
         as well as squares it is defending but can't move to (e.g. defending friendly piece)"""
 
-        moves = []
-        captures = []
-        defending = []
-
-        for x, y in self._moves:
-            magnitude = 1
-            while magnitude <= self._range:
-                consideration_position = self.position + Position(x, y) * magnitude
-                # Ignore if position not on board
-                if max(consideration_position) > 7 or min(consideration_position) < 0:
-                    break
+        bitboard = self._piece_manager.board.bitboard
+        colour = self._colour_index
+        enemy = colour ^ 1
+        square = position_to_square(self.position)
+        attacks = piece_attacks(colour, self._rank_index, square, bitboard.occupied)
 
-                # If square if empty, add to moves, if occupied by enemy add to captures, otherwise break
-                piece = self._piece_manager.board.square_from_position(consideration_position).piece
-                if piece is None:
-                    moves.append(consideration_position)
-                elif self.colour != piece.colour:
-                    if piece.rank != "King":
-                        captures.append(consideration_position)
-                        break
-                    # If piece is enemy king, add squares behind the king to defending
-                    defending.append(consideration_position)
-                    enemy_colour = "White"
-                    if self.colour == "White":
-                        enemy_colour = "Black"
-
-                    # Keep track of pieces attacking kings
-                    attacking_king[enemy_colour].add(self)
-
-                    while True:
-                        magnitude_copy = magnitude + 1
-                        consideration_position = self.position + Position(x, y) * magnitude_copy
-                        if max(consideration_position) > 7 or min(consideration_position) < 0:
-                            break
-                        piece = self._piece_manager.board.square_from_position(consideration_position).piece
-                        # If no piece, add square to defending then continue
-                        if piece is None:
-                            defending.append(consideration_position)
-                        # If piece and same colour, add to defending then break
-                        elif piece.colour == self.colour:
-                            defending.append(consideration_position)
-                            break
-                        # Else break
-                        break
+        enemy_king = bitboard.pieces[enemy][KING]
+        moves = attacks & ~bitboard.occupied
+        captures = attacks & bitboard.occupancy[enemy] & ~enemy_king
+        defending = attacks & bitboard.occupancy[colour]
 
-                    break
+        if attacks & enemy_king:
+            defending |= enemy_king
+            # If piece is enemy king, add the square behind the king to defending
+            # so the king cannot step back along the attacking line
+            xray = piece_attacks(colour, self._rank_index, square, bitboard.occupied ^ enemy_king) & ~attacks
+            defending |= xray & KING_ATTACKS[lowest_square(enemy_king)] & ~bitboard.occupancy[enemy]
 
-                else:
-                    defending.append(consideration_position)
-                    break
-                magnitude += 1
-        
-        return moves, captures, defending
-
-
-
-
-    def is_pinned(self) -> bool:
-        """Returns true if piece is pinned to friendly king, take care though
-        as a pinned piece can still move along the pinned axis or capture attacking piece,
-        could get round this by using temporary replacement of moves dict?"""
-        king_pos = self._piece_manager.king_dict[f"{self.colour} King"].position
-        direction_from_king = chess_unit_direction_vector(king_pos, self.position)
-        if not is_pinnable_vector(direction_from_king):
-            return False
-        
-        direction_from_king = Position(int(direction_from_king.x), int(direction_from_king.y))
-        direction_to_king = [direction_from_king[0] * -1, direction_from_king[1] * -1]
-
-        # Check for piece in between current piece and king
-        magnitude = 1
-        pos_to_king = Position(direction_to_king[0], direction_to_king[1])
-        while True:
-            consideration_position = self.position + (pos_to_king * magnitude)
-            piece = self._piece_manager.board.square_from_position(consideration_position).piece
-            if consideration_position == king_pos: # Is king
-                break
-            elif piece is None:
-                magnitude += 1
-                continue
-            else:
-                return False
-
-        # Check for enemy piece along checking axis
-        magnitude = 1
-        pos_from_king = Position(direction_from_king[0], direction_from_king[1])
-        while True:
-            consideration_position = self.position + (pos_from_king * magnitude)
-            if max(consideration_position) > 7 or min(consideration_position) < 0:
-                return False
-            piece = self._piece_manager.board.square_from_position(consideration_position).piece
-            if piece is None:
-                magnitude += 1
-                continue
-            elif piece.colour == self.colour:
-                return False
-            elif piece.rank in ["King", "Pawn", "Knight"]:
-                return False
-            elif tuple(direction_to_king) not in piece._moves:
-                return False
-            return True
-
-    def _check_validation(self, moves):
-        """Take moves and make sure they are valid given check status of friendly king
-        Returns valid_moves, invalid_moves"""
-        valid_moves = []
-        invalid_moves = []
-        if self.rank == "King":
-            return moves, invalid_moves
-        if self._piece_manager.king_dict[f"{self.colour} King"].in_check:
-            logging.debug(f"{self}: My King is in check")
-            # If in double check, only King can move
-            if len(attacking_king[self.colour]) == 2:
-                invalid_moves = moves
-                return [], invalid_moves
-            # If only 1 piece attacking king, next move must block piece, capture piece or move king
-            else:
-                for move in moves:
-                    if move in valid_check_defenses:
-                        valid_moves.append(move)
-                    else:
-                        invalid_moves.append(move)
-
-        return valid_moves, invalid_moves
-            
-    def pinned_moves(self):
-        "Calculates moves available to pinned piece, e.g. moving along checking axis and capturing attacking piece"
-        pass
-
-    def give_check(self) -> bool:
-        "Returns true if piece gives check to enemy king"
-        pass
+        return bitboard_to_positions(moves), bitboard_to_positions(captures), bitboard_to_positions(defending)
 
     def destroy(self) -> None:
         "Remove a piece from play, undraw it and remove references to it"
@@ -251,149 +169,34 @@ class Piece(ABC):
     def loc(self):
         return [self.position.x * 128, (7 - self.position.y) * 128]
 
-    def draw(self) -> None:
-
-        if self.selected:
-
-            # Piece highlight
-            rect = self.loc + [SQUARE_SIZE, SQUARE_SIZE]
-            pygame.draw.rect(self.window, MOVE_COLOUR, rect, 0)
-
-            # Draw current moves
-            radius = PIECE_SIZE / 2
-            for move in self.current_moves:
-                x, y = draw_position(move)
-                circle_centre = [x + radius, y + radius]
-                pygame.draw.circle(self.window, MOVE_COLOUR, circle_centre, radius, 0)
-            for capture in self.current_captures:
-                x, y = draw_position(capture)
-                circle_centre = [x + radius, y + radius]
-                pygame.draw.circle(self.window, CAPTURE_COLOUR, circle_centre, radius, 0)
-
-
-        self.window.blit(self.image, self.loc)
-
-    def handle_event(self, event):
-
-        if not event.type == MOUSEBUTTONDOWN:
-            return False
-
-        if self.selected:
-            # Check if clicked on valid move
-            for move in self.current_moves + self.current_captures:
-                valid = get_rect_from_square(move).collidepoint(event.pos)
-                if valid:
-                    # PRE MOVE EVENTS
-
-                    # Clear en_passant_list
-                    logging.debug("Clearing en_passant_list")
-                    global en_passant_list
-                    en_passant_list.clear()
-
-                    # Check for castling
-                    if self.rank == "King":
-                        # Left rook
-                        if self.position.x - move.x == 2:
-                            left_rook = self._piece_manager.board.square_from_position(self.position + Position(-4, 0)).piece
-                            left_rook.move(self.position + Position(-1, 0))
-                            left_rook.has_moved = True
-                        # Right rook
-                        elif self.position.x - move.x == -2:
-                            right_rook = self._piece_manager.board.square_from_position(self.position + Position(3, 0)).piece
-                            right_rook.move(self.position + Position(1, 0))
-                            right_rook.has_moved = True
-                    
-                    # Check for en passant
-                    elif self.rank == "Pawn":
-                        # If moved 2, add enemy pawns to en_passant_list
-                        if abs(self.position.y - move.y) == 2:
-                            left_piece_position = move + Position(-1, 0)
-                            if left_piece_position.x >= 0:
-                                left_piece = self._piece_manager.board.square_from_position(left_piece_position).piece
-                                if left_piece and left_piece.rank == "Pawn" and left_piece.colour != self.colour:
-                                    en_passant_list.append(left_piece)
-
-                            right_piece_position = move + Position(1, 0)
-                            if right_piece_position.x <= 7:
-                                right_piece = self._piece_manager.board.square_from_position(right_piece_position).piece
-                                if right_piece and right_piece.rank == "Pawn" and right_piece.colour != self.colour:
-                                    en_passant_list.append(right_piece)
-
-                            en_passant_list.append(self.position)
-
-                        # Check if capturing en_passant, pawn has moved left or right and then not captured a piece
-                        elif move.x - self.position.x in (1, -1) and not self._piece_manager.board.square_from_position(move).piece:
-                            captured_piece_position = move - Position(next(iter(self._moves))[0], next(iter(self._moves))[1]) # Retrieves the single move for a pawn
-                            piece = self._piece_manager.board.square_from_position(captured_piece_position).piece
-                            piece.destroy()
-                            self._piece_manager.board.square_from_position(captured_piece_position).remove()
-
-                        logging.debug(f"En passant list is now: {en_passant_list}")
-
-                    self.move(move)
-                    # Check for promotion
-                    self.selected = False
-                    global turn
-                    turn = next(get_turn)
-
-                    # POST MOVE EVENTS
-                    if self.rank == "Pawn":
-                        self.promote()
-                    return self._post_move()
-
-            self.selected = False
-            return False
-
-        event_point_on_piece = self.rect.collidepoint(event.pos)
-
-        if not event_point_on_piece:
-            return False
-
-        if self.colour != turn:
-            return False
-
+    def select(self) -> None:
+        "Marks the piece as selected and works out where it can go"
         self.selected = True
         self.current_moves, self.current_captures, self.current_defending = self.possible_moves()
 
+    def move_to(self, target : Position) -> bool:
+        "Plays the selected piece to target, one of its current moves or captures"
+        self.selected = False
+        board = self._piece_manager.board
+        board.make_move(encode_move(position_to_square(self.position), position_to_square(target)))
+
+        # POST MOVE EVENTS
+        # Check for promotion
+        if self._rank_index == PAWN:
+            self.promote()
+        return self._post_move()
+
     def _post_move(self):
-        global attacking_king
-        attacking_king["White"].clear()
-        attacking_king["Black"].clear()
-
-        # Update square control
-        self._piece_manager.board._evaluate_square_control("Black")
-        self._piece_manager.board._evaluate_square_control("White")
-
-        # Swap turns
-        # Check for checks
-        global valid_check_defenses
-        valid_check_defenses.clear()
-
-        enemy_colour = "White"
-        if self.colour == "White":
-            enemy_colour = "Black"
-
-        king = self._piece_manager.king_dict[f"{enemy_colour} King"]
-        if king.in_check:
-            if len(attacking_king[enemy_colour]) == 1:
-                attacker = next(iter(attacking_king[enemy_colour])) # get attacking piece
-                direction_vector = chess_unit_direction_vector(attacker.position, king.position)
-                valid_check_defenses.append(attacker.position)
-                magnitude = 1
-                while True:
-                    new_move = attacker.position + direction_vector * magnitude
-                    logging.debug(new_move)
-                    # If there is a piece, it is the king
-                    if self._piece_manager.board.square_from_position(new_move).piece:
-                        break
-                    valid_check_defenses.append(new_move)
-                    magnitude += 1
+        # Square control is kept up to date by the board as pieces move
+        enemy_colour = COLOUR_NAMES[self._colour_index ^ 1]
 
         # Check for checkmate
         self._piece_manager.checkmate_calculator(enemy_colour)
         return True
 
 class Bishop(Piece):
+    __slots__ = ()
+    _rank_index = BISHOP
 
     _moves = set([
         tuple([1, 1]),
@@ -403,6 +206,8 @@ class Bishop(Piece):
         ])
 
 class Knight(Piece):
+    __slots__ = ()
+    _rank_index = KNIGHT
 
     _moves = set(
         [tuple([1, 2]), 
@@ -417,6 +222,8 @@ class Knight(Piece):
     _range = 1
 
 class Rook(Piece):
+    __slots__ = ()
+    _rank_index = ROOK
 
     _moves = set(
         [tuple([1, 0]), 
@@ -426,6 +233,8 @@ class Rook(Piece):
     )
 
 class Queen(Piece):
+    __slots__ = ()
+    _rank_index = QUEEN
 
     _moves = set(
         [tuple([1, 0]), 
@@ -439,6 +248,8 @@ class Queen(Piece):
     )
 
 class King(Piece):
+    __slots__ = ()
+    _rank_index = KING
 
     _moves = set(
         [tuple([1, 0]), 
@@ -458,10 +269,8 @@ class King(Piece):
 
     @property
     def in_check(self):
-        enemy_colour = "White"
-        if self.colour == "White":
-            enemy_colour = "Black"
-        return self._piece_manager.board.square_from_position(self.position).control[enemy_colour]
+        bitboard = self._piece_manager.board.bitboard
+        return bitboard.is_attacked(position_to_square(self.position), self._colour_index ^ 1)
 
     def _move_loop(self):
         """Loops through moveset and calculates possible moves or captures for the piece
@@ -469,62 +278,39 @@ class King(Piece):
 
         moves, captures, defending = super()._move_loop()
 
-        enemy_colour = "White"
-        if self.colour == "White":
-            enemy_colour = "Black"
+        enemy_colour = COLOUR_NAMES[self._colour_index ^ 1]
 
         # Validate moves and captures
         moves = self._king_move_validation(moves, enemy_colour)
         captures = self._king_move_validation(captures, enemy_colour)
 
-        if self.in_check:
-            logging.debug(f"{self} in check")
         if self.has_moved or self.in_check:
             return moves, captures, defending
 
         # Castling
-        # Check if left rook has moved
-        # Check if no pieces between king and left rook
-        # Check if no enemy square control between king and left rook
-        # Repeat for right rook
-
-        # Left rook
-        left_rook_position = self.position + Position(-4, 0)
-        left_rook = self._piece_manager.board.square_from_position(left_rook_position).piece
-
-        left_rook_can_castle = True
-
-        if left_rook and not left_rook.has_moved:
-            for i in range(1, 4):
-                square = self._piece_manager.board.square_from_position(self.position + Position(-i, 0))
-                # If piece in the way or moving through check, cannot castle
-                if square.piece or square.control[enemy_colour]:
-                    left_rook_can_castle = False
-                    break
-        else:
-            left_rook_can_castle = False
-
-        if left_rook_can_castle:
-            moves.append(self.position + Position(-2, 0))
-
-        # Right rook
-        right_rook_position = self.position + Position(3, 0)
-        right_rook = self._piece_manager.board.square_from_position(right_rook_position).piece
-
-        right_rook_can_castle = True
-
-        if right_rook and not right_rook.has_moved:
-            for i in range(1, 3):
-                square = self._piece_manager.board.square_from_position(self.position + Position(i, 0))
-                # If piece in the way or moving through check, cannot castle
-                if square.piece or square.control[enemy_colour]:
-                    right_rook_can_castle = False
+        # Check the core still holds the right, so the king and a rook of ours are on their home squares
+        # Check if no pieces between king and rook
+        # Check if no enemy square control on the king's first two steps
+
+        bitboard = self._piece_manager.board.bitboard
+        square_list = self._piece_manager.board._square_list
+        king_square = position_to_square(self.position)
+        for right, king_from, king_to, _, _ in CASTLING_MOVES:
+            if not bitboard.castling & right or king_from != king_square:
+                continue
+            rook_square = CASTLING_ROOKS[king_to][0]
+            rook = square_list[rook_square].piece
+            if not rook or rook._rank_index != ROOK or rook._colour_index != self._colour_index:
+                continue
+            # Back rank squares from the king towards the rook, ending on the rook's square
+            ray = RAYS[king_square][2 if king_to > king_from else 6][:abs(rook_square - king_square)]
+            # If piece in the way or moving through check, cannot castle,
+            # the king only crosses the first two squares so the b file may be attacked
+            for distance, square in enumerate(ray[:-1]):
+                if square_list[square].piece or (distance < 2 and square_list[square].control[enemy_colour]):
                     break
-        else:
-            right_rook_can_castle = False
-
-        if right_rook_can_castle:
-            moves.append(self.position + Position(2, 0))
+            else:
+                moves.append(POSITIONS[ray[1]])
 
         return moves, captures, defending
 
@@ -541,55 +327,54 @@ class King(Piece):
 
 
 class Pawn(Piece):
-
-    move_dict = {
-        "White" : set([tuple([0, 1])]),
-        "Black" : set([tuple([0, -1])])
-    }
-
-    @property
-    def _range(self):
-        return 2 - self.has_moved
-
-    @property
-    def _moves(self):
-        return self.move_dict[self.colour]
+    __slots__ = ()
+    _rank_index = PAWN
 
     def promote(self):
         if self.position.y == 0 or self.position.y == 7:
-            logging.debug(f"{self} promotion")
             self._piece_manager.promote = [self]
 
     # Pawns need a different _move_loop
     def _move_loop(self):
-        """Loops through moveset and calculates possible moves or captures for the piece
+        """Calculates possible moves or captures for the piece from the bitboard core
         as well as squares it is defending but can't move to (e.g. defending friendly piece)"""
 
-        move = next(iter(self._moves)) # One member set
+        bitboard = self._piece_manager.board.bitboard
+        colour = self._colour_index
+        enemy = colour ^ 1
+        square = position_to_square(self.position)
+        step = 8 if colour == WHITE_COLOUR else -8
 
-        moves, _, _ = super()._move_loop()
-        captures = []
-        defending = []
-        
-        left_capture = self.position + Position(move[0], move[1]) + Position(-1, 0)
-        right_capture = self.position + Position(move[0], move[1]) + Position(1, 0) 
-
-        for capture in [left_capture, right_capture]:
-            if max(capture) <= 7 and min(capture) >= 0:
-                square = self._piece_manager.board.square_from_position(capture).piece
-                if square is not None and square.colour!= self.colour:
-                    captures.append(capture)
-                else:
-                    defending.append(capture)
+        moves = []
+        push = square + step
+        if 0 <= push < 64 and not bitboard.occupied >> push & 1:
+            moves.append(square_to_position(push))
+            push += step
+            if not self.has_moved and 0 <= push < 64 and not bitboard.occupied >> push & 1:
+                moves.append(square_to_position(push))
+
+        attacks = PAWN_ATTACKS[colour][square]
+        enemy_king = bitboard.pieces[enemy][KING]
+        captures = attacks & bitboard.occupancy[enemy] & ~enemy_king
+        defending = attacks & ~captures
+
+        captures = bitboard_to_positions(captures)
 
         # Check En Passant
-        if self in en_passant_list:
-            enemy_pos = en_passant_list[-1]
-            en_passant_move = enemy_pos - Position(next(iter(self._moves))[0], next(iter(self._moves))[1]) # enemy pos + current pawn y movement
-            captures.append(en_passant_move)
-            logging.debug(f"En passant captures: {captures}")
+        en_passant = bitboard.en_passant
+        if en_passant >= 0 and attacks >> en_passant & 1:
+            captures.append(square_to_position(en_passant))
 
-        return moves, captures, defending
+        return moves, captures, bitboard_to_positions(defending)
+
+PIECE_CLASSES = {
+    PAWN : Pawn,
+    KNIGHT : Knight,
+    BISHOP : Bishop,
+    ROOK : Rook,
+    QUEEN : Queen,
+    KING : King
+}
 
 class PieceManager():
     
@@ -598,93 +383,267 @@ class PieceManager():
             "Black" : [],
             "White" : []
         }
-        self.king_dict = {
-            "White King" : None,
-            "Black King" : None,
+        # Kings by colour
+        self.kings = [None, None]
+        self.promote = []
+        self.promotion_rect = None
+        self.promotion_order = None
+        # Possible moves of each piece keyed by position, shared by selection and mate detection
+        self.move_cache = ObjectTable(MOVE_CACHE_SLOTS)
+        # What each square showed when it was last drawn, None when the whole board needs drawing
+        self._drawn_scene = None
+        # Piece sliding to its square after a move: sprite name, from and to squares, start time
+        self.animation = None
+        # Squares the sliding sprite was drawn over last frame
+        self._sprite_squares = set()
+        # Squares drawn over by something else, e.g. the stats overlay, to repaint next frame
+        self._overdrawn_squares = set()
+        # Selected piece and the squares it can go to, keyed by square index
+        self.selected = None
+        self._targets = {}
+        # Opening book (book.OpeningBook) whose moves are highlighted, and the squares it suggests for the selected piece
+        self.book = None
+        self._book_squares = ()
+        # Colours moved by clicking, the computer's pieces can't be picked up
+        self.human_colours = {WHITE_COLOUR, BLACK_COLOUR}
+
+    def reset(self):
+        "Forget every piece, ready for a new position"
+        self.pieces = {
+            "Black" : [],
+            "White" : []
         }
+        self.kings = [None, None]
         self.promote = []
         self.promotion_rect = None
         self.promotion_order = None
+        self.animation = None
+        self.selected = None
+        self._targets = {}
+        self.invalidate()
+
+    @property
+    def king_dict(self):
+        "Kings keyed by e.g. 'White King'"
+        return {f"{colour} King" : king for colour, king in zip(COLOUR_NAMES, self.kings)}
 
     def set_board(self, board):
         self.board = board
 
-    def create_piece(self, PieceClass : Piece, colour : str, position : Position):
+    def create_piece(self, PieceClass : Piece, colour, position : Position):
         piece = PieceClass(colour, position)
         piece._set_manager(self)
-        self.pieces[colour].append(piece)
-        if piece.rank == "King":
-            self.king_dict[f"{colour} King"] = piece
+        self.pieces[piece.colour].append(piece)
+        if piece._rank_index == KING:
+            self.kings[piece._colour_index] = piece
         return piece
 
     def draw(self):
+        "Draws the whole board, returns the rects drawn"
+        self.invalidate()
+        return self.draw_changed()
+
+    def invalidate(self):
+        "Forget what is on screen so the next draw_changed redraws every square"
+        self._drawn_scene = None
+
+    def overdrawn(self, rect):
+        "Something was drawn over the pixel rect, repaint the squares under it next frame"
+        for x in range(rect.left // SQUARE_SIZE, min(8, (rect.right - 1) // SQUARE_SIZE + 1)):
+            for y in range(rect.top // SQUARE_SIZE, min(8, (rect.bottom - 1) // SQUARE_SIZE + 1)):
+                self._overdrawn_squares.add(position_to_square(Position(x, 7 - y)))
+
+    @property
+    def animating(self) -> bool:
+        return self.animation is not None
+
+    def draw_changed(self):
+        """Redraws only the squares that look different from the last time they were drawn
+        and returns their rects, ready for pygame.display.update"""
+        from window import draw_square, draw_sprite
+
+        sprite = self._animation_frame()
+        scene = self._scene()
+        drawn = self._drawn_scene
+
+        # Squares under the sliding sprite, now and last frame, need repainting whatever they show
+        dirty = self._sprite_squares | self._overdrawn_squares
+        self._sprite_squares = set()
+        self._overdrawn_squares = set()
+        if sprite:
+            image, (x, y) = sprite
+            for corner_x in (x, x + SQUARE_SIZE - 1):
+                for corner_y in (y, y + SQUARE_SIZE - 1):
+                    self._sprite_squares.add(position_to_square(position_from_draw_position(corner_x, corner_y)))
+            dirty = dirty | self._sprite_squares
+
+        rects = []
+        for square, contents in enumerate(scene):
+            if drawn is None or drawn[square] != contents or square in dirty:
+                rects.append(draw_square(square_to_position(square), *contents))
+        if sprite:
+            rects.append(draw_sprite(*sprite))
+        self._drawn_scene = scene
+        return rects
+
+    def _animation_frame(self):
+        "Sprite name and pixel position of the sliding piece, None once it has arrived"
+        if self.animation is None:
+            return None
+        image, from_square, to_square, start = self.animation
+        progress = (time.perf_counter() - start) / MOVE_ANIMATION_SECONDS
+        if progress >= 1:
+            self.animation = None
+            return None
+        from_x, from_y = draw_position(square_to_position(from_square))
+        to_x, to_y = draw_position(square_to_position(to_square))
+        return image, (round(from_x + (to_x - from_x) * progress), round(from_y + (to_y - from_y) * progress))
+
+    def _scene(self):
+        "What each square should show, (highlight, sprite name) by square index"
+        scene = [(None, None)] * 64
         for piece in self.pieces["Black"] + self.pieces["White"]:
-            piece.draw()
-        if self.promote:
-            self.create_promotion_overlay()
+            scene[position_to_square(piece.position)] = (None, piece.image_name)
+        selected = self.selected
+
+        if self.animation:
+            # The sliding sprite is drawn separately until it lands
+            square = self.animation[2]
+            scene[square] = (None, None)
+
+        if selected:
+            square = position_to_square(selected.position)
+            scene[square] = ("Selected", scene[square][1])
+            for highlight, targets in (("Move", selected.current_moves), ("Capture", selected.current_captures)):
+                for target in targets:
+                    square = position_to_square(target)
+                    scene[square] = (highlight, scene[square][1])
+            for square in self._book_squares:
+                scene[square] = ("Book", scene[square][1])
 
+        if self.promote:
+            for position, rank in self.create_promotion_overlay():
+                scene[position_to_square(position)] = ("Promotion", f"{self.promote[0].colour} {rank}")
+        return scene
 
     def handle_event(self, event):
+        from window import MOUSEBUTTONDOWN, KEYDOWN, K_BACKSPACE
+
+        if event.type == KEYDOWN and event.key == K_BACKSPACE:
+            self.takeback()
+            return
+
+        # Nothing else but clicks does anything
+        if event.type != MOUSEBUTTONDOWN:
+            return
+
         if self.promote:
-            if event.type == MOUSEBUTTONDOWN  and self.promotion_rect.collidepoint(event.pos):
+            if self.promotion_rect.collidepoint(event.pos):
                 index = (event.pos[1] - self.promotion_rect.top) // 128
                 rank = self.promotion_order[index]
-                logging.debug(f"Promote {self.promote[0]} to {rank}")
-                pos = self.promote[0].position
-                colour = self.promote[0].colour
-                rank_dict = {
-                    "Queen" : Queen,
-                    "Knight" : Knight,
-                    "Bishop" : Bishop,
-                    "Rook" : Rook
-                }
-                self.promote[0].destroy()
                 self.promote.clear()
                 self.promotion_rect = None
                 self.promotion_order = None
-                piece = self.create_piece(rank_dict[rank], colour, pos)
-                piece.has_moved = True
-                self.board.square_from_position(pos).place(piece)
+                # Replay the pawn move as a promotion so it is a single move on the undo stack
+                move = self.board.unmake_move()
+                self.board.make_move(move | (RANK_INDEX[rank] << 12))
+                piece = self.board.square_from_position(square_to_position(move_to(move))).piece
+                # Make sure to call post move methods after promotion e.g. evaluate_square_control
                 piece._post_move()
-
-        # Make sure to call post move methods after promotion e.g. evaluate_square_control
-        else:
-            for piece in self.pieces["Black"] + self.pieces["White"]:
-                piece.handle_event(event)
+            return
+
+        # Straight from the pixel to the square, no need to ask every piece
+        position = position_from_draw_position(*event.pos)
+        if not (0 <= position.x <= 7 and 0 <= position.y <= 7):
+            self.deselect()
+            return
+        square = position_to_square(position)
+
+        selected = self.selected
+        target = self._targets.get(square)
+        self.deselect()
+        if target is not None:
+            return selected.move_to(target)
+
+        # Clicking the selected piece again just deselects it
+        piece = self.board._square_list[square].piece
+        if (piece is None or piece is selected or piece._colour_index != self.board.bitboard.turn
+                or piece._colour_index not in self.human_colours):
+            return
+        piece.select()
+        self.selected = piece
+        self._targets = {position_to_square(target) : target for target in piece.current_moves + piece.current_captures}
+        if self.book is not None:
+            self._book_squares = [move_to(move) for move, _ in self.book.moves(self.board.bitboard) if move_from(move) == square]
+
+    def deselect(self):
+        if self.selected:
+            self.selected.selected = False
+        self.selected = None
+        self._targets = {}
+        self._book_squares = ()
+
+    def play_move(self, move : int):
+        "Plays a move that didn't come from a click, e.g. the computer's, and runs the post move checks"
+        self.deselect()
+        self.board.make_move(move)
+        piece = self.board.square_from_position(square_to_position(move_to(move))).piece
+        # Slide the piece across so the move can be followed
+        self.animation = (piece.image_name, move_from(move), move_to(move), time.perf_counter())
+        return piece._post_move()
+
+    def takeback(self):
+        "Take back the last move played"
+        if not self.board.bitboard.history:
+            return
+        self.animation = None
+        self.promote.clear()
+        self.promotion_rect = None
+        self.promotion_order = None
+        self.deselect()
+        self.board.unmake_move()
 
     def create_promotion_overlay(self):
+        "Lays out the promotion choices next to the pawn, returns the position of each choice"
+        import pygame
+
         location = self.promote[0].position
         if location.y == 0:
             location = Position(location.x, 3)
         
         rect = pygame.Rect(location.x * SQUARE_SIZE, (7 - location.y) * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE * 4)
-        pygame.draw.rect(window, (55, 55, 55), rect)
         draw_order = ["Queen", "Knight", "Rook", "Bishop"]
         colour = self.promote[0].colour
         if colour == "Black":
             draw_order.reverse()
-        for i, rank in enumerate(draw_order):
-            image = piece_images[f"{colour} {rank}"]
-            self.promote[0].window.blit(image, (location.x * SQUARE_SIZE, ((7 - location.y) + i) * SQUARE_SIZE))
 
         self.promotion_rect = rect
         self.promotion_order = draw_order
-
-
-    def move(self, piece, new_position):
-        self.board.move(piece, new_position)
+        return [(Position(location.x, location.y - i), rank) for i, rank in enumerate(draw_order)]
 
     def checkmate_calculator(self, colour):
-        valid_moves = []
+        # One piece with somewhere to go is enough to rule out mate
         for piece in self.pieces[colour]:
             moves, captures, defending = piece.possible_moves()
-            valid_moves = valid_moves + moves + captures
+            if moves or captures:
+                return
 
-        logging.debug(f"Number of valid moves for {colour}: {len(valid_moves)}")
+        if self.kings[COLOUR_INDEX[colour]].in_check:
+            self._checkmate(colour)
+        else:
+            self._stalemate()
 
-        if len(valid_moves) == 0:
-            logging.debug(f"=============================")
-            if self.king_dict[f"{colour} King"].in_check:
-                logging.debug(f"{colour} has been checkmated!")
-            else:
-                logging.debug("Stalemate")
\ No newline at end of file
+    def _checkmate(self, colour):
+        logging.info(f"{colour} has been checkmated!")
+
+    def _stalemate(self):
+        logging.info("Stalemate")
+
+
+# Hot paths, timed only while instrumentation is on
+timed(Piece, "possible_moves", "moves.possible_moves")
+timed(Piece, "_possible_moves", "moves.generate")
+timed(PieceManager, "checkmate_calculator", "mate.detect")
+timed(PieceManager, "draw_changed", "frame.draw")
+counted(PieceManager, "_checkmate", "game.checkmates")
+counted(PieceManager, "_stalemate", "game.stalemates")
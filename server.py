@@ -0,0 +1,239 @@
+"""Hosts many games at once for clients on this machine.
+
+Run from the command line, e.g.
+
+    python server.py --port 8765
+    python server.py --unix /tmp/chess.sock
+
+The protocol is one JSON object per line each way. Every request has an "op"
+and may carry an "id", which is echoed in its reply:
+
+    {"op": "new", "fen": ...}               -> {"game": 1, "fen": ..., "legal": [...]}
+    {"op": "move", "game": 1, "move": "e2e4"} -> {"fen": ..., "status": ..., "legal": [...]}
+    {"op": "legal", "game": 1}              -> {"legal": [...]}
+    {"op": "fen", "game": 1}                -> {"fen": ..., "status": ...}
+    {"op": "subscribe", "game": 1}          -> {}, then {"event": "move", ...} for every move played
+    {"op": "close", "game": 1}              -> {}
+
+Replies carry "ok": true, or "ok": false and an "error". Moves are UCI, and
+status is "ongoing", "checkmate" or "stalemate".
+
+Games are played with the GUI's rules (PieceManager, ChessBoard and the pieces'
+possible_moves), without drawing anything. Validating a move and looking for
+mate run on a thread pool so a slow game never holds up the event loop. Each
+game has a lock, so only one of its moves is worked on at a time. A subscriber
+that stops reading is disconnected once MAX_UNSENT_BYTES of events wait for it.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from board import *
+
+# Longest request line accepted, anything bigger closes the connection
+MAX_LINE_BYTES = 1 << 16
+# Events a subscriber hasn't read yet that are held for it before it is dropped
+MAX_UNSENT_BYTES = 1 << 20
+
+
+class Game:
+    "One hosted game"
+
+    def __init__(self, fen : str = None):
+        self.manager = PieceManager()
+        self.board = ChessBoard(8, self.manager)
+        if fen:
+            self.board.load_fen(fen)
+        else:
+            self.board.setup()
+        self.lock = asyncio.Lock()
+        # Connections to tell about every move
+        self.subscribers = set()
+        self.legal = self.legal_moves()
+
+    def legal_moves(self) -> list:
+        "Every legal move of the side to move, as the pieces see them"
+        moves = []
+        colour = self.board.bitboard.turn
+        for piece in self.manager.pieces[COLOUR_NAMES[colour]]:
+            from_square = position_to_square(piece.position)
+            targets, captures, _ = piece.possible_moves()
+            for target in (*targets, *captures):
+                to_square = position_to_square(target)
+                if piece._rank_index == PAWN and target.y in (0, 7):
+                    moves += [encode_move(from_square, to_square, rank) for rank in (QUEEN, ROOK, BISHOP, KNIGHT)]
+                else:
+                    moves.append(encode_move(from_square, to_square))
+        return moves
+
+    @property
+    def status(self) -> str:
+        if self.legal:
+            return "ongoing"
+        return "checkmate" if self.board.bitboard.in_check() else "stalemate"
+
+    def play(self, uci : str) -> dict:
+        "Plays a UCI move, raises ValueError if it isn't legal"
+        if self.status != "ongoing":
+            raise ValueError(f"Game is over, {self.status}")
+        move = move_from_uci(uci)
+        if move not in self.legal:
+            raise ValueError(f"Illegal move {uci}")
+        self.board.make_move(move)
+        piece = self.board.square_from_position(square_to_position(move_to(move))).piece
+        piece._post_move()
+        self.legal = self.legal_moves()
+        return self.describe()
+
+    def describe(self) -> dict:
+        return {"fen" : self.board.fen(), "status" : self.status, "legal" : [move_to_uci(move) for move in self.legal]}
+
+
+class GameServer:
+
+    def __init__(self, threads : int = None):
+        self.games = {}
+        self._next_game = 1
+        self.executor = ThreadPoolExecutor(max_workers = threads)
+
+    async def start(self, host : str = "127.0.0.1", port : int = SERVER_PORT, unix : str = None):
+        if unix:
+            return await asyncio.start_unix_server(self.handle_connection, unix, limit = MAX_LINE_BYTES)
+        return await asyncio.start_server(self.handle_connection, host, port, limit = MAX_LINE_BYTES)
+
+    async def handle_connection(self, reader, writer):
+        subscribed = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    # Line too long or the client went away
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                reply = await self.handle_request(line, writer, subscribed)
+                await self._send(writer, reply)
+        finally:
+            for game_id in subscribed:
+                game = self.games.get(game_id)
+                if game:
+                    game.subscribers.discard(writer)
+            writer.close()
+
+    async def handle_request(self, line : bytes, writer, subscribed : set) -> dict:
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Requests are JSON objects")
+            request_id = request.get("id")
+            reply = await self._dispatch(request, writer, subscribed)
+            reply["ok"] = True
+        except (ValueError, KeyError, TypeError) as error:
+            reply = {"ok" : False, "error" : str(error)}
+        if request_id is not None:
+            reply["id"] = request_id
+        return reply
+
+    async def _dispatch(self, request : dict, writer, subscribed : set) -> dict:
+        op = request.get("op")
+        loop = asyncio.get_running_loop()
+
+        if op == "new":
+            # Setting up a game works out its legal moves, so that runs off the loop too
+            game = await loop.run_in_executor(self.executor, Game, request.get("fen"))
+            game_id = self._next_game
+            self._next_game += 1
+            self.games[game_id] = game
+            return {"game" : game_id, **game.describe()}
+
+        game_id = request.get("game")
+        game = self.games.get(game_id)
+        if game is None:
+            raise ValueError(f"No game {game_id}")
+
+        if op == "move":
+            async with game.lock:
+                result = await loop.run_in_executor(self.executor, game.play, str(request["move"]))
+            # Subscribers hear about the move after the mover has its reply
+            loop.call_soon(self._broadcast, game, {"event" : "move", "game" : game_id, "move" : request["move"], **result})
+            return result
+        if op == "legal":
+            async with game.lock:
+                return {"legal" : [move_to_uci(move) for move in game.legal]}
+        if op == "fen":
+            async with game.lock:
+                return {"fen" : game.board.fen(), "status" : game.status}
+        if op == "subscribe":
+            game.subscribers.add(writer)
+            subscribed.add(game_id)
+            return {}
+        if op == "close":
+            del self.games[game_id]
+            return {}
+        raise ValueError(f"Unknown op {op}")
+
+    def _broadcast(self, game : Game, event : dict):
+        line = _encode(event)
+        for writer in list(game.subscribers):
+            if writer.is_closing():
+                game.subscribers.discard(writer)
+            elif writer.transport.get_write_buffer_size() + len(line) > MAX_UNSENT_BYTES:
+                # Can't wait on one slow reader without holding up everyone, so it is let go
+                logging.warning("Dropping a subscriber that isn't reading its events")
+                game.subscribers.discard(writer)
+                writer.close()
+            else:
+                writer.write(line)
+
+    async def _send(self, writer, message : dict):
+        writer.write(_encode(message))
+        await writer.drain()
+
+    def close(self):
+        self.executor.shutdown(wait = False, cancel_futures = True)
+
+def _encode(message : dict) -> bytes:
+    return (json.dumps(message, separators = (",", ":")) + "\n").encode()
+
+async def serve(host : str, port : int, unix : str = None, threads : int = None):
+    server = GameServer(threads)
+    listener = await server.start(host, port, unix)
+    where = unix or f"{host}:{port}"
+    logging.info(f"Serving games on {where}")
+    try:
+        # Stop cleanly when terminated, so a Unix socket file isn't left behind
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass # Windows
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+        if unix and os.path.exists(unix):
+            os.remove(unix)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Chess game server for local clients")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = SERVER_PORT)
+    parser.add_argument("--unix", metavar = "PATH", help = "listen on a Unix socket instead of TCP")
+    parser.add_argument("--threads", type = int, help = "threads that validate moves")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level = logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.threads))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""Endgame tablebases for king and queen, rook or pawn against a lone king.
+
+Build them once with
+
+    python tablebase.py build
+    python tablebase.py probe --fen "8/8/8/4k3/8/8/8/4K2R w - - 0 1"
+
+Each table is generated by retrograde analysis: every checkmate is found,
+then the analysis works backwards one ply at a time with un-moves, so every
+position is reached at its exact distance to mate. KPK is seeded from the KQK
+and KRK values of the positions just after promotion, so those are built
+first.
+
+A table has one byte per position, the distance to mate in plies from the
+side to move's point of view (even when the side to move is getting mated,
+odd when it is mating) or DRAW. The board is mirrored so the strong king is
+always on files a-d, which halves the table to 256 KiB. Tables are written
+as raw bytes and memory-mapped, so a probe is an index calculation and one
+byte read, and every process using them shares the same pages.
+
+Tables ignore castling rights and the fifty move rule; positions with
+castling rights aren't probed.
+"""
+import argparse
+import mmap
+import os
+import sys
+import time
+from collections import namedtuple
+
+from bitboard import *
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+# Built in this order, KPK needs the other two for promotions
+TABLE_RANKS = {"KQK" : QUEEN, "KRK" : ROOK, "KPK" : PAWN}
+
+DRAW = 255
+# Side to move (strong or weak) x strong king on files a-d x weak king x strong piece
+TABLE_SIZE = 2 * 32 * 64 * 64
+STRONG_TO_MOVE = 0
+WEAK_TO_MOVE = 1
+
+# Win (1), draw (0) or loss (-1) for the side to move, with plies to mate unless drawn
+Probe = namedtuple("Probe", ["wdl", "dtm"])
+
+
+def table_index(turn : int, strong_king : int, weak_king : int, piece : int) -> int:
+    "Where a position with the strong side playing up the board is kept, mirrored so the strong king is on files a-d"
+    if strong_king & 7 > 3:
+        strong_king ^= 7
+        weak_king ^= 7
+        piece ^= 7
+    return (((turn << 5) | ((strong_king >> 3) << 2) | (strong_king & 3)) << 12) | (weak_king << 6) | piece
+
+def _decode(index : int):
+    king = (index >> 12) & 31
+    return index >> 17, ((king >> 2) << 3) | (king & 3), (index >> 6) & 63, index & 63
+
+
+class _Generator:
+    "Retrograde analysis of one table, using the core's attack tables for the move rules"
+
+    def __init__(self, rank : int, promotions : dict = None):
+        self.rank = rank
+        # Finished tables by rank, for the positions after a pawn promotes
+        self.promotions = promotions or {}
+
+    def legal(self, turn : int, strong_king : int, weak_king : int, piece : int) -> bool:
+        if len({strong_king, weak_king, piece}) < 3 or KING_ATTACKS[strong_king] >> weak_king & 1:
+            return False
+        if self.rank == PAWN and not 8 <= piece < 56:
+            return False
+        if turn == STRONG_TO_MOVE:
+            # The weak side can't have been left in check
+            occupied = (1 << strong_king) | (1 << weak_king) | (1 << piece)
+            return not piece_attacks(WHITE_COLOUR, self.rank, piece, occupied) >> weak_king & 1
+        return True
+
+    def strong_unmoves(self, strong_king : int, weak_king : int, piece : int):
+        "Strong to move positions one strong move before this weak to move one"
+        occupied = (1 << strong_king) | (1 << weak_king) | (1 << piece)
+        for square in iter_squares(KING_ATTACKS[strong_king] & ~occupied):
+            if self.legal(STRONG_TO_MOVE, square, weak_king, piece):
+                yield table_index(STRONG_TO_MOVE, square, weak_king, piece)
+
+        if self.rank == PAWN:
+            origins = []
+            if piece >> 3 >= 2 and not occupied >> (piece - 8) & 1:
+                origins.append(piece - 8)
+                if piece >> 3 == 3 and not occupied >> (piece - 16) & 1:
+                    origins.append(piece - 16)
+        else:
+            origins = iter_squares(piece_attacks(WHITE_COLOUR, self.rank, piece, occupied) & ~occupied)
+        for square in origins:
+            if self.legal(STRONG_TO_MOVE, strong_king, weak_king, square):
+                yield table_index(STRONG_TO_MOVE, strong_king, weak_king, square)
+
+    def weak_unmoves(self, strong_king : int, weak_king : int, piece : int):
+        "Weak to move positions one king move before this strong to move one"
+        occupied = (1 << strong_king) | (1 << weak_king) | (1 << piece)
+        for square in iter_squares(KING_ATTACKS[weak_king] & ~occupied & ~KING_ATTACKS[strong_king]):
+            yield table_index(WEAK_TO_MOVE, strong_king, square, piece)
+
+    def generate(self) -> bytearray:
+        values = bytearray([DRAW]) * TABLE_SIZE
+        # Weak to move positions: moves not yet known to lose
+        counters = bytearray(TABLE_SIZE)
+        losses = []
+        # Strong to move positions that win by promoting, by plies to mate
+        seeds = {}
+
+        for index in range(TABLE_SIZE):
+            turn, strong_king, weak_king, piece = _decode(index)
+            if not self.legal(turn, strong_king, weak_king, piece):
+                continue
+            if turn == WEAK_TO_MOVE:
+                # The lone king can't step next to the strong king or onto an attacked square,
+                # sliders attack through it, and it can take the piece if that is undefended
+                attacked = KING_ATTACKS[strong_king] | piece_attacks(WHITE_COLOUR, self.rank, piece, 1 << strong_king | 1 << piece)
+                moves = popcount(KING_ATTACKS[weak_king] & ~attacked)
+                if moves:
+                    counters[index] = moves
+                elif attacked >> weak_king & 1:
+                    values[index] = 0
+                    losses.append(index)
+            elif self.rank == PAWN and piece >> 3 == 6 and piece + 8 not in (strong_king, weak_king):
+                for rank, table in self.promotions.items():
+                    value = table[table_index(WEAK_TO_MOVE, strong_king, weak_king, piece + 8)]
+                    if value != DRAW and value % 2 == 0:
+                        seeds.setdefault(value + 1, []).append(index)
+
+        depth = 0
+        while losses or seeds:
+            wins = []
+            for index in losses:
+                for previous in self.strong_unmoves(*_decode(index)[1:]):
+                    if values[previous] == DRAW:
+                        values[previous] = depth + 1
+                        wins.append(previous)
+            for index in seeds.pop(depth + 1, ()):
+                if values[index] == DRAW:
+                    values[index] = depth + 1
+                    wins.append(index)
+
+            losses = []
+            for index in wins:
+                for previous in self.weak_unmoves(*_decode(index)[1:]):
+                    if values[previous] == DRAW and counters[previous]:
+                        counters[previous] -= 1
+                        if not counters[previous]:
+                            values[previous] = depth + 2
+                            losses.append(previous)
+            depth += 2
+        return values
+
+def generate(name : str, promotions : dict = None) -> bytearray:
+    "Generates the table for name, one of TABLE_RANKS; KPK needs the finished KQK and KRK tables by rank"
+    return _Generator(TABLE_RANKS[name], promotions).generate()
+
+def _load(directory : str, name : str):
+    path = os.path.join(directory, f"{name}.tb")
+    if os.path.exists(path) and os.path.getsize(path) == TABLE_SIZE:
+        with open(path, "rb") as file:
+            return bytearray(file.read())
+    return None
+
+def build(directory : str = TABLEBASE_DIR, names = tuple(TABLE_RANKS)) -> dict:
+    "Generates and writes every table in names, returns {name : table}"
+    os.makedirs(directory, exist_ok = True)
+    tables = {}
+    for name in TABLE_RANKS:
+        if name not in names:
+            continue
+        promotions = None
+        if name == "KPK":
+            promotions = {TABLE_RANKS[other] : tables.get(other) or _load(directory, other) or generate(other)
+                          for other in ("KQK", "KRK")}
+        tables[name] = generate(name, promotions)
+        with open(os.path.join(directory, f"{name}.tb"), "wb") as file:
+            file.write(tables[name])
+    return tables
+
+
+class Tablebases:
+    "Whatever tables are in a directory, memory-mapped"
+
+    def __init__(self, directory : str = None):
+        self.tables = {}
+        self._files = []
+        if directory is None or not os.path.isdir(directory):
+            return
+        for name, rank in TABLE_RANKS.items():
+            path = os.path.join(directory, f"{name}.tb")
+            if not os.path.exists(path) or os.path.getsize(path) != TABLE_SIZE:
+                continue
+            file = open(path, "rb")
+            self._files.append(file)
+            self.tables[rank] = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+
+    def __bool__(self) -> bool:
+        return bool(self.tables)
+
+    def close(self) -> None:
+        for table in self.tables.values():
+            table.close()
+        for file in self._files:
+            file.close()
+        self.tables = {}
+        self._files = []
+
+    def probe(self, board : BitBoard):
+        "Probe of board's position for the side to move, None if no table covers it"
+        # Cheap way out for more than three pieces, the usual case in a search
+        rest = board.occupied
+        for _ in range(3):
+            rest &= rest - 1
+        if rest or board.castling:
+            return None
+        if popcount(board.occupied) == 2:
+            return Probe(0, None)
+
+        strong = WHITE_COLOUR if board.occupancy[WHITE_COLOUR] & (board.occupancy[WHITE_COLOUR] - 1) else BLACK_COLOUR
+        rank = board.mailbox[lowest_square(board.occupancy[strong] & ~board.pieces[strong][KING])][1]
+        if rank in (KNIGHT, BISHOP):
+            # Can't mate
+            return Probe(0, None)
+        table = self.tables.get(rank)
+        if table is None:
+            return None
+
+        strong_king = board.king_square(strong)
+        weak_king = board.king_square(strong ^ 1)
+        piece = lowest_square(board.pieces[strong][rank])
+        if strong == BLACK_COLOUR:
+            # Tables have the strong side playing up the board
+            strong_king ^= 56
+            weak_king ^= 56
+            piece ^= 56
+        value = table[table_index(STRONG_TO_MOVE if board.turn == strong else WEAK_TO_MOVE, strong_king, weak_king, piece)]
+        if value == DRAW:
+            return Probe(0, None)
+        return Probe(-1 if value % 2 == 0 else 1, value)
+
+    def best_move(self, board : BitBoard):
+        """The quickest mate, the longest defence, or a move that keeps the draw, as (move, probe of board).
+        None if board isn't covered"""
+        probe = self.probe(board)
+        if probe is None:
+            return None
+        best = None
+        best_key = None
+        for move in board.generate_moves():
+            board.make_move(move)
+            child = self.probe(board)
+            board.unmake_move()
+            if child is None:
+                return None
+            # Mate soonest when winning, latest when losing
+            if child.wdl < 0:
+                key = (2, -child.dtm)
+            elif child.wdl == 0:
+                key = (1, 0)
+            else:
+                key = (0, child.dtm)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return (best, probe) if best is not None else None
+
+
+_default = None
+
+def default_tablebases() -> Tablebases:
+    "The tables in TABLEBASE_DIR, opened once per process"
+    global _default
+    if _default is None:
+        _default = Tablebases(TABLEBASE_DIR)
+    return _default
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(description = "Build and probe the KQK, KRK and KPK endgame tablebases")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    build_parser = commands.add_parser("build", help = "generate the tables")
+    build_parser.add_argument("--dir", default = TABLEBASE_DIR)
+    build_parser.add_argument("tables", nargs = "*", metavar = "TABLE", help = f"any of {', '.join(TABLE_RANKS)}, all by default")
+    probe_parser = commands.add_parser("probe", help = "look up a position")
+    probe_parser.add_argument("--dir", default = TABLEBASE_DIR)
+    probe_parser.add_argument("--fen", required = True)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        unknown = set(args.tables) - set(TABLE_RANKS)
+        if unknown:
+            parser.error(f"unknown tables: {', '.join(sorted(unknown))}")
+        for name in args.tables or TABLE_RANKS:
+            start = time.perf_counter()
+            table = build(args.dir, (name,))[name]
+            wins = sum(1 for value in table if value != DRAW and value % 2)
+            longest = max(value for value in table if value != DRAW)
+            print(f"{name}: {wins} wins for the side to move, longest mate {longest} plies, "
+                  f"{time.perf_counter() - start:.1f}s")
+        return 0
+
+    board = BitBoard.from_fen(args.fen)
+    tablebases = Tablebases(args.dir)
+    probe = tablebases.probe(board)
+    if probe is None:
+        print("not in the tables")
+        return 1
+    result = {1 : "win", 0 : "draw", -1 : "loss"}[probe.wdl]
+    best = tablebases.best_move(board)
+    print(f"{result}" + (f", mate in {probe.dtm} plies" if probe.dtm is not None else "")
+          + (f", best move {move_to_uci(best[0])}" if best else ""))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from batch import Batch
+from bitboard import STARTING_FEN, BitBoard
+from perft import PERFT_POSITIONS
+
+
+def random_boards(count : int, seed : int = 0) -> list:
+    rng = random.Random(seed)
+    boards = []
+    board = BitBoard.from_fen(STARTING_FEN)
+    while len(boards) < count:
+        moves = board.generate_moves()
+        if not moves or rng.random() < 0.01:
+            board = BitBoard.from_fen(STARTING_FEN)
+            continue
+        board.make_move(rng.choice(moves))
+        boards.append(board.copy())
+    boards += [BitBoard.from_fen(fen) for fen, _ in PERFT_POSITIONS.values() if fen]
+    return boards
+
+def test_batch_matches_core():
+    boards = random_boards(500)
+    batch = Batch.from_boards(boards)
+    assert list(batch.legal_move_counts()) == [len(board.generate_moves()) for board in boards]
+    assert list(batch.in_check()) == [board.in_check() for board in boards]
+    # Batches don't keep the move clocks
+    assert [batch.fen(index).split()[:4] for index in range(len(batch))] == [board.fen().split()[:4] for board in boards]
@@ -0,0 +1,33 @@
+import pytest
+
+from bitboard import STARTING_FEN, BitBoard, move_from_uci
+from book import move_from_polyglot, move_to_polyglot, polyglot_key
+
+# Keys from the Polyglot book format description
+REFERENCE_KEYS = [
+    ("", 0x463b96181691fc9c),
+    ("e2e4", 0x823c9b50fd114196),
+    ("e2e4 d7d5", 0x0756b94461c50fb0),
+    ("e2e4 d7d5 e4e5", 0x662fafb965db29d4),
+    ("e2e4 d7d5 e4e5 f7f5", 0x22a48b5a8e47ff78),
+    ("e2e4 d7d5 e4e5 f7f5 e1e2", 0x652a607ca3f242c1),
+    ("e2e4 d7d5 e4e5 f7f5 e1e2 e8f7", 0x00fdd303c946bdd9),
+    ("a2a4 b7b5 h2h4 b5b4 c2c4", 0x3c8123ea7b067637),
+    ("a2a4 b7b5 h2h4 b5b4 c2c4 b4c3 a1a3", 0x5c3f9b829b279560),
+]
+
+
+def play(moves : str) -> BitBoard:
+    board = BitBoard.from_fen(STARTING_FEN)
+    for text in moves.split():
+        board.make_move(move_from_uci(text))
+    return board
+
+@pytest.mark.parametrize("moves, key", REFERENCE_KEYS)
+def test_polyglot_key(moves, key):
+    assert polyglot_key(play(moves)) == key
+
+def test_castling_moves_round_trip():
+    board = BitBoard.from_fen("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+    for move in board.generate_moves():
+        assert move_from_polyglot(board, move_to_polyglot(board, move)) == move
@@ -0,0 +1,26 @@
+import pytest
+
+from bitboard import STARTING_FEN, BitBoard, move_from_uci
+from engine import MATE_BOUND, Engine
+from tablebase import Tablebases
+
+
+@pytest.fixture
+def engine():
+    return Engine(1, Tablebases())
+
+@pytest.mark.parametrize("nodes", [1, 500, 1500, 5000])
+def test_node_limit_is_exact(engine, nodes):
+    result = engine.search(BitBoard.from_fen(STARTING_FEN), nodes = nodes)
+    assert result.nodes == nodes
+    assert result.best_move in BitBoard.from_fen(STARTING_FEN).generate_moves()
+
+def test_finds_mate_in_one(engine):
+    result = engine.search(BitBoard.from_fen("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1"), depth = 3)
+    assert result.best_move == move_from_uci("a1a8")
+    assert result.score >= MATE_BOUND
+
+def test_search_leaves_board_unchanged(engine):
+    board = BitBoard.from_fen(STARTING_FEN)
+    engine.search(board, depth = 3)
+    assert board.fen() == STARTING_FEN
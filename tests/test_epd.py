@@ -0,0 +1,26 @@
+from epd import Checker, parse_epd
+
+PERFT_LINE = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 ;D1 20 ;D2 400 ;D3 8902"
+
+
+def test_parse_perftsuite_line():
+    fen, operations = parse_epd(PERFT_LINE)
+    assert fen == "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+    assert operations["D3"] == ["8902"]
+
+def test_perft_counts():
+    checker = Checker(perft_depth = 3)
+    assert checker.check(PERFT_LINE) == []
+    assert checker.check(PERFT_LINE.replace("8902", "8903")) == ["perft 3: 8902 nodes, expected 8903"]
+
+def test_malformed_lines_fail_alone():
+    checker = Checker(perft_depth = 2)
+    assert checker.check(PERFT_LINE.replace("D2 400", "D2 four")) != []
+    assert checker.check("8/8/8/8/8/8/8/8 w - - ;D1 0") != []
+    assert checker.check("4k3/8/8/8/8/8/8/P3K3 w - - ;D1 5") != []
+    assert checker.check(PERFT_LINE) == []
+
+def test_best_move():
+    checker = Checker(depth = 2, hash_mb = 1)
+    assert checker.check("6k1/5ppp/8/8/8/8/8/R5K1 w - - bm Ra8#;") == []
+    assert checker.check("6k1/5ppp/8/8/8/8/8/R5K1 w - - am Ra8#;") == ["played Ra8#, which is to be avoided"]
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from bitboard import STARTING_FEN, BitBoard, move_to_uci
+from perft import PERFT_POSITIONS
+
+
+@pytest.mark.parametrize("fen", [STARTING_FEN] + [fen for fen, _ in PERFT_POSITIONS.values() if fen])
+def test_fen_round_trip(fen):
+    assert BitBoard.from_fen(fen).fen() == fen
+
+def test_fen_round_trip_random_games():
+    rng = random.Random(1)
+    board = BitBoard.from_fen(STARTING_FEN)
+    for _ in range(200):
+        moves = board.generate_moves()
+        if not moves:
+            break
+        board.make_move(rng.choice(moves))
+        copy = BitBoard.from_fen(board.fen())
+        assert copy.fen() == board.fen()
+        assert copy.hash == board.hash
+
+@pytest.mark.parametrize("fen", [
+    "8/8/8/8/8/8/8/8 w - - 0 1",
+    "rnbq1bnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQ - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKKNR w kq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNX w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQxq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq z9 0 1",
+    "4k3/8/8/8/8/8/8/P3K3 w - - 0 1",
+    "4k2p/8/8/8/8/8/8/4K3 b - - 0 1",
+])
+def test_invalid_fen(fen):
+    with pytest.raises(ValueError):
+        BitBoard.from_fen(fen)
+
+@pytest.mark.parametrize("fen, castling", [
+    ("4k3/8/8/8/8/8/8/R3K2b w KQ - 0 1", "Q"),
+    ("r3k2r/8/8/8/8/8/8/R4K1R w KQkq - 0 1", "kq"),
+    ("r3k2R/8/8/8/8/8/8/4K3 w kq - 0 1", "q"),
+    ("4k3/8/8/8/8/8/8/4K3 w KQkq - 0 1", "-"),
+])
+def test_castling_rights_need_king_and_rook_at_home(fen, castling):
+    assert BitBoard.from_fen(fen).fen().split()[2] == castling
+
+def test_no_castling_with_a_missing_rook():
+    board = BitBoard.from_fen("4k3/8/8/8/8/8/8/R3K2b w KQ - 0 1")
+    assert sorted(move_to_uci(move) for move in board.generate_moves() if move_to_uci(move)[:2] == "e1") \
+        == ["e1c1", "e1d1", "e1d2", "e1e2", "e1f1", "e1f2"]
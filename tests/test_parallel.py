@@ -0,0 +1,27 @@
+from bitboard import BitBoard, move_from_uci
+from engine import Engine
+from parallel import ParallelSearch, parallel_divide
+from perft import PERFT_POSITIONS, load_position
+from tablebase import Tablebases
+
+# White is in check with one way out, and no mate in sight
+ONE_REPLY = "r1b5/p2rp2k/1p1p1p1p/2p5/P1P2PnP/NP1P4/nBR1Pq2/3QKB1R w - - 7 23"
+
+
+def test_full_depth_searches_a_single_reply():
+    board = BitBoard.from_fen(ONE_REPLY)
+    assert len(board.generate_moves()) == 1
+    engine = Engine(1, Tablebases())
+    assert engine.search(board, depth = 4).depth == 1
+    assert engine.search(board, depth = 4, full_depth = True).depth == 4
+
+def test_parallel_divide():
+    board = load_position("kiwipete")
+    counts = parallel_divide(board, 2, workers = 2)
+    assert len(counts) == PERFT_POSITIONS["kiwipete"][1][0]
+    assert sum(counts.values()) == PERFT_POSITIONS["kiwipete"][1][1]
+
+def test_parallel_search_finds_mate():
+    with ParallelSearch(2, 1) as search:
+        result = search.search(BitBoard.from_fen("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1"), depth = 3)
+    assert result.best_move == move_from_uci("a1a8")
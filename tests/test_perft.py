@@ -0,0 +1,21 @@
+import pytest
+
+from perft import PERFT_POSITIONS, load_position, perft
+
+# Deepest count checked per position, enough to cover castling, en passant and promotions
+PERFT_NODE_LIMIT = 100000
+
+
+@pytest.mark.parametrize("name", PERFT_POSITIONS)
+def test_perft(name):
+    board = load_position(name)
+    for depth, expected in enumerate(PERFT_POSITIONS[name][1], 1):
+        if expected > PERFT_NODE_LIMIT:
+            break
+        assert perft(board, depth) == expected, f"{name} depth {depth}"
+
+def test_perft_leaves_board_unchanged():
+    board = load_position("kiwipete")
+    fen, hash = board.fen(), board.hash
+    perft(board, 3)
+    assert (board.fen(), board.hash) == (fen, hash)
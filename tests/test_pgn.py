@@ -0,0 +1,48 @@
+import io
+
+from pgn import Replayer, movetext_tokens, read_games
+
+GAMES = b"""[Event "Zeros"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. 0-0 Nf6 5. d3 d6 6. Bg5 h6 7. Bh4 Be6
+8. Nc3 Qd7 9. a3 0-0-0 {long castling, zero style} 10. b4 1-0
+
+[Event "Letters"]
+[Result "*"]
+
+1.e4 c5 2.Nf3 (2.c3 d5) 2...d6 $1 3.d4 cxd4 4.Nxd4 Nf6 5.Nc3 a6 6.Be2 e5
+7.Nb3 Be7 8.O-O O-O *
+
+[Event "Bad"]
+[Result "*"]
+
+1. e4 e5 2. Ke3 *
+"""
+
+
+def test_movetext_tokens_keep_zero_castling():
+    assert movetext_tokens("4. 0-0 Nf6 5...0-0-0 1-0") == ["0-0", "Nf6", "0-0-0", "1-0"]
+    assert movetext_tokens("1.e4 e5 2 Nf3 1/2-1/2") == ["e4", "e5", "Nf3", "1/2-1/2"]
+
+def test_read_and_replay():
+    games = list(read_games(io.BytesIO(GAMES)))
+    assert [game.headers["Event"] for game in games] == ["Zeros", "Letters", "Bad"]
+    assert games[0].moves[6] == "0-0" and games[0].moves[17] == "0-0-0"
+    assert games[0].result == "1-0"
+    # Variations and NAGs are dropped
+    assert games[1].moves[:4] == ["e4", "c5", "Nf3", "d6"]
+
+    replayer = Replayer()
+    assert replayer.replay(games[0]) is None
+    assert replayer.replay(games[1]) is None
+    problem = replayer.replay(games[2])
+    assert (problem.ply, problem.san) == (2, "Ke3")
+    assert replayer.plies == 19 + 16 + 2
+    # The board is unwound after every game
+    assert not replayer.board.history
+
+def test_read_games_from_offset():
+    games = list(read_games(io.BytesIO(GAMES)))
+    again = list(read_games(io.BytesIO(GAMES), games[1].offset, games[2].offset))
+    assert [game.headers["Event"] for game in again] == ["Letters"]
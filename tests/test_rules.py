@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from bitboard import move_to_uci
+from perft import PERFT_POSITIONS
+from server import Game
+
+
+def assert_rules_agree(game : Game):
+    pieces = sorted(map(move_to_uci, game.legal))
+    core = sorted(map(move_to_uci, game.board.bitboard.generate_moves()))
+    assert pieces == core, game.board.fen()
+
+@pytest.mark.parametrize("name", PERFT_POSITIONS)
+def test_rules_agree_on_perft_positions(name):
+    fen, _ = PERFT_POSITIONS[name]
+    game = Game(fen)
+    assert_rules_agree(game)
+    # One ply further, which covers every kind of move the position has
+    for move in list(game.legal):
+        child = Game(game.board.fen())
+        child.play(move_to_uci(move))
+        assert_rules_agree(child)
+
+@pytest.mark.parametrize("fen, castle", [
+    ("4k3/8/8/8/8/8/8/R3K2b w KQ - 0 1", "e1c1"),
+    ("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1", "e1c1"),
+    ("r3k2r/8/8/8/8/8/8/R3K2R w Kq - 0 1", "e1g1"),
+    ("rn2k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1", "e8g8"),
+])
+def test_rules_agree_on_castling(fen, castle):
+    game = Game(fen)
+    assert_rules_agree(game)
+    game.play(castle)
+    assert_rules_agree(game)
+
+@pytest.mark.parametrize("seed", range(8))
+def test_rules_agree_over_random_games(seed):
+    rng = random.Random(seed)
+    game = Game()
+    for _ in range(150):
+        assert_rules_agree(game)
+        if game.status != "ongoing":
+            break
+        game.play(move_to_uci(rng.choice(game.legal)))
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from bitboard import BLACK_COLOUR, KING, PAWN, WHITE_COLOUR, BitBoard
+from tablebase import TABLE_RANKS, Probe, Tablebases, build
+
+# Positions sampled per table, each checked against all of its children
+SAMPLES = 400
+
+
+@pytest.fixture(scope = "module")
+def tablebases(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("tablebases")
+    build(str(directory))
+    tablebases = Tablebases(str(directory))
+    yield tablebases
+    tablebases.close()
+
+def random_position(rng : random.Random, rank : int) -> BitBoard:
+    "A legal position of the two kings and one piece of rank"
+    while True:
+        strong_king, weak_king, piece = rng.sample(range(64), 3)
+        if rank == PAWN and not 8 <= piece < 56:
+            continue
+        strong = rng.choice((WHITE_COLOUR, BLACK_COLOUR))
+        turn = rng.choice((WHITE_COLOUR, BLACK_COLOUR))
+        board = BitBoard()
+        board.place(strong, KING, strong_king)
+        board.place(strong ^ 1, KING, weak_king)
+        board.place(strong, rank, piece)
+        board.set_state(turn, 0, -1)
+        if not board.is_attacked(board.king_square(turn ^ 1), turn):
+            return board
+
+def expected_probe(tablebases : Tablebases, board : BitBoard) -> Probe:
+    "What the probe must be given the probes one ply on"
+    moves = board.generate_moves()
+    if not moves:
+        return Probe(-1, 0) if board.in_check() else Probe(0, None)
+    children = []
+    for move in moves:
+        board.make_move(move)
+        children.append(tablebases.probe(board))
+        board.unmake_move()
+    losses = [child.dtm for child in children if child.wdl < 0]
+    if losses:
+        return Probe(1, min(losses) + 1)
+    if any(child.wdl == 0 for child in children):
+        return Probe(0, None)
+    return Probe(-1, max(child.dtm for child in children) + 1)
+
+@pytest.mark.parametrize("name", TABLE_RANKS)
+def test_one_ply_consistency(tablebases, name):
+    rng = random.Random(name)
+    for _ in range(SAMPLES):
+        board = random_position(rng, TABLE_RANKS[name])
+        assert tablebases.probe(board) == expected_probe(tablebases, board), board.fen()
+
+def test_best_move_mates(tablebases):
+    board = BitBoard.from_fen("7k/8/6K1/8/8/8/8/1Q6 w - - 0 1")
+    move, probe = tablebases.best_move(board)
+    assert probe == Probe(1, 1)
+    board.make_move(move)
+    assert not board.generate_moves() and board.in_check()
@@ -0,0 +1,66 @@
+import io
+import threading
+
+from uci import UCI
+
+# Long enough for any of these searches, short enough that a hang fails the test
+TIMEOUT = 20
+
+
+def run(commands : str) -> list:
+    "Runs a UCI session over commands, returns its output lines"
+    output = io.StringIO()
+    thread = threading.Thread(target = UCI(output).run, args = (io.StringIO(commands),), daemon = True)
+    thread.start()
+    thread.join(TIMEOUT)
+    assert not thread.is_alive(), "UCI session didn't end"
+    return output.getvalue().splitlines()
+
+def bestmoves(lines : list) -> list:
+    return [line for line in lines if line.startswith("bestmove")]
+
+def test_uci_handshake():
+    lines = run("uci\nisready\nquit\n")
+    assert "uciok" in lines and lines[-1] == "readyok"
+
+def test_go_depth():
+    uci = UCI(io.StringIO())
+    uci.handle("position startpos moves e2e4")
+    uci.handle("go depth 3")
+    uci.wait()
+    lines = uci.output.getvalue().splitlines()
+    assert any(line.startswith("info depth 3 ") for line in lines)
+    assert len(bestmoves(lines)) == 1
+
+def test_go_without_limits_runs_until_stop():
+    uci = UCI(io.StringIO())
+    uci.handle("position startpos")
+    uci.handle("go")
+    thread = uci._search
+    thread.join(0.2)
+    assert thread.is_alive()
+    assert bestmoves(uci.output.getvalue().splitlines()) == []
+    uci.handle("stop")
+    assert not thread.is_alive()
+    assert len(bestmoves(uci.output.getvalue().splitlines())) == 1
+
+def test_quit_ends_infinite_search():
+    lines = run("position startpos\ngo infinite\nquit\n")
+    assert len(bestmoves(lines)) == 1
+
+def test_quit_returns_false():
+    uci = UCI(io.StringIO())
+    assert uci.handle("quit") is False
+    assert uci.handle("isready") is True
+
+def test_commands_wait_for_limited_search():
+    lines = run("position startpos\ngo depth 2\nposition startpos moves e2e4\ngo depth 2\nquit\n")
+    assert len(bestmoves(lines)) == 2
+
+def test_mate_in_one():
+    uci = UCI(io.StringIO())
+    uci.handle("position fen 6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1")
+    uci.handle("go depth 2")
+    uci.wait()
+    lines = uci.output.getvalue().splitlines()
+    assert bestmoves(lines)[0].split()[1] == "a1a8"
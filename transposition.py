@@ -0,0 +1,142 @@
+"""Fixed size transposition table keyed by Zobrist hash.
+
+The table is sized in megabytes when it is created and never grows. Entries
+live in buckets of two slots: the first slot keeps the deepest (most expensive)
+result seen for that bucket in the current search, the second is always
+replaced. Anything stored in an earlier search (see new_search) can be
+overwritten no matter its depth.
+
+Values are 64 bit signed ints held in an array next to the keys, so the size
+asked for is the memory used: perft subtree counts as they are, search results
+packed into one int by the engine. ObjectTable is the same table for values
+that are Python objects, e.g. the pieces' move lists; as how big those are
+isn't known it is sized in slots instead.
+
+Callers salt the key for anything that depends on more than the position
+(e.g. perft_key for perft depth, move_list_key for the piece whose moves are
+cached).
+"""
+from array import array
+
+# Bytes per slot: key (8), depth (2), age (2) and value (8), each in its own array
+ENTRY_BYTES = 20
+BUCKET_SIZE = 2
+
+# Salts so perft counts at different depths never collide with each other or with other entries
+_PERFT_SALTS = [(0x9E3779B97F4A7C15 * (depth + 1)) & ((1 << 64) - 1) for depth in range(64)]
+
+# Salts for move lists cached per square of the moving piece
+_SQUARE_SALTS = [(0xC2B2AE3D27D4EB4F * (square + 1)) & ((1 << 64) - 1) for square in range(64)]
+
+def perft_key(hash : int, depth : int) -> int:
+    return hash ^ _PERFT_SALTS[depth]
+
+def move_list_key(hash : int, square : int) -> int:
+    return hash ^ _SQUARE_SALTS[square]
+
+
+class TranspositionTable:
+    "Table of int values, see the module docstring"
+
+    def __init__(self, size_mb : float = 16):
+        self.size_mb = size_mb
+        self._allocate(max(1, int(size_mb * 1024 * 1024) // (ENTRY_BYTES * BUCKET_SIZE)))
+
+    def _allocate(self, buckets : int) -> None:
+        # Round down to a power of two so the bucket index is a mask
+        self.buckets = 1 << (buckets.bit_length() - 1)
+        self._mask = self.buckets - 1
+        self.slots = self.buckets * BUCKET_SIZE
+        self.age = 1
+        self.clear()
+
+    def _new_values(self):
+        return array("q", bytes(8 * self.slots))
+
+    def __len__(self) -> int:
+        return self.slots - self.ages.count(0)
+
+    def new_search(self) -> None:
+        "Marks every entry as stale so it can be replaced regardless of depth"
+        self.age = (self.age + 1) & 0xFFFF or 1
+
+    def clear(self) -> None:
+        slots = self.slots
+        self.keys = array("Q", bytes(8 * slots))
+        self.depths = array("h", bytes(2 * slots))
+        # Age 0 marks an empty slot, new_search never uses it
+        self.ages = array("H", bytes(2 * slots))
+        self.values = self._new_values()
+        self.hits = self.misses = self.stores = self.overwrites = 0
+
+    def probe(self, key : int):
+        "Returns (depth, value) stored for key, or None"
+        slot = (key & self._mask) * BUCKET_SIZE
+        keys = self.keys
+        for index in (slot, slot + 1):
+            if keys[index] == key and self.ages[index]:
+                self.hits += 1
+                return self.depths[index], self.values[index]
+        self.misses += 1
+        return None
+
+    def get(self, key : int, default = None):
+        "Returns the value stored for key regardless of depth"
+        entry = self.probe(key)
+        return default if entry is None else entry[1]
+
+    def store(self, key : int, depth : int, value) -> None:
+        slot = (key & self._mask) * BUCKET_SIZE
+        keys = self.keys
+        depths = self.depths
+        ages = self.ages
+
+        # Same position, always refresh it in place
+        if keys[slot] == key:
+            index = slot
+        elif keys[slot + 1] == key:
+            index = slot + 1
+        # Depth preferred slot, taken if deeper or left over from an earlier search
+        elif ages[slot] != self.age or depth >= depths[slot]:
+            index = slot
+        # Otherwise always replace the second slot
+        else:
+            index = slot + 1
+
+        if ages[index] and keys[index] != key:
+            self.overwrites += 1
+        keys[index] = key
+        depths[index] = depth
+        ages[index] = self.age
+        self.values[index] = value
+        self.stores += 1
+
+    def hashfull(self) -> int:
+        "Permille of the first thousand slots used in the current search, as UCI reports it"
+        sample = min(1000, self.slots)
+        used = sum(1 for index in range(sample) if self.ages[index] == self.age)
+        return used * 1000 // sample
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size_mb" : self.size_mb,
+            "slots" : self.slots,
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "hit_rate" : self.hits / lookups if lookups else 0.0,
+            "stores" : self.stores,
+            "overwrites" : self.overwrites
+        }
+
+
+class ObjectTable(TranspositionTable):
+    """The same table holding any Python value. What is stored isn't counted,
+    so it is sized by the number of slots rather than in megabytes"""
+
+    def __init__(self, slots : int):
+        self.size_mb = None
+        self._allocate(max(1, slots // BUCKET_SIZE))
+
+    def _new_values(self):
+        return [None] * self.slots
@@ -0,0 +1,268 @@
+"""UCI front end, so the engine can be driven by match and benchmark tools.
+
+Run with
+
+    python uci.py
+
+and speak UCI on standard input and output. Besides the usual handshake
+(uci, isready, ucinewgame, setoption name Hash / Threads / BookFile, quit) it understands
+
+    position startpos|fen <fen> [moves <uci> ...]
+    go [depth N] [nodes N] [movetime ms] [wtime ms btime ms winc ms binc ms movestogo N] [infinite]
+                    without a depth, nodes, movetime or clock it searches until stop
+    stop
+    perft N         counts below each root move, then the total
+    d               prints the current position as FEN
+
+Searches run on a thread so stop (and isready) are answered straight away.
+Only the bitboard core and the engine are loaded, never pygame, so nothing
+but protocol output is written to standard output.
+"""
+import sys
+import threading
+import time
+
+from bitboard import BitBoard, STARTING_FEN, move_from_uci, move_to_uci
+from book import OpeningBook
+from engine import Engine, MATE, MATE_BOUND
+from parallel import ParallelSearch
+from perft import divide
+
+ENGINE_NAME = "Pygame Chess"
+ENGINE_AUTHOR = "Pygame Chess contributors"
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+# More than one searches the root moves on a pool of that many processes
+MAX_THREADS = 64
+# Share of the remaining clock spent on one move when the number of moves left isn't given
+DEFAULT_MOVES_TO_GO = 30
+# Kept back from every clock based move time for sending the move
+MOVE_OVERHEAD_SECONDS = 0.05
+
+
+def score_text(score : int) -> str:
+    if abs(score) >= MATE_BOUND:
+        plies = MATE - abs(score)
+        return f"mate {(plies + 1) // 2 if score > 0 else -((plies + 1) // 2)}"
+    return f"cp {score}"
+
+def move_time(options : dict, turn : int):
+    "Seconds to think given go's clock options, None when there is no clock"
+    if "movetime" in options:
+        return options["movetime"] / 1000
+    clock = options.get("wtime" if turn == 0 else "btime")
+    if clock is None:
+        return None
+    increment = options.get("winc" if turn == 0 else "binc", 0)
+    moves_to_go = options.get("movestogo") or DEFAULT_MOVES_TO_GO
+    budget = clock / moves_to_go + increment * 0.8
+    return max(0.01, min(budget, clock * 0.8) / 1000 - MOVE_OVERHEAD_SECONDS)
+
+
+class UCI:
+
+    def __init__(self, output = sys.stdout):
+        self.output = output
+        self._output_lock = threading.Lock()
+        self.hash_mb = DEFAULT_HASH_MB
+        self.threads = 1
+        self.engine = Engine(self.hash_mb)
+        self._start_board = BitBoard.from_fen(STARTING_FEN)
+        self.board = self._start_board.copy()
+        # What the current board was set up from, so a position that only adds moves just plays them
+        self._base = STARTING_FEN
+        self._moves = []
+        self._search = None
+        self._infinite = False
+        # Polyglot book consulted before searching, see setoption name BookFile
+        self.book = None
+        self._stop = threading.Event()
+
+    def send(self, line : str) -> None:
+        with self._output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self, input = sys.stdin) -> None:
+        for line in input:
+            if not self.handle(line):
+                break
+        self.stop()
+        if isinstance(self.engine, ParallelSearch):
+            self.engine.close()
+
+    def handle(self, line : str) -> bool:
+        "Acts on one command line, returns False for quit"
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == "quit":
+            return False
+        handler = getattr(self, f"_command_{command}", None)
+        if handler is None:
+            self.send(f"info string Unknown command: {command}")
+            return True
+        try:
+            handler(arguments)
+        except ValueError as error:
+            self.send(f"info string {error}")
+        return True
+
+    def _command_uci(self, arguments : list) -> None:
+        self.send(f"id name {ENGINE_NAME}")
+        self.send(f"id author {ENGINE_AUTHOR}")
+        self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}")
+        self.send(f"option name Threads type spin default 1 min 1 max {MAX_THREADS}")
+        self.send("option name BookFile type string default <empty>")
+        self.send("uciok")
+
+    def _command_isready(self, arguments : list) -> None:
+        self.send("readyok")
+
+    def _command_ucinewgame(self, arguments : list) -> None:
+        self.wait()
+        self.engine.new_game()
+
+    def _command_setoption(self, arguments : list) -> None:
+        text = " ".join(arguments)
+        name, _, value = text.partition(" value ")
+        name = name.replace("name", "", 1).strip().lower()
+        if name == "hash":
+            self.wait()
+            self.hash_mb = max(1, min(MAX_HASH_MB, int(value)))
+            self._new_engine()
+        elif name == "threads":
+            self.wait()
+            self.threads = max(1, min(MAX_THREADS, int(value)))
+            self._new_engine()
+        elif name == "bookfile":
+            self.wait()
+            if self.book is not None:
+                self.book.close()
+            value = value.strip()
+            try:
+                self.book = OpeningBook(value) if value and value != "<empty>" else None
+            except OSError as error:
+                self.book = None
+                raise ValueError(f"Can't open book: {error}")
+
+    def _new_engine(self) -> None:
+        if isinstance(self.engine, ParallelSearch):
+            self.engine.close()
+        # Each worker of a parallel search has a table of this size
+        self.engine = Engine(self.hash_mb) if self.threads == 1 else ParallelSearch(self.threads, self.hash_mb)
+
+    def _command_position(self, arguments : list) -> None:
+        self.wait()
+        if "moves" in arguments:
+            index = arguments.index("moves")
+            setup, moves = arguments[:index], arguments[index + 1:]
+        else:
+            setup, moves = arguments, []
+        if setup[:1] == ["startpos"]:
+            base = STARTING_FEN
+        elif setup[:1] == ["fen"]:
+            base = " ".join(setup[1:])
+        else:
+            raise ValueError("position needs startpos or fen")
+
+        # Match tools resend the whole game every move, only play what is new
+        if base == self._base and moves[:len(self._moves)] == self._moves:
+            new_moves = moves[len(self._moves):]
+        else:
+            board = self._start_board.copy() if base == STARTING_FEN else BitBoard.from_fen(base)
+            self.board = board
+            self._base = base
+            self._moves = []
+            new_moves = moves
+
+        for text in new_moves:
+            move = move_from_uci(text)
+            if move not in self.board.generate_moves():
+                raise ValueError(f"Illegal move {text}")
+            self.board.make_move(move)
+            self._moves.append(text)
+
+    def _command_go(self, arguments : list) -> None:
+        self.wait()
+        if arguments[:1] == ["perft"]:
+            return self._command_perft(arguments[1:])
+        options = {}
+        for name, value in zip(arguments, arguments[1:]):
+            if name in ("depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo"):
+                options[name] = int(value)
+        # A go with nothing to end it searches until stop, like go infinite
+        infinite = "infinite" in arguments or not options.keys() & {"depth", "nodes", "movetime", "wtime", "btime"}
+
+        book_move = self.book.choose(self.board) if self.book is not None and not infinite else None
+        if book_move is not None:
+            self.send("info string book move")
+            self.send(f"bestmove {move_to_uci(book_move)}")
+            return
+
+        limits = {"depth" : options.get("depth"), "nodes" : options.get("nodes"),
+                  "movetime" : None if infinite else move_time(options, self.board.turn)}
+        self._stop.clear()
+        self._infinite = infinite
+        self._search = threading.Thread(target = self._search_main, args = (self.board.copy(), limits, infinite), daemon = True)
+        self._search.start()
+
+    def _search_main(self, board : BitBoard, limits : dict, infinite : bool) -> None:
+        result = self.engine.search(board, on_iteration = self._report, should_stop = self._stop.is_set, **limits)
+        if infinite:
+            # bestmove only goes out once the GUI says stop
+            self._stop.wait()
+        if result.best_move is None:
+            self.send("bestmove 0000")
+        else:
+            ponder = f" ponder {move_to_uci(result.pv[1])}" if len(result.pv) > 1 else ""
+            self.send(f"bestmove {move_to_uci(result.best_move)}{ponder}")
+
+    def _report(self, result) -> None:
+        self.send(f"info depth {result.depth} score {score_text(result.score)} nodes {result.nodes} "
+                  f"nps {int(result.nps)} time {int(result.seconds * 1000)} pv {' '.join(map(move_to_uci, result.pv))}")
+
+    def _command_stop(self, arguments : list) -> None:
+        self.stop()
+
+    def stop(self) -> None:
+        "Ends any search, waiting until its bestmove has been sent"
+        if self._search is not None:
+            self._stop.set()
+            self._search.join()
+            self._search = None
+
+    def wait(self) -> None:
+        """Lets a search with limits run to the end before the next command,
+        so scripts can send commands without waiting for bestmove"""
+        if self._search is not None and not self._infinite:
+            self._search.join()
+        self.stop()
+
+    def _command_perft(self, arguments : list) -> None:
+        self.wait()
+        if not arguments or not arguments[0].isdigit():
+            raise ValueError("perft needs a depth")
+        depth = int(arguments[0])
+        start = time.perf_counter()
+        if depth < 1:
+            counts = {}
+            total = 1
+        else:
+            counts = divide(self.board, depth)
+            total = sum(counts.values())
+        for move, count in counts.items():
+            self.send(f"{move}: {count}")
+        seconds = time.perf_counter() - start
+        self.send(f"\nNodes searched: {total}")
+        self.send(f"info string perft {depth} {total} nodes {seconds:.3f}s")
+
+    def _command_d(self, arguments : list) -> None:
+        self.send(f"info string fen {self.board.fen()}")
+
+def main() -> None:
+    UCI().run()
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,6 @@
 from constants import *
 from collections import namedtuple
-import pygame
-from pygame.locals import *
-from window import *
-import logging
-
-logging.basicConfig(level = logging.DEBUG)
+from bitboard import iter_squares
 
 
 
@@ -37,39 +32,27 @@ class Position(namedtuple("Position", ["x", "y"])):
     def __rtruediv__(self, other):
         raise NotImplementedError()
 
-def direction_vector(point_a : Position, point_b : Position) -> Position:
-    "Returns the direction vector from point_a to point_b"
-    assert isinstance(point_a, Position), f"Vector is type {type(point_a)}, should be Position"
-    assert isinstance(point_b, Position), f"Vector is type {type(point_b)}, should be Position"
-    return point_b - point_a
+def position_to_square(position : Position) -> int:
+    "Converts board position into bitboard square index"
+    return int(position.y) * 8 + int(position.x)
+
+# One shared Position per square, so converting from square indices never allocates
+POSITIONS = tuple(Position(square & 7, square >> 3) for square in range(64))
 
-def chess_unit_direction_vector(point_a : Position, point_b : Position) -> Position:
-    "Returns a vector from point_a to point_b where the absolute value of the largest component is 1 e.g (8, 8) would become (1, 1)"
-    vector = direction_vector(point_a, point_b)
-    divisor = max([abs(x) for x in vector])
-    assert isinstance(vector, Position), f"Vector is type {type(vector)}, should be Position"
-    return vector / divisor
+def square_to_position(square : int) -> Position:
+    "Converts bitboard square index into board position"
+    return POSITIONS[square]
 
-def is_pinnable_vector(vector):
-    return vector in PINNABLE_VECTORS
+def bitboard_to_positions(bitboard : int) -> list:
+    return [POSITIONS[square] for square in iter_squares(bitboard)]
 
 def draw_position(square : Position):
     "Converts board position into drawn position, top left hand corner"
     return square.x * SQUARE_SIZE, (7 - square.y) * SQUARE_SIZE
 
-def get_rect_from_square(square : Position):
-    x, y = draw_position(square)
-    return pygame.Rect(x, y, SQUARE_SIZE, SQUARE_SIZE)
-
-def draw_board():
-    colours = [WHITE_SQUARE, BLACK_SQUARE]
-    index = -1
-    for x in range(0, 8 * SQUARE_SIZE, SQUARE_SIZE):
-        index += 1
-        for y in range(0, 8 * SQUARE_SIZE, SQUARE_SIZE):
-            rect = pygame.Rect(x, y, SQUARE_SIZE, SQUARE_SIZE)
-            pygame.draw.rect(window, colours[index % 2], rect)
-            index += 1
+def position_from_draw_position(x : int, y : int) -> Position:
+    "Converts a drawn (pixel) position into the board position under it, the inverse of draw_position"
+    return Position(int(x) // SQUARE_SIZE, 7 - int(y) // SQUARE_SIZE)
 
 class OutOfBounds(Exception):
 
@@ -80,42 +63,3 @@ class OutOfBounds(Exception):
         else:
             self.message = message
         super().__init__(self.message)
-
-en_passant_list = [] # Last element is the old position of the en_passant pawn
-attacking_king = {
-    "White" : set(),
-    "Black" : set()
-} # Pieces that are attacking enemy king
-valid_check_defenses = [] # Moves that save the king
-turn = "White"
-
-def turn_gen():
-    while True:
-        if turn == "White":
-            yield "Black"
-        yield "White"
-
-get_turn = turn_gen()
-
-PIECE_IMAGE = pygame.image.load(r"images\ChessPiecesArray.png")
-PIECE_IMAGE = pygame.Surface.convert_alpha(PIECE_IMAGE)
-
-piece_dict_keys = ["Black Queen", "Black King", "Black Rook", "Black Knight", "Black Bishop", "Black Pawn",
-"White Queen", "White King", "White Rook", "White Knight", "White Bishop", "White Pawn"]
-
-piece_images = dict()
-
-for i in range(6):
-    for j in range(2):
-
-        x = IMAGE_PIECE_WIDTH * i
-        y = IMAGE_PIECE_WIDTH * j
-
-        piece_img = pygame.Rect(x, y, IMAGE_PIECE_WIDTH, IMAGE_PIECE_WIDTH)
-        piece_img = PIECE_IMAGE.subsurface(piece_img)
-        piece_img = pygame.transform.scale(piece_img, (PIECE_SIZE, PIECE_SIZE))
-
-        piece_images[piece_dict_keys[i + (6 * j)]] = piece_img
-
-del piece_dict_keys
-del PIECE_IMAGE
\ No newline at end of file
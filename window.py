@@ -1,7 +1,137 @@
+import os
 import pygame
 from pygame.locals import *
 from constants import *
 
-pygame.init()
-window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-clock = pygame.time.Clock()
\ No newline at end of file
+# The display, clock and sprites are only created the first time the GUI asks for them,
+# so the rules (Position, Piece, ChessBoard, PieceManager) can be imported without a display
+_window = None
+_clock = None
+_piece_images = None
+_board_surface = None
+_stats_font = None
+
+IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images", "ChessPiecesArray.png")
+
+def get_window():
+    global _window
+    if _window is None:
+        pygame.init()
+        _window = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    return _window
+
+def get_clock():
+    global _clock
+    if _clock is None:
+        _clock = pygame.time.Clock()
+    return _clock
+
+def get_piece_images():
+    "Returns the piece sprites keyed by e.g. 'White Queen', loading them on first use"
+    global _piece_images
+    if _piece_images is not None:
+        return _piece_images
+
+    # convert_alpha needs a display mode to be set
+    get_window()
+    piece_image = pygame.image.load(IMAGE_PATH)
+    piece_image = pygame.Surface.convert_alpha(piece_image)
+
+    piece_dict_keys = ["Black Queen", "Black King", "Black Rook", "Black Knight", "Black Bishop", "Black Pawn",
+    "White Queen", "White King", "White Rook", "White Knight", "White Bishop", "White Pawn"]
+
+    piece_images = dict()
+
+    for i in range(6):
+        for j in range(2):
+
+            x = IMAGE_PIECE_WIDTH * i
+            y = IMAGE_PIECE_WIDTH * j
+
+            piece_img = pygame.Rect(x, y, IMAGE_PIECE_WIDTH, IMAGE_PIECE_WIDTH)
+            piece_img = piece_image.subsurface(piece_img)
+            piece_img = pygame.transform.scale(piece_img, (PIECE_SIZE, PIECE_SIZE))
+
+            piece_images[piece_dict_keys[i + (6 * j)]] = piece_img
+
+    _piece_images = piece_images
+    return _piece_images
+
+def get_rect_from_square(square):
+    x, y = square.x * SQUARE_SIZE, (7 - square.y) * SQUARE_SIZE
+    return pygame.Rect(x, y, SQUARE_SIZE, SQUARE_SIZE)
+
+def wait_for_events(timeout : float = None):
+    """Sleeps until at least one event arrives, or timeout seconds pass, and returns every pending event.
+    Waiting with no timeout uses no CPU at all while nothing happens"""
+    get_window()
+    if timeout is None:
+        event = pygame.event.wait()
+    else:
+        event = pygame.event.wait(int(timeout * 1000))
+    events = [] if event.type == NOEVENT else [event]
+    return events + pygame.event.get()
+
+def get_board_surface():
+    "The empty board, drawn once and copied from then on"
+    global _board_surface
+    if _board_surface is not None:
+        return _board_surface
+
+    _board_surface = pygame.Surface((8 * SQUARE_SIZE, 8 * SQUARE_SIZE))
+    colours = [WHITE_SQUARE, BLACK_SQUARE]
+    index = -1
+    for x in range(0, 8 * SQUARE_SIZE, SQUARE_SIZE):
+        index += 1
+        for y in range(0, 8 * SQUARE_SIZE, SQUARE_SIZE):
+            rect = pygame.Rect(x, y, SQUARE_SIZE, SQUARE_SIZE)
+            pygame.draw.rect(_board_surface, colours[index % 2], rect)
+            index += 1
+    return _board_surface
+
+def draw_board():
+    get_window().blit(get_board_surface(), (0, 0))
+
+def draw_square(square, highlight = None, image = None):
+    """Redraws a single square from the cached board, then its highlight
+    ("Selected", "Move", "Capture", "Book" or "Promotion") and the sprite named image on top.
+    Returns the rect drawn so only it needs updating on the display"""
+    window = get_window()
+    rect = get_rect_from_square(square)
+    window.blit(get_board_surface(), rect, rect)
+
+    radius = PIECE_SIZE / 2
+    if highlight == "Selected":
+        pygame.draw.rect(window, MOVE_COLOUR, rect, 0)
+    elif highlight == "Promotion":
+        pygame.draw.rect(window, PROMOTION_COLOUR, rect, 0)
+    elif highlight == "Move":
+        pygame.draw.circle(window, MOVE_COLOUR, rect.center, radius, 0)
+    elif highlight == "Capture":
+        pygame.draw.circle(window, CAPTURE_COLOUR, rect.center, radius, 0)
+    elif highlight == "Book":
+        pygame.draw.circle(window, BOOK_COLOUR, rect.center, radius, 0)
+
+    if image:
+        window.blit(get_piece_images()[image], rect.topleft)
+    return rect
+
+def draw_sprite(image, position):
+    "Draws the sprite named image with its top left corner at the pixel position, returns its rect"
+    sprite = get_piece_images()[image]
+    return get_window().blit(sprite, position)
+
+def draw_stats_overlay(lines : list):
+    "Draws instrumentation stats in the top left corner over whatever is there, returns the rect drawn"
+    global _stats_font
+    if _stats_font is None:
+        get_window()
+        _stats_font = pygame.font.Font(None, STATS_FONT_SIZE)
+    rendered = [_stats_font.render(line, True, STATS_TEXT_COLOUR) for line in lines or ["No stats yet"]]
+    line_height = _stats_font.get_linesize()
+    rect = pygame.Rect(0, 0, max(text.get_width() for text in rendered) + 8, line_height * len(rendered) + 8)
+    window = get_window()
+    window.fill(STATS_BACKGROUND, rect)
+    for index, text in enumerate(rendered):
+        window.blit(text, (4, 4 + index * line_height))
+    return rect
@@ -0,0 +1,122 @@
+"""Runs engine searches away from the render loop.
+
+The GUI hands a position to a SearchWorker and keeps drawing; every frame it
+calls poll() to see whether the answer has arrived. A search that is no longer
+wanted (the position changed, the game was reset) is cancelled and its result,
+if it still turns up, is thrown away.
+
+Searches run in a child process by default so they use a spare core and never
+compete with drawing for the GIL; a thread can be used instead where starting
+processes is not wanted. With more than one worker the search is a
+ParallelSearch, driven from a thread while its pool does the work.
+"""
+import multiprocessing
+import queue
+import threading
+from bitboard import BitBoard
+from engine import Engine
+from parallel import ParallelSearch
+
+
+def _process_main(requests, results, wanted, hash_mb):
+    "Search loop run in the child process"
+    engine = Engine(hash_mb)
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        request_id, board, limits = request
+        # Skip anything cancelled while it was still queued
+        if wanted.value != request_id:
+            continue
+        result = engine.search(board, should_stop = lambda: wanted.value != request_id, **limits)
+        results.put((request_id, result))
+
+
+class SearchWorker:
+
+    def __init__(self, hash_mb : float = 16, use_process : bool = True, workers : int = 1):
+        # A parallel search already has its own processes
+        use_process = use_process and workers <= 1
+        self.use_process = use_process
+        self.position_hash = None
+        self._request_id = 0
+        self._result = None
+
+        if use_process:
+            self._requests = multiprocessing.Queue()
+            self._results = multiprocessing.Queue()
+            # Id of the one search whose result is still wanted, 0 for none
+            self._wanted = multiprocessing.Value("i", 0, lock = False)
+            self._worker = multiprocessing.Process(target = _process_main, daemon = True,
+                                                   args = (self._requests, self._results, self._wanted, hash_mb))
+        else:
+            self._requests = queue.Queue()
+            self._results = queue.Queue()
+            self._wanted_id = 0
+            self._engine = Engine(hash_mb) if workers <= 1 else ParallelSearch(workers, hash_mb)
+            self._worker = threading.Thread(target = self._thread_main, daemon = True)
+        self._worker.start()
+
+    @property
+    def _wanted_value(self) -> int:
+        return self._wanted.value if self.use_process else self._wanted_id
+
+    def _set_wanted(self, request_id : int) -> None:
+        if self.use_process:
+            self._wanted.value = request_id
+        else:
+            self._wanted_id = request_id
+
+    def _thread_main(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            request_id, board, limits = request
+            if self._wanted_id != request_id:
+                continue
+            result = self._engine.search(board, should_stop = lambda: self._wanted_id != request_id, **limits)
+            self._results.put((request_id, result))
+
+    @property
+    def busy(self) -> bool:
+        "True while a wanted search has been started and its result not yet collected"
+        return self._wanted_value != 0
+
+    def start_search(self, board : BitBoard, **limits) -> int:
+        """Starts searching board in the background with Engine.search limits (depth, nodes, movetime),
+        cancelling any search already running. Returns the id of the request"""
+        self._request_id += 1
+        request_id = self._request_id
+        self._set_wanted(request_id)
+        self._result = None
+        self.position_hash = board.hash
+        # Copy so later moves on the caller's board can't reach the search
+        self._requests.put((request_id, board.copy(), limits))
+        return request_id
+
+    def poll(self):
+        "Returns the SearchResult of the current search once it is done, otherwise None, never blocks"
+        while True:
+            try:
+                request_id, result = self._results.get_nowait()
+            except queue.Empty:
+                return None
+            if request_id == self._wanted_value:
+                self._set_wanted(0)
+                self.position_hash = None
+                return result
+            # Result of a cancelled search, drop it
+
+    def cancel(self) -> None:
+        "Stops the current search, its result will never be returned by poll"
+        self._set_wanted(0)
+        self.position_hash = None
+
+    def close(self) -> None:
+        self.cancel()
+        self._requests.put(None)
+        self._worker.join(timeout = 1)
+        if not self.use_process and isinstance(self._engine, ParallelSearch):
+            self._engine.close()